@@ -0,0 +1,105 @@
+"""
+Benchmark dfa_utils.dfa on the bundled data/dfa files.
+
+For each file this times
+    - dfa_utils.dfa: the vectorised engine (closed-form segment residuals),
+    - reference: the previous implementation (np.polyfit / np.polyval per
+      segment), kept below for comparison, and
+    - nolds.dfa on the same scales (non-overlapping windows, linear
+      detrending, least-squares fit); its alpha is shown alongside.
+Longer series can be made by tiling the files with --repeat-data.
+
+Run from the repository root:
+    python benchmarks/bench_dfa.py
+    python benchmarks/bench_dfa.py --files hrv_data.txt postureA.txt --repeat-data 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import nolds
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import dfa_utils  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'dfa')
+DEFAULT_FILES = ['Gait1.txt', 'postureA.txt', 'AppleStockVol.txt', 'hrv_data.txt']
+
+
+def reference_dfa(data, min_window_size=8):
+    """The per-segment np.polyfit implementation that dfa_utils.dfa replaced."""
+    N = len(data)
+    data = np.cumsum(data - np.mean(data))
+    flucts = []
+    scales = np.unique(np.logspace(np.log10(min_window_size), np.log10(N // 4), num=16, dtype=int))
+    for scale in scales:
+        rms_vals = []
+        for i in range(0, N, scale):
+            if i + scale < N:
+                segment = data[i:i + scale]
+                trend = np.polyfit(np.arange(scale), segment, 1)
+                fit = np.polyval(trend, np.arange(scale))
+                rms_vals.append(np.sqrt(np.mean((segment - fit) ** 2)))
+        flucts.append(np.mean(rms_vals))
+    flucts = np.array(flucts)
+    coeffs = np.polyfit(np.log(scales), np.log(flucts), 1)
+    return coeffs[0], scales, flucts, np.polyval(coeffs, np.log(scales))
+
+
+def load_series(name, repeat_data):
+    """Load the first column of a data file as a z-scored series (None if unusable)."""
+    path = os.path.join(DATA_DIR, name)
+    try:
+        data = pd.read_csv(path, header=None, sep=r'[,\s]+', engine='python').apply(pd.to_numeric, errors='coerce')
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        return None
+    x = data.iloc[:, 0].dropna().values.astype(float)
+    if len(x) < 100:
+        return None
+    x = np.tile(x, repeat_data)
+    return (x - x.mean()) / x.std()
+
+
+def best_time(fn, repeat):
+    """Best wall time of repeat calls to fn."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs='+', default=DEFAULT_FILES)
+    parser.add_argument('--repeat-data', type=int, default=1, help='tile each series this many times')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.files:
+        x = load_series(name, args.repeat_data)
+        if x is None:
+            print(f"Skipping {name} (no usable data)")
+            continue
+        alpha, scales = dfa_utils.dfa(x)[:2]
+        alpha_ref = reference_dfa(x)[0]
+        alpha_nolds = nolds.dfa(x, nvals=scales, overlap=False, fit_exp='poly')
+        rows.append({
+            'file': name, 'n': len(x),
+            'dfa [s]': best_time(lambda: dfa_utils.dfa(x), args.repeat),
+            'reference [s]': best_time(lambda: reference_dfa(x), args.repeat),
+            'nolds [s]': best_time(lambda: nolds.dfa(x, nvals=scales, overlap=False, fit_exp='poly'), args.repeat),
+            'alpha': alpha, 'alpha - reference': alpha - alpha_ref, 'alpha nolds': alpha_nolds,
+        })
+
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark the distance kernels of rqa_utils_cpp on the bundled data/rqaContinuous files.
+
+For each file and distance norm (euclidean, max, manhattan) this times
+    - rqa_dist: the full n2 x n2 float distance matrix (scipy's cdist on the
+      same embedding is timed alongside as a reference), and
+    - rqa_stats_stream_sym: full auto-RQA, which computes the same distances
+      row by row without storing them.
+
+Run from the repository root:
+    python benchmarks/bench_distance_kernels.py
+    python benchmarks/bench_distance_kernels.py --files walkerAfriend.txt rx5000.txt --threads 0
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import rqa_utils_cpp  # noqa: E402
+from utils import rqa_sparse_utils  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'rqaContinuous')
+DEFAULT_FILES = ['sin.txt', 'lx2000.txt', 'circlexLW.txt', 'ecg5000.txt', 'rx5000.txt', 'walkerAfriend.txt']
+NORMS = {'euclidean': 'euclidean', 'max': 'chebyshev', 'manhattan': 'cityblock'}
+
+
+def load_series(name, max_len):
+    """Load the first column of a data file as a z-scored float32 series (None if unusable)."""
+    path = os.path.join(DATA_DIR, name)
+    try:
+        data = pd.read_csv(path, header=None, sep=r'[,\s]+', engine='python').apply(pd.to_numeric, errors='coerce')
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        return None
+    x = data.iloc[:max_len, 0].dropna().values
+    if len(x) < 100:
+        return None
+    return ((x - x.mean()) / x.std()).astype(np.float32)
+
+
+def best_time(fn, repeat):
+    """Best wall time of repeat calls to fn."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs='+', default=DEFAULT_FILES)
+    parser.add_argument('--max-len', type=int, default=5000, help='samples used from each file')
+    parser.add_argument('--dim', type=int, default=3)
+    parser.add_argument('--lag', type=int, default=4)
+    parser.add_argument('--radius', type=float, default=0.1)
+    parser.add_argument('--threads', type=int, default=1, help='n_threads (0 = all cores)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.files:
+        x = load_series(name, args.max_len)
+        if x is None:
+            print(f"Skipping {name} (no usable data)")
+            continue
+        emb = rqa_sparse_utils.embed_series(x, args.dim, args.lag)
+        for norm, metric in NORMS.items():
+            t_dist = best_time(lambda: rqa_utils_cpp.rqa_dist(x, x, args.dim, args.lag,
+                                                              n_threads=args.threads, norm=norm), args.repeat)
+            t_cdist = best_time(lambda: cdist(emb, emb, metric), args.repeat)
+            t_rqa = best_time(lambda: rqa_utils_cpp.rqa_stats_stream_sym(
+                x, args.dim, args.lag, rescale=1, rad=args.radius, diag_ignore=1, minl=2,
+                n_threads=args.threads, norm=norm), args.repeat)
+            n2 = len(emb)
+            rows.append({
+                'file': name, 'n': n2, 'norm': norm,
+                'rqa_dist [s]': t_dist, 'cdist [s]': t_cdist,
+                'Mdist/s': n2 * n2 / t_dist / 1e6,
+                'rqa_stats_stream_sym [s]': t_rqa,
+            })
+
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+
+if __name__ == '__main__':
+    main()
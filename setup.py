@@ -6,6 +6,9 @@ from setuptools.command.build_ext import build_ext
 from setuptools import setup, Extension, find_packages
 import pybind11
 
+# The RQA engine uses std::thread; MSVC links threads by default
+THREAD_ARGS = [] if sys.platform == "win32" else ["-pthread"]
+
 class BuildExt(build_ext):
     """Custom build command to check for C++ compiler before compiling"""
 
@@ -41,7 +44,8 @@ setup(
             sources=["utils/rqa_utils.cpp"],
             include_dirs=[pybind11.get_include()],
             language="c++",
-            extra_compile_args=["-std=c++14"],
+            extra_compile_args=["-std=c++14"] + THREAD_ARGS,
+            extra_link_args=THREAD_ARGS,
         ),
     ],
     cmdclass={"build_ext": BuildExt},
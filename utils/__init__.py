@@ -4,12 +4,14 @@ from .mdrqa_utils import *
 from .dfa_utils import *
 from .ami_utils import *
 from .fnn_utils import *
+from .embedding_utils import *
 from .corr_utils import *
 from .period_amplitude_utils import *
 from .coherence_utils import *
 from .relative_phase_utils import *
 from .output_io_utils  import *
 from .rqa_utils import *
+from .rqa_sparse_utils import *
 
 # utils/__init__.py
 
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 
 def ami(timeseries, min_lag, max_lag):
     # Ensure the input is a NumPy array
@@ -12,51 +12,16 @@ def ami(timeseries, min_lag, max_lag):
 
     x = timeseries
     length = len(x)
-
-    # Create Lag Vector
-    if max_lag <= (length // 2 - 1):
-        if min_lag < max_lag:
-            lag = np.arange(min_lag, max_lag + 1)
-        else:
-            print('error - maximum lag not greater than minimum lag')
-            print('default lag vector used (0 - 50)')
-            lag = np.arange(0, 51)
-    else:
-        print('error - maximum lag exceeds recommendation')
-        print('maximum lag set to n/2-1')
-        lag = np.arange(0, length // 2)
+    lag = lag_vector(min_lag, max_lag, length)
 
     # Normalize the data
     x = (x - np.min(x)) / (np.max(x) - np.min(x))
 
-    ami_values = np.zeros(len(lag))
-
     # Compute Average Mutual Information (AMI)
-    for i in tqdm(range(len(lag)), desc='Processing AMI'):
-        k = int(np.floor(1 + np.log2(length - lag[i]) + 0.5))
-
-        if np.var(x, ddof=1) == 0:
-            ami_values[i] = 0
-        else:
-            ami_sum = 0
-            for k1 in range(1, k + 1):
-                for k2 in range(1, k + 1):
-                    cond1 = (k1 - 1) / k < x[:length - lag[i]]
-                    cond2 = x[:length - lag[i]] <= k1 / k
-                    cond3 = (k2 - 1) / k < x[lag[i]:]
-                    cond4 = x[lag[i]:] <= k2 / k
-
-                    ppp = np.sum(cond1 & cond2 & cond3 & cond4)
-                    px1 = np.sum(cond1 & cond2)
-                    px2 = np.sum(cond3 & cond4)
-
-                    if ppp > 0:
-                        ppp = ppp / (length - lag[i])
-                        px1 = px1 / (length - lag[i])
-                        px2 = px2 / (length - lag[i])
-                        ami_sum += ppp * np.log2(ppp / (px1 * px2))
-
-            ami_values[i] = ami_sum
+    if np.var(x, ddof=1) == 0:
+        ami_values = np.zeros(len(lag))
+    else:
+        ami_values = lagged_mutual_information(x, x, lag)
 
     # Create the AMI result array
     ami_result = np.column_stack((lag, ami_values))
@@ -77,58 +42,158 @@ def cross_ami(timeseries1, timeseries2, min_lag, max_lag):
     x = timeseries1
     y = timeseries2
     length = min(len(x), len(y))
-
-    # Create Lag Vector
-    if max_lag <= (length // 2 - 1):
-        if min_lag < max_lag:
-            lag = np.arange(min_lag, max_lag + 1)
-        else:
-            print('error - maximum lag not greater than minimum lag')
-            print('default lag vector used (0 - 50)')
-            lag = np.arange(0, 51)
-    else:
-        print('error - maximum lag exceeds recommendation')
-        print('maximum lag set to n/2-1')
-        lag = np.arange(0, length // 2)
+    lag = lag_vector(min_lag, max_lag, length)
 
     # Normalize both data series
     x = (x - np.min(x)) / (np.max(x) - np.min(x))
     y = (y - np.min(y)) / (np.max(y) - np.min(y))
 
-    ami_values = np.zeros(len(lag))
-
     # Compute Cross Average Mutual Information (Cross-AMI)
-    for i in tqdm(range(len(lag)), desc='Processing Cross-AMI'):
-        k = int(np.floor(1 + np.log2(length - lag[i]) + 0.5))
-
-        if np.var(x, ddof=1) == 0 or np.var(y, ddof=1) == 0:
-            ami_values[i] = 0
-        else:
-            ami_sum = 0
-            for k1 in range(1, k + 1):
-                for k2 in range(1, k + 1):
-                    cond1 = (k1 - 1) / k < x[:length - lag[i]]
-                    cond2 = x[:length - lag[i]] <= k1 / k
-                    cond3 = (k2 - 1) / k < y[lag[i]:]
-                    cond4 = y[lag[i]:] <= k2 / k
-
-                    ppp = np.sum(cond1 & cond2 & cond3 & cond4)
-                    px1 = np.sum(cond1 & cond2)
-                    py2 = np.sum(cond3 & cond4)
-
-                    if ppp > 0:
-                        ppp = ppp / (length - lag[i])
-                        px1 = px1 / (length - lag[i])
-                        py2 = py2 / (length - lag[i])
-                        ami_sum += ppp * np.log2(ppp / (px1 * py2))
-
-            ami_values[i] = ami_sum
+    if np.var(x, ddof=1) == 0 or np.var(y, ddof=1) == 0:
+        ami_values = np.zeros(len(lag))
+    else:
+        ami_values = lagged_mutual_information(x[:length], y[:length], lag)
 
     # Create the Cross-AMI result array
     cross_ami_result = np.column_stack((lag, ami_values))
     
     return cross_ami_result
 
+def lag_vector(min_lag, max_lag, length):
+    """
+    Lags evaluated by ami and cross_ami (falls back to a default range,
+    with a printed message, for invalid lags).
+    """
+    if max_lag <= (length // 2 - 1):
+        if min_lag < max_lag:
+            return np.arange(min_lag, max_lag + 1)
+        print('error - maximum lag not greater than minimum lag')
+        print('default lag vector used (0 - 50)')
+        return np.arange(0, 51)
+    print('error - maximum lag exceeds recommendation')
+    print('maximum lag set to n/2-1')
+    return np.arange(0, length // 2)
+
+def bin_indices(x, k):
+    """
+    Index (0 .. k-1) of the bin ((b - 1) / k, b / k] holding each value of a
+    [0, 1] normalised series; -1 for values in no bin (the minimum, NaN).
+    """
+    edges = np.arange(k + 1) / k
+    idx = np.searchsorted(edges, x, side='left') - 1
+    idx[idx >= k] = -1
+    return idx
+
+def lagged_mutual_information(x, y, lag):
+    """
+    Mutual information (bits) between x[t] and y[t + lag] for every lag, from
+    k x k joint histograms with k = floor(1.5 + log2(n - lag)) equal bins on [0, 1].
+
+    Each series is digitised once per bin count and every lag's joint
+    histogram is a single np.bincount, so the cost is O(n) per lag.
+
+    Parameters:
+        x (np.ndarray): Series normalised to [0, 1].
+        y (np.ndarray): Series normalised to [0, 1], same length as x.
+        lag (np.ndarray): Lags.
+
+    Returns:
+        np.ndarray: Mutual information per lag.
+    """
+    bx = digitize_levels(x, lag)
+    by = bx if y is x else digitize_levels(y, lag)
+    return binned_mutual_information(bx, by, lag)
+
+def lag_bin_count(n):
+    """
+    Number of bins used for n lagged pairs.
+    """
+    return int(np.floor(1 + np.log2(n) + 0.5))
+
+def digitize_levels(x, lag):
+    """
+    bin_indices of a series for every bin count needed by the lags.
+
+    Returns:
+        dict: {k: np.ndarray of bin indices}.
+    """
+    return {k: bin_indices(x, k) for k in {lag_bin_count(len(x) - L) for L in lag}}
+
+def binned_mutual_information(bx, by, lag):
+    """
+    lagged_mutual_information on series already digitised by digitize_levels.
+    """
+    length = len(next(iter(bx.values())))
+    values = np.zeros(len(lag))
+    for i, L in enumerate(lag):
+        n = length - L
+        k = lag_bin_count(n)
+        a = bx[k][:n]
+        b = by[k][L:]
+
+        # Marginals count every sample in a bin; the joint needs both
+        px = np.bincount(a[a >= 0], minlength=k) / n
+        py = np.bincount(b[b >= 0], minlength=k) / n
+        both = (a >= 0) & (b >= 0)
+        pxy = np.bincount(a[both] * k + b[both], minlength=k * k).reshape(k, k) / n
+
+        nz = pxy > 0
+        values[i] = np.sum(pxy[nz] * np.log2(pxy[nz] / np.outer(px, py)[nz]))
+    return values
+
+def cross_ami_matrix(data, min_lag, max_lag, n_workers=None):
+    """
+    Cross-AMI of every ordered pair of channels over a range of lags.
+
+    Every channel is normalised and digitised once; the pairs are then
+    computed in a pool of worker processes (one job per first channel).
+    Entry (x, y) at lag L is cross_ami(data[x], data[y]) at L, so the
+    diagonal holds the AMI of each channel.
+
+    Parameters:
+        data (pd.DataFrame or np.ndarray): (n, channels) data.
+        min_lag (int): Minimum lag.
+        max_lag (int): Maximum lag (see ami for the lag vector rules).
+        n_workers (int): Maximum number of worker processes (None uses all
+            available cores, 1 runs in the calling process).
+
+    Returns:
+        pd.DataFrame: Cross-AMI with a (x, y) MultiIndex of channel pairs and
+            one column per lag (e.g. result.loc[('a', 'b')] is the cross-AMI
+            curve of a and b, and result.idxmax(axis=1) the lag of its maximum).
+    """
+    labels = list(data.columns) if isinstance(data, pd.DataFrame) else list(range(np.shape(data)[1]))
+    values = np.asarray(data, dtype=float)
+    lag = lag_vector(min_lag, max_lag, len(values))
+
+    # Normalize and digitise every channel once (constant channels give zeros)
+    bins = []
+    for c in range(values.shape[1]):
+        x = values[:, c]
+        x = (x - np.min(x)) / (np.max(x) - np.min(x))
+        bins.append(None if np.var(x, ddof=1) == 0 else digitize_levels(x, lag))
+
+    jobs = [(bins[c], bins, lag) for c in range(len(bins))]
+    if n_workers == 1 or len(jobs) <= 1:
+        rows = [cross_ami_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            rows = list(pool.map(cross_ami_job, jobs))
+
+    index = pd.MultiIndex.from_product([labels, labels], names=['x', 'y'])
+    return pd.DataFrame(np.vstack(rows), index=index, columns=pd.Index(lag, name='lag'))
+
+def cross_ami_job(job):
+    """
+    Worker of cross_ami_matrix: cross-AMI of one channel with every channel.
+
+    Returns:
+        np.ndarray: (channels, lags) array.
+    """
+    bx, bins, lag = job
+    return np.array([np.zeros(len(lag)) if bx is None or by is None else binned_mutual_information(bx, by, lag)
+                     for by in bins])
+
 def plot_ami(ami_result, save_image, file_path):
     # Plot AMI Function
     plt.figure()
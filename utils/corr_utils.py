@@ -1,69 +1,119 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from scipy import fft as sp_fft
+
+# Largest number of lags computed directly (one dot product per lag); more lags use the FFT
+DIRECT_MAX_LAGS = 32
 
 # Function to compute autocorrelation
-def auto_correlation(timeseries, max_lag):
+def auto_correlation(timeseries, max_lag, method="auto"):
     """
     Computes the autocorrelation of a time series for lags from 0 to max_lag.
     
     Args:
-        timeseries (array-like): The time series data.
+        timeseries (array-like): The time series data. A 2-D array or a
+            DataFrame with several columns is treated as one series per
+            column, all correlated in one batched transform.
         max_lag (int): The maximum lag to compute autocorrelation for.
+        method (str): "fft" (zero-padded real FFT), "direct" (one dot product
+            per lag) or "auto" (direct for at most DIRECT_MAX_LAGS lags).
     
     Returns:
         lags (ndarray): Array of lags from 0 to max_lag.
-        autocorr (ndarray): Autocorrelation values for each lag.
+        autocorr (ndarray): Autocorrelation values for each lag (one column per series for 2-D input).
     """
-    # Ensure the input is a NumPy array
-    if isinstance(timeseries, (pd.Series, pd.DataFrame)):
-        timeseries = timeseries.values.flatten()  # Convert to 1D NumPy array if it's a Series or DataFrame
-    elif not isinstance(timeseries, np.ndarray):
-        raise ValueError("Input timeseries must be a NumPy array or Pandas Series/DataFrame")
-    
-    timeseries = np.array(timeseries)
-    mean = np.mean(timeseries)
-    var = np.var(timeseries)
+    timeseries, squeeze = as_channels(timeseries, "Input timeseries must be a NumPy array or Pandas Series/DataFrame")
+    n = len(timeseries)
+    centred = timeseries - np.mean(timeseries, axis=0)
     lags = np.arange(0, max_lag + 1)
-    autocorr = np.correlate(timeseries - mean, timeseries - mean, mode='full')[len(timeseries)-1:] / (len(timeseries) * var)
+    autocorr = lagged_products(centred, centred, lags[lags < n], method) / (n * np.var(timeseries, axis=0))
     
-    return lags, autocorr[:max_lag + 1]
+    return lags, autocorr[:, 0] if squeeze else autocorr
 
 # Function to compute cross-correlation
-def cross_correlation(timeseries1, timeseries2, max_lag):
+def cross_correlation(timeseries1, timeseries2, max_lag, method="auto"):
     """
     Computes the cross-correlation between two time series for lags from -max_lag to +max_lag.
     
     Args:
         timeseries1 (array-like): The first time series data.
-        timeseries2 (array-like): The second time series data.
+        timeseries2 (array-like): The second time series data. 2-D arrays
+            (or DataFrames with several columns) are correlated column by
+            column; a single series is correlated with every column of the other.
         max_lag (int): The maximum lag to compute cross-correlation for.
+        method (str): "fft", "direct" or "auto" (see auto_correlation).
     
     Returns:
         lags (ndarray): Array of lags from -max_lag to max_lag.
-        crosscorr (ndarray): Cross-correlation values for each lag.
+        crosscorr (ndarray): Cross-correlation values for each lag (one column per pair for 2-D input).
     """
-    # Ensure the inputs are NumPy arrays
-    if isinstance(timeseries1, (pd.Series, pd.DataFrame)):
-        timeseries1 = timeseries1.values.flatten()
-    if isinstance(timeseries2, (pd.Series, pd.DataFrame)):
-        timeseries2 = timeseries2.values.flatten()
+    message = "Both input timeseries must be NumPy arrays or Pandas Series/DataFrame"
+    timeseries1, squeeze1 = as_channels(timeseries1, message)
+    timeseries2, squeeze2 = as_channels(timeseries2, message)
+    centred1 = timeseries1 - np.mean(timeseries1, axis=0)
+    centred2 = timeseries2 - np.mean(timeseries2, axis=0)
+    scale = np.sqrt(np.var(timeseries1, axis=0) * np.var(timeseries2, axis=0)) * len(timeseries1)
+    
+    # Lag 0 sits in the middle of the np.correlate(mode='full') output
+    lags = np.arange(-max_lag, max_lag + 1)
+    mid = (len(timeseries1) + len(timeseries2) - 1) // 2 - (len(timeseries2) - 1)
+    crosscorr = lagged_products(centred1, centred2, lags + mid, method) / scale
+    
+    return lags, crosscorr[:, 0] if squeeze1 and squeeze2 else crosscorr
 
-    elif not isinstance(timeseries1, np.ndarray) or not isinstance(timeseries2, np.ndarray):
-        raise ValueError("Both input timeseries must be NumPy arrays or Pandas Series/DataFrame")
+def as_channels(timeseries, message):
+    """
+    Convert a series to a (samples, channels) float array.
     
-    timeseries1 = np.array(timeseries1)
-    timeseries2 = np.array(timeseries2)
-    mean1 = np.mean(timeseries1)
-    mean2 = np.mean(timeseries2)
-    var1 = np.var(timeseries1)
-    var2 = np.var(timeseries2)
+    Returns:
+        ndarray: (samples, channels) array.
+        bool: Whether the input was a single series.
+    """
+    if isinstance(timeseries, pd.DataFrame) and timeseries.shape[1] > 1:
+        return np.asarray(timeseries.values, dtype=float), False
+    if isinstance(timeseries, (pd.Series, pd.DataFrame)):
+        timeseries = timeseries.values.flatten()  # Convert to 1D NumPy array if it's a Series or DataFrame
+    elif not isinstance(timeseries, np.ndarray):
+        raise ValueError(message)
     
-    crosscorr_full = np.correlate(timeseries1 - mean1, timeseries2 - mean2, mode='full') / (np.sqrt(var1 * var2) * len(timeseries1))
-    lags = np.arange(-max_lag, max_lag + 1)
-    mid = len(crosscorr_full) // 2
+    timeseries = np.asarray(timeseries, dtype=float)
+    if timeseries.ndim == 1:
+        return timeseries[:, None], True
+    return timeseries, False
+
+def lagged_products(a, v, lags, method="auto"):
+    """
+    Sum of a[n + m] * v[n] over n for each lag m (the np.correlate convention), per column.
+    
+    Args:
+        a, v (ndarray): (samples, channels) arrays (the channels broadcast).
+        lags (ndarray): Lags m (zero outside -(len(v) - 1) .. len(a) - 1).
+        method (str): "fft", "direct" or "auto".
+    
+    Returns:
+        ndarray: (len(lags), channels) array.
+    """
+    lags = np.asarray(lags)
+    if method == "auto":
+        method = "direct" if len(lags) <= DIRECT_MAX_LAGS else "fft"
+    if method not in ("fft", "direct"):
+        raise ValueError("method must be 'auto', 'fft' or 'direct'.")
+    
+    # Lags without any overlap are zero
+    products = np.zeros((len(lags), np.broadcast_shapes(a.shape[1:], v.shape[1:])[0]))
+    valid = (lags > -len(v)) & (lags < len(a))
+    if method == "direct":
+        for i in np.flatnonzero(valid):
+            m = lags[i]
+            products[i] = np.sum(a[max(m, 0):len(v) + m] * v[max(-m, 0):len(a) - m], axis=0)
+        return products
     
-    return lags, crosscorr_full[mid - max_lag: mid + max_lag + 1]
+    # Zero-padded to the full correlation length, so the circular products equal the linear ones
+    nfft = sp_fft.next_fast_len(len(a) + len(v) - 1, real=True)
+    full = sp_fft.irfft(sp_fft.rfft(a, nfft, axis=0) * np.conj(sp_fft.rfft(v, nfft, axis=0)), nfft, axis=0)
+    products[valid] = full[lags[valid] % nfft]
+    return products
 
 # Function to plot autocorrelation
 def plot_autocorrelation(lags, autocorr):
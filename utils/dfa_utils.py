@@ -1,5 +1,8 @@
 import numpy as np
+import pandas as pd
 import nolds
+from concurrent.futures import ProcessPoolExecutor
+import os
 
 # Function to perform DFA on a single column of data
 def perform_nolds_dfa(data):
@@ -12,37 +15,271 @@ def perform_nolds_dfa(data):
         return float('nan')  # Return NaN if DFA fails
 
 # Custom DFA function
-def dfa(data, min_window_size=8):
+def dfa(data, min_window_size=8, order=1):
+    """
+    Detrended Fluctuation Analysis.
+
+    Each scale is reshaped into a (segments, scale) matrix and the residuals
+    of the per-segment polynomial trends are computed in closed form, so no
+    per-segment fit is needed.
+
+    Parameters:
+        data (array-like): One-dimensional time series.
+        min_window_size (int): Smallest scale.
+        order (int): Order of the detrending polynomial (1 = linear).
+
+    Returns:
+        float: alpha, the slope of log(flucts) against log(scales).
+        np.ndarray: Scales (16 log-spaced integers from min_window_size to N // 4, duplicates removed).
+        np.ndarray: Mean RMS fluctuation at each scale.
+        np.ndarray: Fitted line of log(flucts) at each scale.
+    """
+    data = np.asarray(data, dtype=float)
     N = len(data)
-    data = np.cumsum(data - np.mean(data))    #integrate data
-    flucts = []
+    profile = np.cumsum(data - np.mean(data))    #integrate data
     scales = np.logspace(np.log10(min_window_size), np.log10(N//4), num=16, dtype=int)
     scales = np.unique(scales)  # Remove duplicate scales
-    for scale in scales:
-        rms_vals = []
-        for i in range(0, N, scale):
-            if i + scale < N:
-                segment = data[i:i+scale]
-                trend = np.polyfit(np.arange(scale), segment, 1)
-                fit = np.polyval(trend, np.arange(scale))
-                rms = np.sqrt(np.mean((segment - fit) ** 2))
-                rms_vals.append(rms)
-        flucts.append(np.mean(rms_vals))
-    flucts = np.array(flucts)
-    scales = np.array(scales)
+    flucts = scale_flucts(profile, scales, order)
     coeffs = np.polyfit(np.log(scales), np.log(flucts), 1)
     alpha = coeffs[0]
     fit_line = np.polyval(coeffs, np.log(scales))
     return alpha, scales, flucts, fit_line
 
+def scale_flucts(profile, scales, order=1):
+    """
+    Mean RMS fluctuation at each scale, over the segments [i, i + scale)
+    with i + scale < N.
+
+    Parameters:
+        profile (np.ndarray): Integrated series, (N,) or (columns, N).
+        scales (array-like): Scales.
+        order (int): Order of the detrending polynomial.
+
+    Returns:
+        np.ndarray: (scales,) or (scales, columns) array.
+    """
+    N = profile.shape[-1]
+    return np.array([np.mean(np.sqrt(segment_rss(profile, scale, order)[..., :(N - 1) // scale] / scale), axis=-1)
+                     for scale in scales])
+
+def trend_basis(scale, order=1):
+    """
+    Orthonormal (scale, order) basis of the polynomial trends of degree 1..order
+    on a segment, orthogonal to the constant.
+    """
+    t = np.arange(scale) - (scale - 1) / 2
+    q = np.linalg.qr(np.vander(t, order + 1, increasing=True))[0]
+    return q[:, 1:]
+
+def segment_rss(profile, scale, order=1, starts=None):
+    """
+    Residual sum of squares of an order-`order` polynomial fit to segments
+    of length scale of the profile.
+
+    The segments are centred and the residual is the centred sum of squares
+    minus the squared projections onto trend_basis, which equals the
+    residual of np.polyfit on each segment.
+
+    Parameters:
+        profile (np.ndarray): Integrated series, (N,) or (columns, N).
+        scale (int): Segment length.
+        order (int): Order of the detrending polynomial.
+        starts (array-like): Start index of every segment (default: all
+            complete consecutive segments from index 0).
+
+    Returns:
+        np.ndarray: One value per segment (and column).
+    """
+    if starts is None:
+        n_seg = profile.shape[-1] // scale
+        segments = profile[..., :n_seg * scale].reshape(profile.shape[:-1] + (n_seg, scale))
+    else:
+        segments = profile[..., np.asarray(starts)[:, None] + np.arange(scale)]
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+    proj = segments @ trend_basis(scale, order)
+    rss = np.einsum('...ij,...ij->...i', segments, segments) - np.einsum('...ij,...ij->...i', proj, proj)
+    return np.maximum(rss, 0.0)
+
+def windowed_dfa(series, window, step=None, min_window_size=8, order=1, n_workers=1):
+    """
+    DFA of every window of a series in one vectorised pass.
+
+    Gives the same results as running perform_dfa_for_plotting on each
+    window (windows are z-scored with the sample std). Polynomial detrending
+    removes the offset and slope that windowing and z-scoring add to the
+    profile, so the profile of the whole series is computed once and each
+    window's fluctuations are those of its segments divided by the window's
+    std. Segments at the same position in overlapping windows are shared.
+
+    Parameters:
+        series (array-like): One-dimensional time series.
+        window (int): Window length in samples.
+        step (int): Number of samples between window starts (defaults to window).
+        min_window_size (int): Smallest scale.
+        order (int): Order of the detrending polynomial (1 = linear).
+        n_workers (int): Number of worker processes; the windows are split
+            into contiguous groups (None uses all available cores, 1 runs in
+            the calling process).
+
+    Returns:
+        pd.DataFrame: One row per window (window, start, end, alpha, intercept
+            of the fit line and the fluctuation at each scale as fluct_<scale>).
+    """
+    x = np.asarray(series, dtype=float).ravel()
+    step = step or window
+    starts = np.arange(0, len(x) - window + 1, step)
+    if len(starts) == 0:
+        raise ValueError("The series is shorter than the window.")
+    scales = np.unique(np.logspace(np.log10(min_window_size), np.log10(window//4), num=16, dtype=int))
+
+    groups = [g for g in np.array_split(starts, min(len(starts), n_workers or os.cpu_count())) if len(g)]
+    if len(groups) == 1:
+        flucts = window_flucts(x, starts, window, scales, order)
+    else:
+        jobs = [(x[g[0]:g[-1] + window], g - g[0], window, scales, order) for g in groups]
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            flucts = np.vstack(list(pool.map(window_flucts_job, jobs)))
+
+    coeffs = np.polyfit(np.log(scales), np.log(flucts).T, 1)
+    table = pd.DataFrame({'window': np.arange(len(starts)), 'start': starts, 'end': starts + window,
+                          'alpha': coeffs[0], 'intercept': coeffs[1]})
+    for k, scale in enumerate(scales):
+        table[f'fluct_{scale}'] = flucts[:, k]
+    return table
+
+def window_flucts(x, starts, window, scales, order=1):
+    """
+    Mean RMS fluctuation of every window at every scale (see windowed_dfa).
+
+    Returns:
+        np.ndarray: (windows, scales) array.
+    """
+    profile = np.cumsum(x - np.mean(x))
+    sd = np.array([np.std(x[s:s + window], ddof=1) for s in starts])
+    flucts = np.empty((len(starts), len(scales)))
+    for k, scale in enumerate(scales):
+        # Segments [i, i + scale) of each window with i + scale < window
+        n_seg = (window - 1) // scale
+        seg_starts = (starts[:, None] + scale * np.arange(n_seg)).ravel()
+        unique, inverse = np.unique(seg_starts, return_inverse=True)
+        rms = np.sqrt(segment_rss(profile, scale, order, unique) / scale)[inverse]
+        flucts[:, k] = rms.reshape(len(starts), n_seg).mean(axis=1) / sd
+    return flucts
+
+def window_flucts_job(job):
+    """
+    Worker of windowed_dfa: window_flucts on one group of windows.
+    """
+    return window_flucts(*job)
+
 def perform_dfa_for_plotting(data, min_window_size=8):
     column = data.columns[0]
-    data[column] = (data[column] - data[column].mean()) / data[column].std()
-    alpha, scales, flucts, fit_line = dfa(data[column], min_window_size)
+    series = (data[column] - data[column].mean()) / data[column].std()
+    alpha, scales, flucts, fit_line = dfa(series, min_window_size)
     return {column: {'alpha': alpha, 'scales': scales, 'flucts': flucts, 'fit_line': fit_line}}
 
 def perform_dfa(data, min_window_size=8):
     column = data.columns[0]
-    data[column] = (data[column] - data[column].mean()) / data[column].std()
-    alpha, scales, flucts, fit_line = dfa(data[column], min_window_size)
-    return {column: alpha}  # Only store alpha for simplicity
\ No newline at end of file
+    series = (data[column] - data[column].mean()) / data[column].std()
+    alpha, scales, flucts, fit_line = dfa(series, min_window_size)
+    return {column: alpha}  # Only store alpha for simplicity
+
+def dfa_alphas(data, min_window_size=8, order=1):
+    """
+    DFA alpha of every column of a 2-D array or DataFrame, without modifying it.
+
+    Each column is z-scored (sample std) as in perform_dfa. Columns without
+    missing values are analysed together in one vectorised pass; columns
+    with NaNs (e.g. a shorter participant padded with NaN) are analysed
+    separately after dropping them.
+
+    Parameters:
+        data (np.ndarray or pd.DataFrame): (n, columns) data (a 1-D array is one column).
+        min_window_size (int): Smallest scale.
+        order (int): Order of the detrending polynomial (1 = linear).
+
+    Returns:
+        pd.Series or np.ndarray: alpha per column (a Series indexed by the
+            columns for DataFrame input).
+    """
+    values = np.asarray(data, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    alphas = np.full(values.shape[1], np.nan)
+
+    complete = ~np.isnan(values).any(axis=0)
+    if complete.any():
+        x = values[:, complete]
+        x = (x - x.mean(axis=0)) / x.std(axis=0, ddof=1)
+        N = len(x)
+        profile = np.cumsum(x - x.mean(axis=0), axis=0).T    #integrate data
+        scales = np.unique(np.logspace(np.log10(min_window_size), np.log10(N//4), num=16, dtype=int))
+        flucts = scale_flucts(profile, scales, order)
+        alphas[complete] = np.polyfit(np.log(scales), np.log(flucts), 1)[0]
+    for c in np.flatnonzero(~complete):
+        x = values[~np.isnan(values[:, c]), c]
+        if len(x) // 4 >= min_window_size:
+            alphas[c] = dfa((x - x.mean()) / x.std(ddof=1), min_window_size, order)[0]
+
+    if isinstance(data, pd.DataFrame):
+        return pd.Series(alphas, index=data.columns, name='alpha')
+    return alphas
+
+def perform_dfa_batch(sources, pairs=None, conds=None, min_window_size=8, order=1, n_workers=None,
+                      read_kwargs=None):
+    """
+    DFA alpha of every participant (column) of many recordings in a pool of worker processes.
+
+    Produces the pair / cond / alpha_p1 / alpha_p2 table used in complexityMatching.
+
+    Parameters:
+        sources (list): 2-D arrays, pd.DataFrame objects and/or paths of files
+            readable by pd.read_csv (header=None and whitespace or comma
+            separated by default), one column per participant.
+        pairs (list): Pair label of each source (defaults to 1, 2, ...).
+        conds (list): Condition label of each source (column left out if None).
+        min_window_size (int): Smallest scale.
+        order (int): Order of the detrending polynomial (1 = linear).
+        n_workers (int): Maximum number of worker processes (None uses all
+            available cores, 1 runs in the calling process).
+        read_kwargs (dict): Extra keyword arguments for pd.read_csv.
+
+    Returns:
+        pd.DataFrame: One row per source (file, pair, cond, alpha_p1, alpha_p2,
+            ... and error). Sources that cannot be read have an error message
+            and NaN alphas.
+    """
+    pairs = list(pairs) if pairs is not None else list(range(1, len(sources) + 1))
+    jobs = [(source, min_window_size, order, read_kwargs) for source in sources]
+    if n_workers == 1 or len(jobs) <= 1:
+        rows = [dfa_batch_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            rows = list(pool.map(dfa_batch_job, jobs))
+
+    table = pd.DataFrame(rows)
+    table.insert(0, 'pair', pairs)
+    if conds is not None:
+        table.insert(1, 'cond', list(conds))
+    table.insert(0, 'file', [os.path.basename(os.fspath(s)) if isinstance(s, (str, os.PathLike)) else f"frame_{k}"
+                             for k, s in enumerate(sources)])
+    if 'error' not in table:
+        table['error'] = None
+    return table[[c for c in table.columns if c != 'error'] + ['error']]
+
+def dfa_batch_job(job):
+    """
+    Worker of perform_dfa_batch: alphas of the columns of one source.
+
+    Returns:
+        dict: alpha_p1, alpha_p2, ... (or an error message).
+    """
+    source, min_window_size, order, read_kwargs = job
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            kwargs = {'header': None, 'sep': r'[,\s]+', 'engine': 'python', **(read_kwargs or {})}
+            source = pd.read_csv(source, **kwargs)
+        alphas = dfa_alphas(source, min_window_size, order)
+    except (OSError, ValueError, pd.errors.ParserError) as e:
+        return {'error': str(e)}
+    return {**{f'alpha_p{k + 1}': alpha for k, alpha in enumerate(np.asarray(alphas))}, 'error': None}
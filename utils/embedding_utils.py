@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils import ami_utils, fnn_utils
+
+# Default directory of the estimate_embedding cache (relative to the working directory)
+DEFAULT_CACHE_DIR = os.path.join('cache', 'embedding')
+
+# Bump when the estimation rules change, so older cache entries are not reused
+CACHE_VERSION = 1
+
+
+def estimate_embedding(series, max_lag=50, max_dim=10, fnn_threshold=1.0, tlag=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Estimate the time lag and embedding dimension of a series.
+
+    tLag is the first local minimum of the AMI (ami_utils.ami over lags
+    0..max_lag); if the AMI has none, the lag at which it levels out (drops
+    by less than 1% of its value at lag 0). eDim is the first dimension whose
+    %FNN (fnn_utils.fnn with that lag) is at most fnn_threshold; if none is,
+    the dimension at which %FNN levels out (drops by less than fnn_threshold
+    percentage points), else max_dim.
+
+    Results are cached on disk as JSON, keyed by a hash of the data and the
+    settings, so repeated calls on the same series skip the computation.
+
+    Parameters:
+        series (array-like): One-dimensional time series.
+        max_lag (int): Largest lag of the AMI.
+        max_dim (int): Largest embedding dimension of the FNN analysis.
+        fnn_threshold (float): %FNN regarded as zero.
+        tlag (int): Fixed time lag (the AMI is then skipped).
+        cache_dir (str): Cache directory (None disables caching).
+
+    Returns:
+        dict: eDim, tLag and the diagnostics: ami ((lags, 2) array of lag and
+            AMI, or None with a fixed tlag), fnn ((dims, 2) array of dimension
+            and %FNN) and cached (whether the result came from the cache).
+    """
+    x = np.asarray(series, dtype=float).ravel()
+    # Plain Python numbers, so numpy scalars hash and serialise like ints / floats
+    max_lag, max_dim, fnn_threshold = int(max_lag), int(max_dim), float(fnn_threshold)
+    tlag = None if tlag is None else int(tlag)
+    settings = {'max_lag': max_lag, 'max_dim': max_dim, 'fnn_threshold': fnn_threshold, 'tlag': tlag,
+                'version': CACHE_VERSION}
+    path = None
+    if cache_dir is not None:
+        key = hashlib.sha256(np.ascontiguousarray(x).tobytes() + json.dumps(settings, sort_keys=True).encode())
+        path = os.path.join(cache_dir, f"{key.hexdigest()}.json")
+        if os.path.exists(path):
+            # A truncated or unreadable entry is a miss (it is rewritten below)
+            try:
+                with open(path) as f:
+                    cached = json.load(f)
+                return {'eDim': cached['eDim'], 'tLag': cached['tLag'],
+                        'ami': None if cached['ami'] is None else np.array(cached['ami']),
+                        'fnn': np.array(cached['fnn']), 'cached': True}
+            except (ValueError, KeyError, OSError):
+                pass
+
+    ami_result = None
+    if tlag is None:
+        ami_result = ami_utils.ami(x, 0, max_lag)
+        tlag = int(first_minimum(ami_result[:, 0], ami_result[:, 1], 0.01 * ami_result[0, 1]))
+    de, percent = fnn_utils.fnn(x, tlag, 1, max_dim)
+    edim = first_below(de, percent, fnn_threshold)
+
+    result = {'eDim': int(edim), 'tLag': int(tlag), 'ami': ami_result, 'fnn': np.column_stack((de, percent))}
+    if path is not None:
+        # Written to a temporary file and renamed, so concurrent or interrupted writers never leave a partial entry
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({**result, 'ami': None if ami_result is None else ami_result.tolist(),
+                           'fnn': result['fnn'].tolist(), 'settings': settings}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return {**result, 'cached': False}
+
+
+def first_minimum(lags, values, flat_tol):
+    """
+    First local minimum of values (ignoring lag 0), or the first lag after
+    which values drop by less than flat_tol, or the last lag.
+    """
+    for i in range(1, len(values) - 1):
+        if lags[i] > 0 and values[i] < values[i - 1] and values[i] <= values[i + 1]:
+            return lags[i]
+    for i in range(1, len(values) - 1):
+        if lags[i] > 0 and values[i] - values[i + 1] < flat_tol:
+            return lags[i]
+    return lags[-1]
+
+
+def first_below(dims, percent, threshold):
+    """
+    First dimension with percent <= threshold, or the first after which
+    percent drops by less than threshold, or the last dimension.
+    """
+    below = np.flatnonzero(percent <= threshold)
+    if len(below):
+        return dims[below[0]]
+    flat = np.flatnonzero(percent[:-1] - percent[1:] < threshold)
+    if len(flat):
+        return dims[flat[0]]
+    return dims[-1]
+
+
+def resolve_embedding(data, params):
+    """
+    Fill in params['eDim'] / params['tLag'] set to 'auto' with estimate_embedding.
+
+    Every column of data is estimated separately and the largest lag and
+    dimension are used. The estimation settings can be given as
+    params['maxLag'], params['maxDim'], params['fnnThreshold'] and
+    params['embedCache'] (cache directory, None disables caching).
+
+    Parameters:
+        data (pd.DataFrame or array-like): Data as passed to perform_rqa or perform_crqa.
+        params (dict): Dictionary of RQA parameters.
+
+    Returns:
+        dict: params, or a copy with numeric eDim and tLag.
+    """
+    auto_dim = params.get('eDim') == 'auto'
+    auto_lag = params.get('tLag') == 'auto'
+    if not (auto_dim or auto_lag):
+        return params
+    if params.get('categorical'):
+        raise ValueError("eDim / tLag 'auto' is not supported for categorical RQA.")
+
+    frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(np.asarray(data))
+    estimates = [estimate_embedding(frame.iloc[:, c].dropna().values,
+                                    max_lag=params.get('maxLag', 50), max_dim=params.get('maxDim', 10),
+                                    fnn_threshold=params.get('fnnThreshold', 1.0),
+                                    tlag=None if auto_lag else params['tLag'],
+                                    cache_dir=params.get('embedCache', DEFAULT_CACHE_DIR))
+                 for c in range(frame.shape[1])]
+    resolved = dict(params)
+    if auto_lag:
+        resolved['tLag'] = max(e['tLag'] for e in estimates)
+    if auto_dim:
+        resolved['eDim'] = max(e['eDim'] for e in estimates)
+    return resolved
@@ -2,10 +2,31 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.spatial import KDTree
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 
 # Function to perform FNN Analysis
-def fnn(timeseries, tlag, min_dimension, max_dimension):
+def fnn(timeseries, tlag, min_dimension, max_dimension, n_workers=1):
+    """
+    False Nearest Neighbours analysis (Abarbanel's criteria).
+
+    For each embedding dimension all nearest neighbours are found with one
+    batched KD-tree query and the false-neighbour tests are evaluated on
+    whole arrays. The query uses all cores when the dimensions run one after
+    another, and one thread per worker process otherwise.
+
+    Parameters:
+        timeseries (np.ndarray, pd.Series or pd.DataFrame): Time series.
+        tlag (int): Time lag.
+        min_dimension (int): Smallest embedding dimension.
+        max_dimension (int): Largest embedding dimension.
+        n_workers (int): Number of dimensions processed at the same time in
+            worker processes (None uses all available cores, 1 processes
+            them one after another).
+
+    Returns:
+        np.ndarray: Embedding dimensions.
+        np.ndarray: Percentage of false nearest neighbours per dimension.
+    """
     # Ensure the input is a NumPy array
     if isinstance(timeseries, (pd.Series, pd.DataFrame)):
         timeseries = timeseries.values.flatten()  # Convert to 1D NumPy array if it's a Series or DataFrame
@@ -13,9 +34,7 @@ def fnn(timeseries, tlag, min_dimension, max_dimension):
         raise ValueError("Input timeseries must be a NumPy array or Pandas Series/DataFrame")
     
     # Preprocess the time series
-    time_series = np.array(timeseries)
-
-    percent = np.ones(max_dimension - min_dimension + 1)
+    time_series = np.array(timeseries, dtype=float)
 
     # Mean and radius of the attractor
     mean_x = np.mean(time_series)
@@ -23,50 +42,53 @@ def fnn(timeseries, tlag, min_dimension, max_dimension):
 
     # Embedding dimensions to check
     de = np.arange(min_dimension, max_dimension + 1)
-    
-    for c in tqdm(de, desc="Processing FNN"):
-        number_false = 0
-        max_l = len(time_series) - c * tlag
-
-        # Embed the time series
-        curr_embedding = embed_time_series(time_series, c, tlag)
 
-        # Build KDTree for nearest neighbor search
-        tree = KDTree(curr_embedding)
+    # Threads of each KD-tree query (-1 = all cores), so worker processes do not oversubscribe the CPU
+    if n_workers == 1 or len(de) <= 1:
+        percent = [fnn_dimension((time_series, c, tlag, Ra, -1)) for c in de]
+    else:
+        jobs = [(time_series, c, tlag, Ra, 1) for c in de]
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            percent = list(pool.map(fnn_dimension, jobs))
 
-        for c2 in range(max_l):
-            # Search for the nearest neighbor
-            dist, NN = tree.query(curr_embedding[c2], k=2)  # Nearest neighbor excluding itself
-            nearest_d = dist[1]  # Exclude self, take the second closest
-            NN = NN[1]
+    return de, np.array(percent, dtype=float) * 100
 
-            if NN >= max_l:
-                # If NN is beyond available data, assume not false
-                test_stat1 = 0
-                test_stat2 = 0
-            else:
-                if nearest_d == 0:
-                    test_stat1 = 1
-                else:
-                    test_stat1 = np.abs(time_series[c2 + c * tlag] - time_series[NN + c * tlag]) / nearest_d
-                
-                test_stat2 = np.abs(time_series[c2 + c * tlag] - time_series[NN + c * tlag]) / Ra
+def fnn_dimension(job):
+    """
+    Fraction of false nearest neighbours for one embedding dimension (worker of fnn).
+    """
+    time_series, c, tlag, Ra, query_workers = job
+    max_l = len(time_series) - c * tlag
 
-            # Use Abarbanel's criteria: test_stat1 >= 15 or test_stat2 >= 2
-            number_false += ((test_stat1 >= 15) | (test_stat2 >= 2))
+    # Embed the time series and find every point's nearest neighbour (excluding itself)
+    curr_embedding = embed_time_series(time_series, c, tlag)
+    tree = KDTree(curr_embedding)
+    dist, NN = tree.query(curr_embedding[:max_l], k=2, workers=query_workers)
+    nearest_d = dist[:, 1]
+    NN = NN[:, 1]
 
-        percent[c - min_dimension] = number_false / max_l
+    # Neighbours beyond the available data are assumed not false
+    valid = NN < max_l
+    points = np.flatnonzero(valid)
+    step = np.abs(time_series[points + c * tlag] - time_series[NN[valid] + c * tlag])
+    d = nearest_d[valid]
+    test_stat1 = np.divide(step, d, out=np.ones_like(step), where=d != 0)
+    test_stat2 = step / Ra
 
-    return de, percent * 100
+    # Use Abarbanel's criteria: test_stat1 >= 15 or test_stat2 >= 2
+    number_false = np.count_nonzero((test_stat1 >= 15) | (test_stat2 >= 2))
+    return number_false / max_l
 
 
 # Embedding the time series based on dimension and lag
 def embed_time_series(data, embedding_dim, lag):
-    data_length = len(data) - (embedding_dim - 1) * lag
-    embedded = np.zeros((data_length, embedding_dim))
-    for c in range(embedding_dim):
-        embedded[:, c] = data[c * lag : c * lag + data_length]
-    return embedded
+    """
+    Delay embedding as a zero-copy, read-only strided view of data:
+    row i is (data[i], data[i + lag], ..., data[i + (embedding_dim - 1) * lag]).
+    """
+    data = np.asarray(data)
+    span = (embedding_dim - 1) * lag + 1
+    return np.lib.stride_tricks.sliding_window_view(data, span)[:, ::lag]
 
 
 # Function to plot FNN results
@@ -1,31 +1,65 @@
 # Import the necessary libraries
-from pyrqa.time_series import TimeSeries
-from pyrqa.settings import Settings
-from pyrqa.analysis_type import Classic
-from pyrqa.analysis_type import Cross
-from pyrqa.neighbourhood import FixedRadius
-from pyrqa.metric import EuclideanMetric
-from pyrqa.time_series import EmbeddedSeries
-from pyrqa.computation import RQAComputation, RPComputation
-
-def perform_mrqa(data, radius=0.2, minLine=2, getRP=True):
+from utils import fnn_utils
+from utils import rqa_sparse_utils
+from utils import rqa_utils_cpp
+import numpy as np
+
+def perform_mrqa(data, radius=0.2, minLine=2, getRP=True, backend="native", eDim=1, tLag=1, zscore=False,
+                 n_threads=1):
     """
     Perform Multivariate Recurrence Quantification Analysis (MRQA) and optionally compute Recurrence Plots (RP)
     on the provided data.
 
     Parameters:
-    data (pd.DataFrame): The input data with time series to be analyzed.
+    data (pd.DataFrame): The input data with time series to be analyzed (one column per channel).
     radius (float): The radius for defining neighborhoods in phase space.
     minLine (int): The minimum line length for MRQA measures.
     getRP (bool): Whether to compute Recurrence Plots (RP). Default is True.
+    backend (str): "native" (default) computes the measures and the recurrence
+        plot in one pass of the C++ engine on the (n, channels) array; "sparse"
+        finds the recurrences with a KD-tree search into a CSR matrix (memory
+        scales with the number of recurrences); "pyrqa" uses pyrqa's
+        RQAComputation / RPComputation. The native and sparse backends count
+        distances <= radius as recurrent (pyrqa uses < radius) and return the
+        rs dict of perform_rqa and the recurrence matrix (a TriBitMatrix or a
+        CSR matrix; use np.asarray(td) for a boolean array).
+    eDim (int): Embedding dimension applied to every channel (1 = each row is one point).
+    tLag (int): Time lag of the per-channel embedding.
+    zscore (bool): Whether to z-score each channel before embedding.
+    n_threads (int): Number of worker threads for the native backend.
 
     Returns:
     dict: A dictionary containing MRQA results for the multivariate time series.
     dict (optional): A dictionary containing RP results for the multivariate time series, if getRP is True.
     """
+    # theiler_corrector=1 corresponds to ignoring the main diagonal only
+    if backend == "native":
+        points = np.asarray(data, dtype=np.float32)
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_stream_sym(
+            points, dim=eDim, lag=tLag, rescale=0, rad=radius, diag_ignore=1, minl=minLine,
+            n_threads=n_threads, return_matrices=getRP, zscore=zscore)
+        if getRP:
+            return rs, td
+        return rs
+
+    points = embed_channels(data, eDim, tLag, zscore)
+    if backend == "sparse":
+        td = rqa_sparse_utils.recurrence_csr(points, points, radius, diag_ignore=1)
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_sparse(
+            td, rescale=0, rad=radius, diag_ignore=1, minl=minLine, rqa_mode="auto")
+        if getRP:
+            return rs, td
+        return rs
+
+    from pyrqa.time_series import EmbeddedSeries
+    from pyrqa.settings import Settings
+    from pyrqa.analysis_type import Classic
+    from pyrqa.neighbourhood import FixedRadius
+    from pyrqa.metric import EuclideanMetric
+    from pyrqa.computation import RQAComputation, RPComputation
 
     # Combine all columns into a MultiTimeSeries object
-    multivariate_time_series = EmbeddedSeries(data.values.tolist())
+    multivariate_time_series = EmbeddedSeries(points.tolist())
 
     # Set up the settings for MRQA computation
     settings = Settings(
@@ -55,3 +89,26 @@ def perform_mrqa(data, radius=0.2, minLine=2, getRP=True):
         return result, rp_result
     else:
         return result
+
+def embed_channels(data, eDim=1, tLag=1, zscore=False):
+    """
+    Embed every channel of a multivariate series (the layout used by rqa_utils_cpp).
+
+    Parameters:
+    data (pd.DataFrame or np.ndarray): (n, channels) data.
+    eDim (int): Embedding dimension applied to every channel.
+    tLag (int): Time lag.
+    zscore (bool): Whether to z-score each channel first (population std).
+
+    Returns:
+    np.ndarray: (n - (eDim - 1) * tLag, channels * eDim) float32 array of points.
+    """
+    points = np.asarray(data, dtype=np.float32)
+    if points.ndim == 1:
+        points = points[:, None]
+    if zscore:
+        sd = points.std(axis=0, dtype=np.float64)
+        points = ((points - points.mean(axis=0, dtype=np.float64)) / np.where(sd == 0, 1.0, sd)).astype(np.float32)
+    if eDim == 1:
+        return np.ascontiguousarray(points)
+    return np.hstack([fnn_utils.embed_time_series(points[:, c], eDim, tLag) for c in range(points.shape[1])]).astype(np.float32)
@@ -11,7 +11,8 @@ def write_rqa_stats(filename, params, rs, err_code):
                     "mean_line,std_line,count_line,entropy,laminarity,trapping_time,"
                     "vmax,divergence,trend_lower_diag,trend_upper_diag\n")
 
-    # Append results
+    # Append results (params['radius'] is the radius actually used, which
+    # perform_rqa/perform_crqa solve for when params['targetREC'] is set)
     with open(stats_file, "a") as f:
         f.write(f"{filename}, {params['eDim']}, {params['tLag']}, {params['rescaleNorm']}, {params['radius'] * 100}, ")
         if err_code == 0:
@@ -0,0 +1,135 @@
+from utils import fnn_utils
+from utils import rqa_utils_cpp
+from scipy import sparse
+from scipy.spatial import cKDTree
+import numpy as np
+
+# Relative margin added to the tree search radius. The tree works on float64
+# distances; candidates are then re-tested with the float32 rule of the C++
+# kernels, so the margin only has to cover float32 rounding.
+SEARCH_MARGIN = 1e-4
+
+# Minkowski p of cKDTree for each distance norm of the C++ kernels
+TREE_P = {'euclidean': 2, 'max': np.inf, 'manhattan': 1}
+
+
+def embed_series(x, dim, lag):
+    """
+    Delay-embed a series as float32 points (same layout as fnn_utils.embed_time_series).
+
+    Parameters:
+        x (array-like): One-dimensional time series.
+        dim (int): Embedding dimension.
+        lag (int): Time lag.
+
+    Returns:
+        np.ndarray: (n - (dim - 1) * lag, dim) float32 array of embedded points.
+    """
+    x = np.asarray(x, dtype=np.float32).ravel()
+    return fnn_utils.embed_time_series(x, dim, lag).astype(np.float32)
+
+
+def pair_distances(emb_a, emb_b, rows, cols, norm="euclidean"):
+    """
+    Distances between selected pairs of points, rounded exactly as the C++
+    kernels compute them (float32, accumulated over the dimensions in order).
+    """
+    if emb_a.shape[1] == 1:
+        return np.abs(emb_a[rows, 0] - emb_b[cols, 0])
+    acc = np.zeros(len(rows), dtype=np.float32)
+    for k in range(emb_a.shape[1]):
+        diff = emb_a[rows, k] - emb_b[cols, k]
+        if norm == "euclidean":
+            acc += diff * diff
+        elif norm == "manhattan":
+            acc += np.abs(diff)
+        else:
+            acc = np.maximum(acc, np.abs(diff))
+    return np.sqrt(acc) if norm == "euclidean" else acc
+
+
+def is_recurrent(dist, rad, rescale, scale):
+    """
+    Apply the thresholding rule of rqa_radius to float32 distances.
+    """
+    if rescale == 1:
+        dist = (dist.astype(np.float64) / scale).astype(np.float32)
+    elif rescale == 2:
+        dist = dist / np.float32(scale)
+    return dist <= np.float32(rad)
+
+
+def recurrence_csr(emb_a, emb_b, rad, rescale=0, scale=1.0, diag_ignore=0, rqa_mode="auto", norm="euclidean"):
+    """
+    Build a sparse recurrence matrix with a fixed-radius KD-tree search.
+
+    Only the recurrent pairs are ever stored, so memory scales with the number
+    of recurrences instead of n^2. For auto-RQA, query_pairs returns each pair
+    once and the matrix is mirrored.
+
+    Parameters:
+        emb_a (np.ndarray): (n, dim) float32 embedded points.
+        emb_b (np.ndarray): (n, dim) float32 embedded points (ignored for auto-RQA).
+        rad (float): Radius.
+        rescale (int): 0 = none, 1 = mean distance, 2 = max distance.
+        scale (float): Rescale factor (see rqa_utils_cpp.rqa_rescale_factor).
+        diag_ignore (int): Number of diagonals around the main one to leave out (auto-RQA only).
+        rqa_mode (str): "auto" or "cross".
+        norm (str): "euclidean", "max" or "manhattan".
+
+    Returns:
+        scipy.sparse.csr_matrix: (n, n) int8 recurrence matrix with sorted indices.
+    """
+    if norm not in TREE_P:
+        raise ValueError(f"Unknown norm '{norm}'; use 'euclidean', 'max' or 'manhattan'")
+    p = TREE_P[norm]
+    n = len(emb_a)
+    search_rad = float(np.float32(rad)) * scale * (1 + SEARCH_MARGIN)
+    tree_a = cKDTree(emb_a.astype(np.float64))
+
+    if rqa_mode == "cross":
+        emb_b = emb_b[:n]
+        pairs = tree_a.sparse_distance_matrix(cKDTree(emb_b.astype(np.float64)), search_rad, p=p, output_type='ndarray')
+        rows, cols = pairs['i'].astype(np.int64), pairs['j'].astype(np.int64)
+        keep = is_recurrent(pair_distances(emb_a, emb_b, rows, cols, norm), rad, rescale, scale)
+        rows, cols = rows[keep], cols[keep]
+    else:
+        pairs = tree_a.query_pairs(search_rad, p=p, output_type='ndarray').astype(np.int64)
+        upper_i, upper_j = pairs[:, 0], pairs[:, 1]
+        keep = np.abs(upper_j - upper_i) >= max(diag_ignore, 1)
+        upper_i, upper_j = upper_i[keep], upper_j[keep]
+        keep = is_recurrent(pair_distances(emb_a, emb_a, upper_i, upper_j, norm), rad, rescale, scale)
+        upper_i, upper_j = upper_i[keep], upper_j[keep]
+        main = np.arange(n, dtype=np.int64) if diag_ignore <= 0 else np.empty(0, dtype=np.int64)
+        rows = np.concatenate([upper_i, upper_j, main])
+        cols = np.concatenate([upper_j, upper_i, main])
+
+    td = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    td.sort_indices()
+    return td
+
+
+def rqa_stats_sparse(dataX1, dataX2, dim, lag, rescale, rad, diag_ignore, minl, rqa_mode="auto", n_threads=1,
+                     norm="euclidean"):
+    """
+    Sparse counterpart of rqa_utils_cpp.rqa_stats_stream.
+
+    Embeds both series, finds the recurrences with recurrence_csr and computes the
+    RQA measures from the CSR matrix. Results equal the dense engine. With
+    rescale 1 or 2 the rescale factor still needs one pass over all pairs
+    (in O(n) memory); with rescale 0 the work scales with the number of recurrences.
+
+    Returns:
+        tuple: (td, rs, mats, err_code) with td a scipy.sparse.csr_matrix.
+    """
+    if rqa_mode == "cross":
+        diag_ignore = 0
+    scale = 1.0
+    if rescale in (1, 2):
+        scale = rqa_utils_cpp.rqa_rescale_factor(dataX1, dataX2, dim=dim, lag=lag, rescale=rescale,
+                                                 rqa_mode=rqa_mode, n_threads=n_threads, norm=norm)
+    emb_a = embed_series(dataX1, dim, lag)
+    emb_b = embed_series(dataX2, dim, lag) if rqa_mode == "cross" else emb_a
+    td = recurrence_csr(emb_a, emb_b, rad, rescale, scale, diag_ignore, rqa_mode, norm)
+    return rqa_utils_cpp.rqa_stats_sparse(td, rescale=rescale, rad=rad, diag_ignore=diag_ignore,
+                                          minl=minl, rqa_mode=rqa_mode)
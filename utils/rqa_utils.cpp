@@ -8,60 +8,313 @@
 #include <stdexcept>
 #include <algorithm>
 #include <numeric>
-#include <map>
 #include <string>
+#include <cstdint>
+#include <utility>
+#include <thread>
+#include <exception>
+#include <memory>
+#include <cstring>
+#include <limits>
+
+#if defined(_MSC_VER)
+#include <intrin.h>
+#endif
 
 namespace py = pybind11;
 
 /************************************
- * rqa_dist
+ * Threading helpers
  *
- * Compute distances between all points of two vectors,
- * embedded using time lags.
+ * n_threads <= 0 means one thread per hardware core. Work is split
+ * into contiguous chunks (rows, diagonals or columns) and partial
+ * results are always combined in chunk order, so every function
+ * gives the same answer whatever the thread count.
+ *
+ * The heavy loops of every exported function run on raw buffers with
+ * the GIL released (py::gil_scoped_release); numpy arrays, lists and
+ * dicts are only created or read while it is held. Several Python
+ * threads can therefore run RQA at the same time.
+ ************************************/
+static int resolve_threads(int n_threads) {
+    if (n_threads <= 0) {
+        unsigned hw = std::thread::hardware_concurrency();
+        n_threads = hw > 0 ? static_cast<int>(hw) : 1;
+    }
+    return n_threads;
+}
+
+static int num_chunks(int n, int n_threads, int min_chunk = 1) {
+    int chunks = std::min(resolve_threads(n_threads), n / std::max(1, min_chunk));
+    return std::max(1, chunks);
+}
+
+// Run fn(chunk, begin, end) over [0, n) split into `chunks` contiguous ranges.
+template <typename F>
+static void parallel_for(int n, int chunks, F fn) {
+    if (chunks <= 1) {
+        fn(0, 0, n);
+        return;
+    }
+    std::vector<std::thread> pool;
+    std::vector<std::exception_ptr> errors(chunks);
+    for (int c = 0; c < chunks; c++) {
+        int begin = static_cast<int>(static_cast<long long>(n) * c / chunks);
+        int end = static_cast<int>(static_cast<long long>(n) * (c + 1) / chunks);
+        pool.emplace_back([&fn, &errors, c, begin, end]() {
+            try {
+                fn(c, begin, end);
+            } catch (...) {
+                errors[c] = std::current_exception();
+            }
+        });
+    }
+    for (auto& t : pool)
+        t.join();
+    for (auto& e : errors)
+        if (e)
+            std::rethrow_exception(e);
+}
+
+/************************************
+ * Embedding helpers
+ *
+ * Embed a pair of series once and compute distances one row at a
+ * time, so callers never need the full n2 x n2 float matrix.
+ *
+ * Embedded points are stored dimension-major (coordinate k of point i
+ * at k * n2 + i), so distance_span runs its inner loops over
+ * contiguous floats of b, one dimension at a time, on tiles of
+ * DIST_TILE points that stay in L1. Those loops vectorise, and each
+ * distance still accumulates its dimensions in order, giving the same
+ * floats as a scalar loop over points.
+ *
+ * Inputs are (n,) series or (n, channels) arrays (multidimensional
+ * RQA): each channel is delay-embedded with dim and lag, giving
+ * channels * dim coordinates per point, channel by channel. With
+ * zscore, every channel is first z-scored (population std).
  ************************************/
-py::dict rqa_dist(py::array_t<float> a, py::array_t<float> b, int dim, int lag) {
+enum class DistNorm { Euclidean, Max, Manhattan };
+
+static DistNorm parse_norm(const std::string& norm) {
+    if (norm == "euclidean")
+        return DistNorm::Euclidean;
+    if (norm == "max")
+        return DistNorm::Max;
+    if (norm == "manhattan")
+        return DistNorm::Manhattan;
+    throw std::runtime_error("Unknown norm '" + norm + "'; use 'euclidean', 'max' or 'manhattan'");
+}
+
+struct EmbeddedPair {
+    int n2;
+    int dim;
+    DistNorm norm;
+    std::vector<float> emb_a;   // dimension-major: emb_a[k * n2 + i]
+    std::vector<float> emb_b;
+};
+
+static int num_channels(const py::buffer_info& buf) {
+    if (buf.ndim < 1 || buf.ndim > 2)
+        throw std::runtime_error("Input arrays must be (n,) series or (n, channels) arrays.");
+    return buf.ndim == 2 ? static_cast<int>(buf.shape[1]) : 1;
+}
+
+// Embed the first n rows of every channel of buf into out (dimension-major).
+static void embed_channels(const py::buffer_info& buf, int n, int dim, int lag, bool zscore,
+                           std::vector<float>& out) {
+    int channels = num_channels(buf);
+    int n2 = n - lag * (dim - 1);
+    const char* base = static_cast<const char*>(buf.ptr);
+    py::ssize_t row_stride = buf.strides[0];
+    py::ssize_t col_stride = buf.ndim == 2 ? buf.strides[1] : 0;
+    out.resize(static_cast<size_t>(n2) * dim * channels);
+    std::vector<float> x(n);
+    for (int c = 0; c < channels; c++) {
+        for (int i = 0; i < n; i++)
+            x[i] = *reinterpret_cast<const float*>(base + i * row_stride + c * col_stride);
+        if (zscore) {
+            double mean = 0.0, var = 0.0;
+            for (float v : x)
+                mean += v;
+            mean /= n;
+            for (float v : x)
+                var += (v - mean) * (v - mean);
+            double sd = std::sqrt(var / n);
+            if (sd == 0.0)
+                sd = 1.0;
+            for (float& v : x)
+                v = static_cast<float>((v - mean) / sd);
+        }
+        for (int k = 0; k < dim; k++)
+            std::copy(x.begin() + lag * k, x.begin() + lag * k + n2,
+                      out.begin() + static_cast<size_t>(c * dim + k) * n2);
+    }
+}
+
+static EmbeddedPair embed_pair(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                               const std::string& norm = "euclidean", bool zscore = false) {
     auto buf_a = a.request();
     auto buf_b = b.request();
-    if (buf_a.ndim < 1 || buf_b.ndim < 1)
-        throw std::runtime_error("Input arrays must have at least one dimension.");
+    int channels = num_channels(buf_a);
+    if (num_channels(buf_b) != channels)
+        throw std::runtime_error("Both input arrays must have the same number of channels.");
 
     int n = buf_a.shape[0];
     int n2 = n - lag * (dim - 1);
     if (n2 <= 0)
         throw std::runtime_error("Not enough data for these embedding parameters.");
+    if (buf_b.shape[0] < n)
+        throw std::runtime_error("Second input array is shorter than the first.");
 
-    float* ptr_a = static_cast<float*>(buf_a.ptr);
-    float* ptr_b = static_cast<float*>(buf_b.ptr);
+    EmbeddedPair e;
+    e.n2 = n2;
+    e.dim = dim * channels;
+    e.norm = parse_norm(norm);
+    embed_channels(buf_a, n, dim, lag, zscore, e.emb_a);
+    embed_channels(buf_b, n, dim, lag, zscore, e.emb_b);
+    return e;
+}
 
-    auto result = py::array_t<float>({n2, n2});
-    auto buf_res = result.request();
-    float* res_ptr = static_cast<float*>(buf_res.ptr);
+static const int DIST_TILE = 256;
 
-    if (dim > 1) {
-        std::vector<float> emb_a(n2 * dim);
-        std::vector<float> emb_b(n2 * dim);
-        for (int k = 0; k < dim; k++) {
-            for (int i = 0; i < n2; i++) {
-                emb_a[i * dim + k] = ptr_a[lag * k + i];
-                emb_b[i * dim + k] = ptr_b[lag * k + i];
-            }
-        }
-        for (int i = 0; i < n2; i++) {
-            for (int j = 0; j < n2; j++) {
-                float sum_sq = 0.0f;
-                for (int k = 0; k < dim; k++) {
-                    float diff = emb_a[i * dim + k] - emb_b[j * dim + k];
-                    sum_sq += diff * diff;
+// Distances from embedded point i of a to embedded points j0 .. j1-1 of b,
+// written to out[0 .. j1-j0).
+static void distance_span(const EmbeddedPair& e, int i, int j0, int j1, float* out) {
+    const size_t n2 = e.n2;
+    const float* a = e.emb_a.data();
+    const float* b = e.emb_b.data();
+    if (e.dim == 1) {
+        // Every norm reduces to |a - b|
+        const float ai = a[i];
+        for (int j = j0; j < j1; j++)
+            out[j - j0] = std::fabs(ai - b[j]);
+        return;
+    }
+    for (int t0 = j0; t0 < j1; t0 += DIST_TILE) {
+        const int len = std::min(DIST_TILE, j1 - t0);
+        float* acc = out + (t0 - j0);
+        std::fill(acc, acc + len, 0.0f);
+        for (int k = 0; k < e.dim; k++) {
+            const float ak = a[k * n2 + i];
+            const float* bk = b + k * n2 + t0;
+            switch (e.norm) {
+            case DistNorm::Euclidean:
+                for (int t = 0; t < len; t++) {
+                    float diff = ak - bk[t];
+                    acc[t] += diff * diff;
                 }
-                res_ptr[i * n2 + j] = std::sqrt(sum_sq);
+                break;
+            case DistNorm::Manhattan:
+                for (int t = 0; t < len; t++)
+                    acc[t] += std::fabs(ak - bk[t]);
+                break;
+            case DistNorm::Max:
+                for (int t = 0; t < len; t++)
+                    acc[t] = std::max(acc[t], std::fabs(ak - bk[t]));
+                break;
             }
         }
-    } else {
-        for (int i = 0; i < n2; i++) {
-            for (int j = 0; j < n2; j++) {
-                res_ptr[i * n2 + j] = std::fabs(ptr_a[i] - ptr_b[j]);
+        if (e.norm == DistNorm::Euclidean)
+            for (int t = 0; t < len; t++)
+                acc[t] = std::sqrt(acc[t]);
+    }
+}
+
+// Distances from embedded point i of a to every embedded point of b.
+static void distance_row(const EmbeddedPair& e, int i, float* row) {
+    distance_span(e, i, 0, e.n2, row);
+}
+
+// Mean (rescale == 1) or max (rescale == 2) over all rows of a square
+// matrix, 1.0 otherwise. get_row(i, scratch) returns a pointer to row i.
+// Row sums are reduced in row order, independent of n_threads.
+template <typename RowFn>
+static double rescale_over_rows(int n, int rescale, int n_threads, RowFn get_row) {
+    if (rescale != 1 && rescale != 2)
+        return 1.0;
+    std::vector<double> row_sum(n, 0.0);
+    std::vector<float> row_max(n, 0.0f);
+    parallel_for(n, num_chunks(n, n_threads), [&](int, int begin, int end) {
+        std::vector<float> scratch(n);
+        for (int i = begin; i < end; i++) {
+            const float* r = get_row(i, scratch);
+            double sum = 0.0;
+            float max_val = 0.0f;
+            for (int j = 0; j < n; j++) {
+                sum += r[j];
+                if (r[j] > max_val)
+                    max_val = r[j];
             }
+            row_sum[i] = sum;
+            row_max[i] = max_val;
         }
+    });
+    if (rescale == 1)
+        return std::accumulate(row_sum.begin(), row_sum.end(), 0.0) / (static_cast<double>(n) * n);
+    return *std::max_element(row_max.begin(), row_max.end());
+}
+
+// First (cheap) pass of the streaming kernels: the rescale factor of the
+// distance matrix, computed one row at a time.
+static double rescale_factor(const EmbeddedPair& e, int rescale, int n_threads) {
+    return rescale_over_rows(e.n2, rescale, n_threads, [&e](int i, std::vector<float>& scratch) {
+        distance_row(e, i, scratch.data());
+        return static_cast<const float*>(scratch.data());
+    });
+}
+
+// Distance after rescaling, as compared against the radius by rqa_radius.
+static inline float rescaled(float v, int rescale, double scale) {
+    if (rescale == 1)
+        return static_cast<float>(v / scale);
+    if (rescale == 2)
+        return v / static_cast<float>(scale);
+    return v;
+}
+
+// Threshold one row of distances into int8 (zeroing the ignored diagonals).
+static void threshold_row(const float* dist_row, int n, int i, int rescale, double scale,
+                          float rad, int diag_ignore, int8_t* out) {
+    for (int j = 0; j < n; j++)
+        out[j] = (rescaled(dist_row[j], rescale, scale) <= rad) ? 1 : 0;
+    int lo = std::max(0, i - diag_ignore + 1);
+    int hi = std::min(n - 1, i + diag_ignore - 1);
+    for (int j = lo; j <= hi; j++)
+        out[j] = 0;
+}
+
+/************************************
+ * rqa_dist
+ *
+ * Compute distances between all points of two vectors,
+ * embedded using time lags. norm is "euclidean", "max"
+ * (Chebyshev) or "manhattan"; the streaming kernels below
+ * take the same argument. a and b may be (n, channels) arrays
+ * (see Embedding helpers); zscore z-scores each channel first.
+ ************************************/
+static const int DIST_COL_BLOCK = 2048;
+
+py::dict rqa_dist(py::array_t<float> a, py::array_t<float> b, int dim, int lag, int n_threads, std::string norm,
+                  bool zscore) {
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm, zscore);
+    int n2 = e.n2;
+
+    auto result = py::array_t<float>({n2, n2});
+    auto buf_res = result.request();
+    float* res_ptr = static_cast<float*>(buf_res.ptr);
+
+    // Blocks of DIST_COL_BLOCK columns are reused by every row of a chunk
+    // while they are still in cache.
+    {
+        py::gil_scoped_release release;
+        parallel_for(n2, num_chunks(n2, n_threads), [&](int, int begin, int end) {
+            for (int j0 = 0; j0 < n2; j0 += DIST_COL_BLOCK) {
+                int j1 = std::min(n2, j0 + DIST_COL_BLOCK);
+                for (int i = begin; i < end; i++)
+                    distance_span(e, i, j0, j1, res_ptr + static_cast<size_t>(i) * n2 + j0);
+            }
+        });
     }
 
     py::dict ds;
@@ -81,54 +334,194 @@ py::dict rqa_dist(py::array_t<float> a, py::array_t<float> b, int dim, int lag)
  *     2 ignores the main diagonal and one off-diagonal on each side, etc.
  *   - For cross RQA, diag_ignore should be 0.
  ************************************/
-py::array_t<int8_t> rqa_radius(py::array_t<float> dist, int rescale, float rad, int diag_ignore) {
-    auto buf = dist.request();
-    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
-        throw std::runtime_error("Distance matrix must be square");
-
-    int n = buf.shape[0];
-    if (buf.size == 1)
+static void check_radius_args(int n, float rad, int diag_ignore) {
+    if (n == 1)
         throw std::runtime_error("Distance matrix has only one element!");
     if (rad <= 0)
         throw std::runtime_error("Please use a scalar threshold > 0");
     if (diag_ignore < 0)
         throw std::runtime_error("Please use a non-negative integer for diag_ignore");
+}
 
-    float* dist_ptr = static_cast<float*>(buf.ptr);
-    std::vector<float> scaled(buf.size);
-    for (size_t i = 0; i < buf.size; i++) {
-        scaled[i] = dist_ptr[i];
-    }
+// Rescale factor of a full distance matrix held in memory.
+static double matrix_rescale_factor(const float* dist_ptr, int n, int rescale, int n_threads) {
+    return rescale_over_rows(n, rescale, n_threads, [dist_ptr, n](int i, std::vector<float>&) {
+        return dist_ptr + static_cast<size_t>(i) * n;
+    });
+}
+
+py::array_t<int8_t> rqa_radius(py::array_t<float> dist, int rescale, float rad, int diag_ignore, int n_threads) {
+    auto buf = dist.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Distance matrix must be square");
+
+    int n = buf.shape[0];
+    check_radius_args(n, rad, diag_ignore);
+
+    const float* dist_ptr = static_cast<const float*>(buf.ptr);
+    auto thrd = py::array_t<int8_t>({n, n});
+    auto buf_thrd = thrd.request();
+    int8_t* thrd_ptr = static_cast<int8_t*>(buf_thrd.ptr);
 
-    if (rescale == 1) {
-        double sum = std::accumulate(scaled.begin(), scaled.end(), 0.0);
-        double mean_val = sum / scaled.size();
-        for (auto &v : scaled)
-            v = v / mean_val;
-    } else if (rescale == 2) {
-        float max_val = *std::max_element(scaled.begin(), scaled.end());
-        for (auto &v : scaled)
-            v = v / max_val;
+    {
+        py::gil_scoped_release release;
+        double scale = matrix_rescale_factor(dist_ptr, n, rescale, n_threads);
+        parallel_for(n, num_chunks(n, n_threads), [&](int, int begin, int end) {
+            for (int i = begin; i < end; i++)
+                threshold_row(dist_ptr + static_cast<size_t>(i) * n, n, i, rescale, scale, rad, diag_ignore,
+                              thrd_ptr + static_cast<size_t>(i) * n);
+        });
     }
+    return thrd;
+}
+
+/************************************
+ * rqa_stream
+ *
+ * Embed, compute distances and threshold them row by row.
+ * Equivalent to rqa_radius(rqa_dist(a, b, dim, lag)["d"], ...)
+ * but only the int8 recurrence matrix is ever allocated.
+ ************************************/
+py::array_t<int8_t> rqa_stream(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                               int rescale, float rad, int diag_ignore, int n_threads, std::string norm) {
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    int n = e.n2;
+    check_radius_args(n, rad, diag_ignore);
 
     auto thrd = py::array_t<int8_t>({n, n});
     auto buf_thrd = thrd.request();
     int8_t* thrd_ptr = static_cast<int8_t*>(buf_thrd.ptr);
-    for (int i = 0; i < n * n; i++) {
-        thrd_ptr[i] = (scaled[i] <= rad) ? 1 : 0;
+
+    {
+        py::gil_scoped_release release;
+        double scale = rescale_factor(e, rescale, n_threads);
+        parallel_for(n, num_chunks(n, n_threads), [&](int, int begin, int end) {
+            std::vector<float> row(n);
+            for (int i = begin; i < end; i++) {
+                distance_row(e, i, row.data());
+                threshold_row(row.data(), n, i, rescale, scale, rad, diag_ignore, thrd_ptr + static_cast<size_t>(i) * n);
+            }
+        });
     }
+    return thrd;
+}
+
+/************************************
+ * rqa_radius_for_rec / rqa_radius_for_rec_stream
+ *
+ * Radius giving a target %REC (fixed recurrence rate). The radius is
+ * the k-th smallest rescaled distance outside the ignored diagonals,
+ * k = ceil(target_rec / 100 * npts), found exactly by a two-pass radix
+ * select: non-negative floats order like their bit patterns, so the
+ * first pass histograms the top 16 bits and the second pass the low
+ * 16 bits inside the selected bin. Memory use is two 65536-bin
+ * histograms per thread, independent of the matrix size.
+ ************************************/
+static inline uint32_t float_bits(float v) {
+    uint32_t u;
+    std::memcpy(&u, &v, sizeof(u));
+    return u;
+}
+
+template <typename RowFn>
+static float radius_for_rec(int n, int rescale, float target_rec, int diag_ignore, int n_threads,
+                            RowFn get_row) {
+    if (n == 1)
+        throw std::runtime_error("Distance matrix has only one element!");
+    if (!(target_rec > 0 && target_rec <= 100))
+        throw std::runtime_error("Please use a target %REC in (0, 100]");
+    if (diag_ignore < 0)
+        throw std::runtime_error("Please use a non-negative integer for diag_ignore");
+
+    long long npts = static_cast<long long>(n) * n;
+    if (diag_ignore != 0)
+        npts = npts - n - 2LL * n * (diag_ignore - 1) + static_cast<long long>(diag_ignore) * (diag_ignore - 1);
+    if (npts <= 0)
+        throw std::runtime_error("No points left outside the ignored diagonals");
+    long long k = static_cast<long long>(std::ceil(target_rec / 100.0 * npts - 1e-9));
+    k = std::min(std::max(k, 1LL), npts);
 
-    // Zero out the diagonals based on diag_ignore.
-    if (diag_ignore != 0) {
-        for (int d = 0; d < diag_ignore; d++) {
-            for (int j = 0; j < n - d; j++) {
-                thrd_ptr[j * n + (j + d)] = 0;     // upper diagonal at offset d
-                thrd_ptr[(j + d) * n + j] = 0;       // lower diagonal at offset d
+    double scale = rescale_over_rows(n, rescale, n_threads, get_row);
+
+    // One pass: histogram of (bits >> shift) for values whose top bits equal prefix.
+    auto pass = [&](int shift, bool filtered, uint32_t prefix) {
+        int chunks = num_chunks(n, n_threads);
+        std::vector<std::vector<long long>> parts(chunks);
+        parallel_for(n, chunks, [&](int c, int begin, int end) {
+            std::vector<long long>& h = parts[c];
+            h.assign(1 << 16, 0);
+            std::vector<float> scratch(n);
+            for (int i = begin; i < end; i++) {
+                const float* r = get_row(i, scratch);
+                for (int j = 0; j < n; j++) {
+                    if (std::abs(i - j) < diag_ignore)
+                        continue;
+                    uint32_t u = float_bits(rescaled(r[j], rescale, scale));
+                    if (filtered && (u >> 16) != prefix)
+                        continue;
+                    h[(u >> shift) & 0xFFFF]++;
+                }
             }
+        });
+        std::vector<long long> hist(1 << 16, 0);
+        for (auto& h : parts)
+            for (size_t b = 0; b < hist.size(); b++)
+                hist[b] += h[b];
+        return hist;
+    };
+    // Bin holding the k-th smallest value; k becomes the rank inside that bin.
+    auto select = [](const std::vector<long long>& hist, long long& rank) {
+        uint32_t b = 0;
+        while (rank > hist[b]) {
+            rank -= hist[b];
+            b++;
         }
-    }
+        return b;
+    };
 
-    return thrd;
+    long long rank = k;
+    uint32_t hi = select(pass(16, false, 0), rank);
+    uint32_t lo = select(pass(0, true, hi), rank);
+    uint32_t u = (hi << 16) | lo;
+    float rad;
+    std::memcpy(&rad, &u, sizeof(rad));
+    // A zero radius selects exactly the zero distances; the smallest
+    // positive float does the same and passes the radius > 0 check.
+    if (rad <= 0)
+        rad = std::nextafter(0.0f, 1.0f);
+    return rad;
+}
+
+float rqa_radius_for_rec(py::array_t<float> d, int rescale, float target_rec, int diag_ignore,
+                         std::string rqa_mode, int n_threads) {
+    auto buf = d.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Distance matrix must be square");
+    int n = buf.shape[0];
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    const float* dist_ptr = static_cast<const float*>(buf.ptr);
+
+    py::gil_scoped_release release;
+    return radius_for_rec(n, rescale, target_rec, diag_ignore, n_threads,
+                          [dist_ptr, n](int i, std::vector<float>&) {
+                              return dist_ptr + static_cast<size_t>(i) * n;
+                          });
+}
+
+float rqa_radius_for_rec_stream(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                                int rescale, float target_rec, int diag_ignore,
+                                std::string rqa_mode, int n_threads, std::string norm) {
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+
+    py::gil_scoped_release release;
+    return radius_for_rec(e.n2, rescale, target_rec, diag_ignore, n_threads,
+                          [&e](int i, std::vector<float>& scratch) {
+                              distance_row(e, i, scratch.data());
+                              return static_cast<const float*>(scratch.data());
+                          });
 }
 
 /************************************
@@ -138,66 +531,72 @@ py::array_t<int8_t> rqa_radius(py::array_t<float> dist, int rescale, float rad,
  * in a thresholded matrix.
  * diag_ignore specifies the number of diagonals to ignore.
  ************************************/
-py::tuple rqa_line(py::array_t<int8_t> thrd, int diag_ignore) {
-    auto buf = thrd.request();
-    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
-        throw std::runtime_error("Thresholded distance matrix must be square");
+struct DiagLines {
+    std::vector<int> ll;     // diagonal line lengths, in diagonal order
+    int maxl_poss;
+    long long npts;
+    double trend1;
+    double trend2;
+};
 
-    int n = buf.shape[0];
-    int possnumll = (n * n) / 2;
-    std::vector<short> ll(possnumll, 0);
+// Works on the raw matrix only, so it can run with the GIL released.
+static DiagLines diag_lines(const int8_t* data, int n, int diag_ignore, int n_threads) {
     int diagCount = 2 * n - 1;
     std::vector<std::vector<float>> recur(diagCount, std::vector<float>(2, 0.0f));
-    int nlines = 0;
-    int8_t* data = static_cast<int8_t*>(buf.ptr);
 
-    for (int i = 0; i < diagCount; i++) {
-        int offset = i - n + 1;
-        int ld = n - std::abs(offset);
-        recur[i][0] = ld;
-        int j = 0;
-        while (j < ld) {
-            int row, col;
-            if (offset >= 0) {
-                row = j;
-                col = j + offset;
-            } else {
-                row = j - offset;
-                col = j;
-            }
-            int index = row * n + col;
-            if (data[index] == 1) {
-                nlines++;
-                if(nlines > possnumll)
-                    nlines = possnumll;
-                ll[nlines - 1] = 1;
-                recur[i][1] += 1;
-                int k = j + 1;
-                while (k < ld) {
-                    int r, c;
-                    if (offset >= 0) {
-                        r = k;
-                        c = k + offset;
-                    } else {
-                        r = k - offset;
-                        c = k;
-                    }
-                    int idx = r * n + c;
-                    if (data[idx] == 1) {
-                        ll[nlines - 1] += 1;
-                        recur[i][1] += 1;
-                        k++;
-                    } else {
-                        break;
+    // Each chunk of diagonals collects its own line lengths; the chunks are
+    // concatenated in diagonal order afterwards.
+    int chunks = num_chunks(diagCount, n_threads, 64);
+    std::vector<std::vector<int>> chunk_ll(chunks);
+    parallel_for(diagCount, chunks, [&](int c, int begin, int end) {
+        std::vector<int>& ll = chunk_ll[c];
+        for (int i = begin; i < end; i++) {
+            int offset = i - n + 1;
+            int ld = n - std::abs(offset);
+            recur[i][0] = ld;
+            int j = 0;
+            while (j < ld) {
+                int row, col;
+                if (offset >= 0) {
+                    row = j;
+                    col = j + offset;
+                } else {
+                    row = j - offset;
+                    col = j;
+                }
+                size_t index = static_cast<size_t>(row) * n + col;
+                if (data[index] == 1) {
+                    ll.push_back(1);
+                    recur[i][1] += 1;
+                    int k = j + 1;
+                    while (k < ld) {
+                        int r, cc;
+                        if (offset >= 0) {
+                            r = k;
+                            cc = k + offset;
+                        } else {
+                            r = k - offset;
+                            cc = k;
+                        }
+                        size_t idx = static_cast<size_t>(r) * n + cc;
+                        if (data[idx] == 1) {
+                            ll.back() += 1;
+                            recur[i][1] += 1;
+                            k++;
+                        } else {
+                            break;
+                        }
                     }
+                    j = k;
+                } else {
+                    j++;
                 }
-                j = k;
-            } else {
-                j++;
             }
         }
-    }
-    ll.resize(nlines);
+    });
+    std::vector<int> ll;
+    for (auto& part : chunk_ll)
+        ll.insert(ll.end(), part.begin(), part.end());
 
     int mid = 0;
     float max_val = recur[0][0];
@@ -265,77 +664,127 @@ py::tuple rqa_line(py::array_t<int8_t> thrd, int diag_ignore) {
             trend2 = 1000 * ((valid_count * sum_xy - sum_x * sum_y) / denom);
     }
 
-    int maxl_poss = n - diag_ignore;
-    int npts = (diag_ignore == 0) ? n * n : n * n - n - 2 * n * (diag_ignore - 1) + diag_ignore * (diag_ignore - 1);
+    DiagLines dl;
+    dl.ll = std::move(ll);
+    dl.maxl_poss = n - diag_ignore;
+    dl.npts = static_cast<long long>(n) * n;
+    if (diag_ignore != 0)
+        dl.npts = dl.npts - n - 2LL * n * (diag_ignore - 1) + static_cast<long long>(diag_ignore) * (diag_ignore - 1);
+    dl.trend1 = trend1;
+    dl.trend2 = trend2;
+    return dl;
+}
+
+static py::array_t<int> int_array(const std::vector<int>& v) {
+    auto arr = py::array_t<int>(v.size());
+    std::copy(v.begin(), v.end(), static_cast<int*>(arr.request().ptr));
+    return arr;
+}
 
-    auto ll_array = py::array_t<short>(ll.size());
-    auto buf_ll = ll_array.request();
-    short* ll_ptr = static_cast<short*>(buf_ll.ptr);
-    for (size_t i = 0; i < ll.size(); i++)
-        ll_ptr[i] = ll[i];
+py::tuple rqa_line(py::array_t<int8_t> thrd, int diag_ignore, int n_threads) {
+    auto buf = thrd.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Thresholded distance matrix must be square");
 
-    return py::make_tuple(ll_array, maxl_poss, npts, trend1, trend2);
+    int n = buf.shape[0];
+    const int8_t* data = static_cast<const int8_t*>(buf.ptr);
+    DiagLines dl;
+    {
+        py::gil_scoped_release release;
+        dl = diag_lines(data, n, diag_ignore, n_threads);
+    }
+    return py::make_tuple(int_array(dl.ll), dl.maxl_poss, dl.npts, dl.trend1, dl.trend2);
 }
 
 /************************************
  * rqa_histlines
  *
  * Compute the histogram of line lengths and basic statistics.
+ * Lengths are counted straight into a 64-bit histogram indexed by
+ * length; mean, std and count come from the histogram.
  ************************************/
-py::tuple rqa_histlines(py::array_t<short> llengths, int minl) {
+// Moments of the lines of length >= minl in hist (hist[l] = number of lines of length l).
+struct HistMoments {
+    long long count;   // number of lines
+    long long sum;     // total length
+    double mean;
+    double std;
+    int maxl;          // longest line (0 if none)
+    int unique;        // number of distinct lengths
+};
+
+static HistMoments hist_moments(const std::vector<long long>& hist, int minl) {
+    HistMoments m = {0, 0, 0.0, 0.0, 0, 0};
+    for (size_t l = std::max(minl, 1); l < hist.size(); l++) {
+        long long c = hist[l];
+        if (c == 0)
+            continue;
+        m.count += c;
+        m.sum += static_cast<long long>(l) * c;
+        m.maxl = static_cast<int>(l);
+        m.unique++;
+    }
+    if (m.count > 0) {
+        m.mean = static_cast<double>(m.sum) / m.count;
+        double sq_sum = 0.0;
+        for (size_t l = std::max(minl, 1); l < hist.size(); l++)
+            if (hist[l] > 0)
+                sq_sum += hist[l] * (l - m.mean) * (l - m.mean);
+        m.std = std::sqrt(sq_sum / m.count);
+    }
+    return m;
+}
+
+// Histogram as a (unique lengths, 2) float array of [length, count] rows;
+// a single [0, 0] row when there are no lines >= minl.
+static py::array_t<float> hist_table(const std::vector<long long>& hist, int minl) {
+    std::vector<int> lengths;
+    for (size_t l = std::max(minl, 1); l < hist.size(); l++)
+        if (hist[l] > 0)
+            lengths.push_back(static_cast<int>(l));
+    if (lengths.empty()) {
+        auto empty = py::array_t<float>({1, 2});
+        float* e = static_cast<float*>(empty.request().ptr);
+        e[0] = 0;
+        e[1] = 0;
+        return empty;
+    }
+    auto table = py::array_t<float>({static_cast<int>(lengths.size()), 2});
+    float* t = static_cast<float*>(table.request().ptr);
+    for (size_t k = 0; k < lengths.size(); k++) {
+        t[k * 2] = static_cast<float>(lengths[k]);
+        t[k * 2 + 1] = static_cast<float>(hist[lengths[k]]);
+    }
+    return table;
+}
+
+py::tuple rqa_histlines(py::array_t<int> llengths, int minl) {
     auto buf = llengths.request();
     if (buf.ndim != 1)
         throw std::runtime_error("Input data must be a vector, not a matrix");
     if (minl <= 0)
         throw std::runtime_error("Please use an integer min line length >= 1");
 
-    short* data = static_cast<short*>(buf.ptr);
+    const int* data = static_cast<const int*>(buf.ptr);
     size_t size = buf.shape[0];
-
-    std::vector<short> valid;
-    for (size_t i = 0; i < size; i++) {
-        if (data[i] >= minl)
-            valid.push_back(data[i]);
-    }
-    if (valid.empty()) {
-        auto linehist = py::array_t<float>({1, 2});
-        auto buf_hist = linehist.request();
-        float* hist_ptr = static_cast<float*>(buf_hist.ptr);
-        hist_ptr[0] = 0;
-        hist_ptr[1] = 0;
-        py::list linestats;
-        linestats.append(0.0);
-        linestats.append(0.0);
-        linestats.append(0);
-        return py::make_tuple(linehist, linestats);
-    }
-
-    double sum = std::accumulate(valid.begin(), valid.end(), 0.0);
-    double mean_val = sum / valid.size();
-    double sq_sum = 0.0;
-    for (auto v : valid)
-        sq_sum += (v - mean_val) * (v - mean_val);
-    double std_val = std::sqrt(sq_sum / valid.size());
-    int count = valid.size();
+    std::vector<long long> hist;
+    HistMoments m;
+    {
+        py::gil_scoped_release release;
+        int maxl = 0;
+        for (size_t i = 0; i < size; i++)
+            maxl = std::max(maxl, data[i]);
+        hist.assign(maxl + 1, 0);
+        for (size_t i = 0; i < size; i++)
+            if (data[i] >= minl)
+                hist[data[i]]++;
+        m = hist_moments(hist, minl);
+    }
     py::list linestats;
-    linestats.append(mean_val);
-    linestats.append(std_val);
-    linestats.append(count);
-
-    std::map<short, int> freq;
-    for (auto v : valid)
-        freq[v]++;
-    size_t num_unique = freq.size();
-    auto linehist = py::array_t<float>({(int)num_unique, 2});
-    auto buf_hist = linehist.request();
-    float* hist_ptr = static_cast<float*>(buf_hist.ptr);
-    size_t idx = 0;
-    for (auto& kv : freq) {
-        hist_ptr[idx * 2]     = kv.first;
-        hist_ptr[idx * 2 + 1] = kv.second;
-        idx++;
-    }
-    return py::make_tuple(linehist, linestats);
+    linestats.append(m.mean);
+    linestats.append(m.std);
+    linestats.append(m.count);
+    return py::make_tuple(hist_table(hist, minl), linestats);
 }
 
 /************************************
@@ -343,15 +792,11 @@ py::tuple rqa_histlines(py::array_t<short> llengths, int minl) {
  *
  * Compute the Shannon entropy of a distribution.
  ************************************/
-py::list rqa_entropy(py::array_t<float> distr, int nstates) {
-    auto buf = distr.request();
-    if (buf.ndim != 1)
-        throw std::runtime_error("Input data must be a vector, not a matrix");
+// Returns (entropy, remaining information).
+static std::pair<double, double> shannon_entropy_of(const float* data, size_t size, int nstates) {
     if (nstates <= 0)
         throw std::runtime_error("Please use an integer greater than 0 for the number of states");
 
-    float* data = static_cast<float*>(buf.ptr);
-    size_t size = buf.shape[0];
     double sum_val = 0.0;
     for (size_t i = 0; i < size; i++)
         sum_val += data[i];
@@ -365,10 +810,24 @@ py::list rqa_entropy(py::array_t<float> distr, int nstates) {
             shannon_entropy -= p * std::log(p) / std::log(2.0);
     }
     double max_entropy = std::log(nstates) / std::log(2.0);
-    double remaining_info = max_entropy - shannon_entropy;
+    return std::make_pair(shannon_entropy, max_entropy - shannon_entropy);
+}
+
+py::list rqa_entropy(py::array_t<float> distr, int nstates) {
+    auto buf = distr.request();
+    if (buf.ndim != 1)
+        throw std::runtime_error("Input data must be a vector, not a matrix");
+
+    const float* data = static_cast<const float*>(buf.ptr);
+    size_t size = buf.shape[0];
+    std::pair<double, double> ent;
+    {
+        py::gil_scoped_release release;
+        ent = shannon_entropy_of(data, size, nstates);
+    }
     py::list result;
-    result.append(shannon_entropy);
-    result.append(remaining_info);
+    result.append(ent.first);
+    result.append(ent.second);
     return result;
 }
 
@@ -385,219 +844,2111 @@ py::list rqa_entropy(py::array_t<float> distr, int nstates) {
  *   - Trapping Time (TT) = (sum of vertical line lengths with length>=vmin) / (number of such lines)
  *   - Vmax = maximum vertical line length.
  ************************************/
-py::tuple rqa_vertical(py::array_t<int8_t> thrd, int vmin) {
-    auto buf = thrd.request();
-    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
-         throw std::runtime_error("Thresholded matrix must be square");
-    int n = buf.shape[0];
-    int8_t* data = static_cast<int8_t*>(buf.ptr);
-    std::vector<int> vert_lengths; // vertical lines with length >= vmin
-    double vertical_sum_valid = 0.0; // sum of lengths for vertical lines >= vmin
-    double vertical_total = 0.0;     // sum of lengths for all vertical segments (length>=1)
-    int count_valid = 0;
-    int Vmax = 0;
-    for (int j = 0; j < n; j++) {
-         int count = 0;
-         for (int i = 0; i < n; i++) {
-             int idx = i * n + j;
-             if (data[idx] == 1) {
-                 count++;
-             } else {
-                 if (count > 0) {
-                     vertical_total += count;
-                     if (count >= vmin) {
-                         vert_lengths.push_back(count);
-                         vertical_sum_valid += count;
-                         count_valid++;
-                         if (count > Vmax) Vmax = count;
-                     }
+struct VerticalLines {
+    std::vector<int> lengths;   // vertical lines with length >= vmin, in column order
+    double laminarity;
+    double trapping_time;
+    int Vmax;
+};
+
+static VerticalLines vertical_lines(const int8_t* data, int n, int vmin, int n_threads) {
+    // Per-chunk partial results over contiguous column ranges, merged in column order.
+    struct VerticalPart {
+        std::vector<int> vert_lengths;   // vertical lines with length >= vmin
+        double vertical_sum_valid = 0.0; // sum of lengths for vertical lines >= vmin
+        double vertical_total = 0.0;     // sum of lengths for all vertical segments (length>=1)
+        int count_valid = 0;
+        int Vmax = 0;
+        void add(int count, int vmin) {
+            vertical_total += count;
+            if (count >= vmin) {
+                vert_lengths.push_back(count);
+                vertical_sum_valid += count;
+                count_valid++;
+                if (count > Vmax) Vmax = count;
+            }
+        }
+    };
+    int chunks = num_chunks(n, n_threads, 64);
+    std::vector<VerticalPart> parts(chunks);
+    parallel_for(n, chunks, [&](int c, int begin, int end) {
+        VerticalPart& part = parts[c];
+        for (int j = begin; j < end; j++) {
+             int count = 0;
+             for (int i = 0; i < n; i++) {
+                 size_t idx = static_cast<size_t>(i) * n + j;
+                 if (data[idx] == 1) {
+                     count++;
+                 } else if (count > 0) {
+                     part.add(count, vmin);
                      count = 0;
                  }
              }
-         }
-         if (count > 0) {
-             vertical_total += count;
-             if (count >= vmin) {
-                 vert_lengths.push_back(count);
-                 vertical_sum_valid += count;
-                 count_valid++;
-                 if (count > Vmax) Vmax = count;
-             }
-         }
+             if (count > 0)
+                 part.add(count, vmin);
+        }
+    });
+
+    std::vector<int> vert_lengths;
+    double vertical_sum_valid = 0.0;
+    double vertical_total = 0.0;
+    int count_valid = 0;
+    int Vmax = 0;
+    for (auto& part : parts) {
+        vert_lengths.insert(vert_lengths.end(), part.vert_lengths.begin(), part.vert_lengths.end());
+        vertical_sum_valid += part.vertical_sum_valid;
+        vertical_total += part.vertical_total;
+        count_valid += part.count_valid;
+        Vmax = std::max(Vmax, part.Vmax);
     }
-    double laminarity = (vertical_total > 0) ? vertical_sum_valid / vertical_total : 0.0;
-    double trapping_time = (count_valid > 0) ? vertical_sum_valid / count_valid : 0.0;
-    auto result = py::array_t<int>(vert_lengths.size());
-    auto buf_res = result.request();
-    int* res_ptr = static_cast<int*>(buf_res.ptr);
-    for (size_t i = 0; i < vert_lengths.size(); i++) {
-         res_ptr[i] = vert_lengths[i];
+    VerticalLines vl;
+    vl.lengths = std::move(vert_lengths);
+    vl.laminarity = (vertical_total > 0) ? vertical_sum_valid / vertical_total : 0.0;
+    vl.trapping_time = (count_valid > 0) ? vertical_sum_valid / count_valid : 0.0;
+    vl.Vmax = Vmax;
+    return vl;
+}
+
+py::tuple rqa_vertical(py::array_t<int8_t> thrd, int vmin, int n_threads) {
+    auto buf = thrd.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+         throw std::runtime_error("Thresholded matrix must be square");
+    int n = buf.shape[0];
+    const int8_t* data = static_cast<const int8_t*>(buf.ptr);
+    VerticalLines vl;
+    {
+        py::gil_scoped_release release;
+        vl = vertical_lines(data, n, vmin, n_threads);
     }
-    return py::make_tuple(result, laminarity, trapping_time, Vmax);
+    return py::make_tuple(int_array(vl.lengths), vl.laminarity, vl.trapping_time, vl.Vmax);
 }
 
 /************************************
- * rqa_stats
- *
- * Perform full Recurrence Quantification Analysis (RQA) on a distance matrix.
- *
- * Parameters:
- *   - rqa_mode: "auto" or "cross". For "auto", diag_ignore is used;
- *               for "cross", no diagonals are ignored.
+ * BitMatrix
  *
- * Additional vertical metrics (LAM, TT, Vmax) and divergence (1/Lmax) are added.
+ * Bit-packed recurrence matrix: 64 cells per uint64_t word,
+ * row-major, each row padded with zero bits to a whole word.
+ * Uses 1 bit per cell instead of the 1 byte of the int8 td.
  ************************************/
-py::tuple rqa_stats(py::array_t<float> d, int rescale, float rad, int diag_ignore, int minl, std::string rqa_mode="auto") {
-    int err_code = 0;
-    // For cross recurrence, ignore no diagonals.
-    if (rqa_mode == "cross")
-        diag_ignore = 0;
+static inline int popcount64(uint64_t x) {
+#if defined(_MSC_VER)
+    return static_cast<int>(__popcnt64(x));
+#else
+    return __builtin_popcountll(x);
+#endif
+}
 
-    py::array_t<int8_t> td;
-    try {
-        td = rqa_radius(d, rescale, rad, diag_ignore);
-    } catch (std::runtime_error &e) {
-        throw std::runtime_error("Error in thresholding: " + std::string(e.what()));
-        err_code = 1;
-        return py::make_tuple(py::none(), py::none(), py::none(), err_code);
-    }
-    py::tuple line_result = rqa_line(td, diag_ignore);
-    py::array ll = line_result[0].cast<py::array>();
-    int maxl_poss = line_result[1].cast<int>();
-    int npts = line_result[2].cast<int>();
-    double trend1 = line_result[3].cast<double>();
-    double trend2 = line_result[4].cast<double>();
+static inline int ctz64(uint64_t x) {
+#if defined(_MSC_VER)
+    unsigned long idx;
+    _BitScanForward64(&idx, x);
+    return static_cast<int>(idx);
+#else
+    return __builtin_ctzll(x);
+#endif
+}
 
-    if (ll.request().size == 0) {
-        throw std::runtime_error("Error in line counting.");
-        err_code = 2;
-        return py::make_tuple(py::none(), py::none(), py::none(), err_code);
-    }
-    py::tuple hist_result = rqa_histlines(ll, minl);
-    py::array lh = hist_result[0].cast<py::array>();
-    py::list llmnsd = hist_result[1].cast<py::list>();
-
-    // Compute entropy from diagonal histogram
-    py::list entropy;
-    if (lh.request().size > 2) {
-        auto buf_lh = lh.request();
-        int rows = buf_lh.shape[0];
-        std::vector<float> freq(rows);
-        float* lh_ptr = static_cast<float*>(buf_lh.ptr);
-        for (int i = 0; i < rows; i++) {
-            freq[i] = lh_ptr[i * 2 + 1];
-        }
-        auto freq_array = py::array_t<float>({rows});
-        auto buf_freq = freq_array.request();
-        float* freq_ptr = static_cast<float*>(buf_freq.ptr);
-        for (int i = 0; i < rows; i++)
-            freq_ptr[i] = freq[i];
-        entropy = rqa_entropy(freq_array, maxl_poss - minl + 1);
-    } else {
-        entropy = py::list();
-        entropy.append(0.0);
-        entropy.append(0.0);
-    }
-
-    auto buf_ll = ll.request();
-    short* ll_ptr = static_cast<short*>(buf_ll.ptr);
-    long long recur_sum = 0;
-    for (size_t i = 0; i < buf_ll.size; i++)
-        recur_sum += ll_ptr[i];
-    double perc_rec = 100.0 * recur_sum / npts;
-    double perc_determ = 0.0;
-    double maxl_found = 0.0;
-    if (lh.request().size > 0) {
-        auto buf_lh = lh.request();
-        int rows = buf_lh.shape[0];
-        double sum_det = 0.0;
-        for (int i = 0; i < rows; i++) {
-            float l_val = static_cast<float*>(buf_lh.ptr)[i * 2];
-            float count_val = static_cast<float*>(buf_lh.ptr)[i * 2 + 1];
-            sum_det += l_val * count_val;
-            if (l_val > maxl_found)
-                maxl_found = l_val;
-        }
-        perc_determ = 100.0 * sum_det / recur_sum;
-    }
-    
-    // Compute vertical line metrics
-    py::tuple vert_result = rqa_vertical(td, minl);
-    py::array vert_lines = vert_result[0].cast<py::array>();
-    double laminarity = vert_result[1].cast<double>();
-    double trapping_time = vert_result[2].cast<double>();
-    int Vmax = vert_result[3].cast<int>();
-
-    // Compute divergence as inverse of the maximum diagonal line length.
-    double divergence = (maxl_found > 0 ? 1.0 / maxl_found : 0.0);
+struct BitMatrix {
+    int rows;
+    int cols;
+    int words_per_row;
+    std::vector<uint64_t> bits;
 
-    py::dict rs;
-    rs["rescale"]       = rescale;
-    rs["rad"]           = rad;
-    rs["diag_ignore"]   = diag_ignore;
-    rs["minl"]          = minl;
-    rs["perc_recur"]    = perc_rec;
-    rs["perc_determ"]   = perc_determ;
-    rs["npts"]          = npts;
-    rs["entropy"]       = entropy[0].cast<double>();
-    rs["complexity"]    = entropy[1].cast<double>();
-    rs["maxl_poss"]     = maxl_poss;
-    rs["maxl_found"]    = maxl_found;
-    rs["trend_lower_diag"]     = trend1;
-    rs["trend_upper_diag"]     = trend2;
-    rs["mean_line_length"]     = llmnsd[0].cast<double>();
-    rs["std_line_length"]      = llmnsd[1].cast<double>();
-    rs["count_line"]    = llmnsd[2].cast<int>();
-    rs["laminarity"]    = laminarity;
-    rs["trapping_time"] = trapping_time;
-    rs["vmax"]          = Vmax;
-    rs["divergence"]    = divergence;
+    BitMatrix(int r, int c)
+        : rows(r), cols(c), words_per_row((c + 63) / 64),
+          bits(static_cast<size_t>(r) * ((c + 63) / 64), 0) {}
 
-    py::dict mats;
-    mats["rescale"]     = rescale;
-    mats["rad"]         = rad;
-    mats["diag_ignore"] = diag_ignore;
-    mats["minl"]        = minl;
-    mats["td"]          = td;
-    mats["ll"]          = ll;
-    mats["lh"]          = lh;
-    mats["vertical"]    = vert_lines;
+    uint64_t* row(int i) { return bits.data() + static_cast<size_t>(i) * words_per_row; }
+    const uint64_t* row(int i) const { return bits.data() + static_cast<size_t>(i) * words_per_row; }
 
-    return py::make_tuple(td, rs, mats, err_code);
+    bool get(int i, int j) const { return (row(i)[j >> 6] >> (j & 63)) & 1ULL; }
+
+    long long count() const {
+        long long total = 0;
+        for (uint64_t w : bits)
+            total += popcount64(w);
+        return total;
+    }
+
+    py::array_t<bool> to_numpy() const {
+        auto out = py::array_t<bool>({rows, cols});
+        bool* out_ptr = static_cast<bool*>(out.request().ptr);
+        {
+            py::gil_scoped_release release;
+            for (int i = 0; i < rows; i++) {
+                const uint64_t* r = row(i);
+                bool* o = out_ptr + static_cast<size_t>(i) * cols;
+                for (int j = 0; j < cols; j++)
+                    o[j] = (r[j >> 6] >> (j & 63)) & 1ULL;
+            }
+        }
+        return out;
+    }
+};
+
+// Zero the cells of packed row i that lie within diag_ignore of the main diagonal.
+static void clear_diag_band(int n, int i, int diag_ignore, uint64_t* out) {
+    int lo = std::max(0, i - diag_ignore + 1);
+    int hi = std::min(n - 1, i + diag_ignore - 1);
+    for (int j = lo; j <= hi; j++)
+        out[j >> 6] &= ~(1ULL << (j & 63));
+}
+
+// Threshold one row of distances into packed words (same rules as rqa_radius).
+static void threshold_row_bits(const float* dist_row, int n, int i, int rescale, double scale,
+                               float rad, int diag_ignore, uint64_t* out) {
+    int words = (n + 63) / 64;
+    std::fill(out, out + words, 0ULL);
+    for (int j = 0; j < n; j++)
+        if (rescaled(dist_row[j], rescale, scale) <= rad)
+            out[j >> 6] |= 1ULL << (j & 63);
+    clear_diag_band(n, i, diag_ignore, out);
 }
 
 /************************************
- * Module definition
+ * LineScan
+ *
+ * Word-level diagonal and vertical line extraction, fed one packed
+ * row at a time (top to bottom). Runs are tracked per diagonal and
+ * per column; only set bits and line ends are visited, found with
+ * ctz over whole words. Line lengths go straight into histograms.
+ *
+ * For multithreading, each thread scans its own block of rows with
+ * split = true: runs touching the first or last row of the block are
+ * kept aside (heads, tails, full) instead of being counted, and
+ * merge_linescans stitches them across block borders.
  ************************************/
-PYBIND11_MODULE(rqa_utils_cpp, m) {
-    m.doc() = "High-performance RQA utilities implemented in C++ using pybind11";
+struct LineRun {
+    int idx;   // diagonal or column index
+    int len;
+};
 
-    m.def("rqa_dist", &rqa_dist,
-          "Compute distances between embedded vectors",
-          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"));
+struct LineScan {
+    int n;
+    int row0;                            // first row fed to this scan
+    int row;                             // next row to be fed
+    bool split;
+    int words;
+    std::vector<uint64_t> prev;          // previous row
+    std::vector<uint64_t> prev_shift;    // bit j = previous row, column j - 1
+    std::vector<int> diag_run;           // open run length per diagonal (j - i + n - 1)
+    std::vector<int> vert_run;           // open run length per column
+    std::vector<long long> diag_count;   // recurrent points per diagonal
+    std::vector<long long> diag_hist;    // diag_hist[l] = number of diagonal lines of length l
+    std::vector<long long> vert_hist;    // vert_hist[l] = number of vertical lines of length l
+    // split mode only: runs starting in the first row (heads), reaching the
+    // last row (tails), or both (full).
+    std::vector<LineRun> diag_heads, diag_tails, diag_full;
+    std::vector<LineRun> vert_heads, vert_tails, vert_full;
 
-    m.def("rqa_radius", &rqa_radius,
-          "Threshold the distance matrix",
-          py::arg("dist"), py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"));
+    explicit LineScan(int n_, int row0_ = 0, bool split_ = false)
+        : n(n_), row0(row0_), row(row0_), split(split_), words((n_ + 63) / 64),
+          prev(words, 0), prev_shift(words, 0),
+          diag_run(2 * n_ - 1, 0), vert_run(n_, 0), diag_count(2 * n_ - 1, 0),
+          diag_hist(n_ + 1, 0), vert_hist(n_ + 1, 0) {}
 
-    m.def("rqa_line", &rqa_line,
-          "Find diagonal lines and compute trends in a thresholded matrix",
-          py::arg("thrd"), py::arg("diag_ignore"));
+    // A run of length len ended in row end_row.
+    void close(std::vector<long long>& hist, std::vector<LineRun>& heads, int idx, int len, int end_row) {
+        if (split && end_row - len + 1 == row0)
+            heads.push_back({idx, len});
+        else
+            hist[len]++;
+    }
 
-    m.def("rqa_histlines", &rqa_histlines,
-          "Compute the histogram of line lengths and stats",
-          py::arg("llengths"), py::arg("minl"));
+    void push(const uint64_t* cur) {
+        int i = row;
+        for (int w = 0; w < words; w++) {
+            // Diagonal runs ending in the previous row: (i-1, j) set, (i, j+1) clear.
+            uint64_t cur_next = (cur[w] >> 1) | (w + 1 < words ? cur[w + 1] << 63 : 0ULL);
+            uint64_t diag_end = prev[w] & ~cur_next;
+            while (diag_end) {
+                int j = w * 64 + ctz64(diag_end);
+                int d = j - (i - 1) + n - 1;
+                close(diag_hist, diag_heads, d, diag_run[d], i - 1);
+                diag_end &= diag_end - 1;
+            }
+            // Vertical runs ending in the previous row.
+            uint64_t vert_end = prev[w] & ~cur[w];
+            while (vert_end) {
+                int j = w * 64 + ctz64(vert_end);
+                close(vert_hist, vert_heads, j, vert_run[j], i - 1);
+                vert_end &= vert_end - 1;
+            }
+            // Start or extend runs for the set bits of this row.
+            uint64_t x = cur[w];
+            while (x) {
+                int b = ctz64(x);
+                int j = w * 64 + b;
+                int d = j - i + n - 1;
+                diag_count[d]++;
+                diag_run[d] = ((prev_shift[w] >> b) & 1ULL) ? diag_run[d] + 1 : 1;
+                vert_run[j] = ((prev[w] >> b) & 1ULL) ? vert_run[j] + 1 : 1;
+                x &= x - 1;
+            }
+        }
+        for (int w = 0; w < words; w++) {
+            prev_shift[w] = (cur[w] << 1) | (w > 0 ? cur[w - 1] >> 63 : 0ULL);
+            prev[w] = cur[w];
+        }
+        row++;
+    }
 
-    m.def("rqa_entropy", &rqa_entropy,
-          "Compute Shannon entropy of a distribution",
+    // Close all runs that reach the last row.
+    void finish() {
+        int i = row - 1;
+        for (int w = 0; w < words; w++) {
+            uint64_t x = prev[w];
+            while (x) {
+                int j = w * 64 + ctz64(x);
+                int d = j - i + n - 1;
+                if (split) {
+                    bool from_top = (i - diag_run[d] + 1 == row0);
+                    (from_top ? diag_full : diag_tails).push_back({d, diag_run[d]});
+                    from_top = (i - vert_run[j] + 1 == row0);
+                    (from_top ? vert_full : vert_tails).push_back({j, vert_run[j]});
+                } else {
+                    diag_hist[diag_run[d]]++;
+                    vert_hist[vert_run[j]]++;
+                }
+                x &= x - 1;
+            }
+        }
+    }
+};
+
+// Join the runs of consecutive row blocks. carry[idx] is the length of the
+// run still open at the bottom of the previous block.
+static void stitch_runs(std::vector<long long>& hist, std::vector<int>& carry, std::vector<int>& open,
+                        const std::vector<LineRun>& heads, const std::vector<LineRun>& full,
+                        const std::vector<LineRun>& tails) {
+    std::vector<LineRun> next;
+    for (const LineRun& r : full) {
+        next.push_back({r.idx, carry[r.idx] + r.len});
+        carry[r.idx] = 0;
+    }
+    for (const LineRun& r : heads) {
+        hist[carry[r.idx] + r.len]++;
+        carry[r.idx] = 0;
+    }
+    for (int idx : open) {
+        if (carry[idx] > 0) {
+            hist[carry[idx]]++;
+            carry[idx] = 0;
+        }
+    }
+    next.insert(next.end(), tails.begin(), tails.end());
+    open.clear();
+    for (const LineRun& r : next) {
+        carry[r.idx] = r.len;
+        open.push_back(r.idx);
+    }
+}
+
+template <typename Scan>
+static Scan merge_linescans(std::vector<std::unique_ptr<Scan>>& parts) {
+    int n = parts[0]->n;
+    Scan total(n);
+    std::vector<int> diag_carry(total.diag_run.size(), 0), vert_carry(total.vert_run.size(), 0);
+    std::vector<int> diag_open, vert_open;
+    for (auto& p : parts) {
+        for (size_t k = 0; k < total.diag_count.size(); k++)
+            total.diag_count[k] += p->diag_count[k];
+        for (size_t l = 0; l < total.diag_hist.size(); l++) {
+            total.diag_hist[l] += p->diag_hist[l];
+            total.vert_hist[l] += p->vert_hist[l];
+        }
+        stitch_runs(total.diag_hist, diag_carry, diag_open, p->diag_heads, p->diag_full, p->diag_tails);
+        stitch_runs(total.vert_hist, vert_carry, vert_open, p->vert_heads, p->vert_full, p->vert_tails);
+    }
+    for (int idx : diag_open)
+        total.diag_hist[diag_carry[idx]]++;
+    for (int idx : vert_open)
+        total.vert_hist[vert_carry[idx]]++;
+    return total;
+}
+
+// Per-thread buffers handed to the get_row callbacks of scan_rows and
+// scan_tri_rows: a distance row of length n and one packed row, so
+// callers can compute and threshold rows on the fly without storing
+// the recurrence matrix.
+struct RowScratch {
+    std::vector<float> dist;
+    std::vector<uint64_t> bits;
+
+    explicit RowScratch(int n) : dist(n), bits((n + 63) / 64) {}
+};
+
+// Scan the n rows of a square recurrence matrix with up to n_threads row
+// blocks. get_row(i, scratch) returns packed row i (see RowScratch).
+template <typename RowFn>
+static LineScan scan_rows(int n, int n_threads, RowFn get_row) {
+    int chunks = num_chunks(n, n_threads, 64);
+    std::vector<std::unique_ptr<LineScan>> parts(chunks);
+    parallel_for(n, chunks, [&](int c, int begin, int end) {
+        parts[c].reset(new LineScan(n, begin, chunks > 1));
+        RowScratch scratch(n);
+        for (int i = begin; i < end; i++)
+            parts[c]->push(get_row(i, scratch));
+        parts[c]->finish();
+    });
+    if (chunks == 1)
+        return std::move(*parts[0]);
+    return merge_linescans(parts);
+}
+
+// Least-squares slope (x 1000) of %REC against distance from the main diagonal.
+static double diag_trend(const std::vector<double>& x, const std::vector<double>& y) {
+    if (y.size() < 2)
+        return 0.0;
+    double sum_x = std::accumulate(x.begin(), x.end(), 0.0);
+    double sum_y = std::accumulate(y.begin(), y.end(), 0.0);
+    double sum_xx = 0.0, sum_xy = 0.0;
+    size_t valid_count = y.size();
+    for (size_t i = 0; i < valid_count; i++) {
+        sum_xx += x[i] * x[i];
+        sum_xy += x[i] * y[i];
+    }
+    double denom = valid_count * sum_xx - sum_x * sum_x;
+    if (denom == 0)
+        return 0.0;
+    return 1000 * ((valid_count * sum_xy - sum_x * sum_y) / denom);
+}
+
+/************************************
+ * linescan_stats
+ *
+ * Build the rs dict from a finished LineScan. Produces the same
+ * measures as rqa_line / rqa_histlines / rqa_entropy / rqa_vertical,
+ * but from line-length histograms instead of per-line arrays.
+ ************************************/
+static py::dict linescan_stats(const LineScan& ls, int rescale, float rad, int diag_ignore, int minl) {
+    int n = ls.n;
+    int diagCount = 2 * n - 1;
+
+    long long recur_sum = 0;
+    for (size_t l = 1; l < ls.diag_hist.size(); l++)
+        recur_sum += static_cast<long long>(l) * ls.diag_hist[l];
+    if (recur_sum == 0)
+        throw std::runtime_error("Error in line counting.");
+
+    // Diagonal line statistics for lines >= minl
+    HistMoments m = hist_moments(ls.diag_hist, minl);
+    long long count = m.count, sum_det = m.sum;
+    int maxl_found = m.maxl;
+
+    // Shannon entropy of the diagonal line length distribution
+    int maxl_poss = n - diag_ignore;
+    double entropy = 0.0, complexity = 0.0;
+    if (m.unique > 1) {
+        for (size_t l = std::max(minl, 1); l < ls.diag_hist.size(); l++) {
+            if (ls.diag_hist[l] > 0) {
+                double p = static_cast<double>(ls.diag_hist[l]) / count;
+                entropy -= p * std::log(p) / std::log(2.0);
+            }
+        }
+        complexity = std::log(maxl_poss - minl + 1) / std::log(2.0) - entropy;
+    }
+
+    // Vertical line statistics
+    long long vertical_total = 0, vertical_sum_valid = 0, count_valid = 0;
+    int Vmax = 0;
+    for (size_t l = 1; l < ls.vert_hist.size(); l++) {
+        long long c = ls.vert_hist[l];
+        if (c == 0)
+            continue;
+        vertical_total += static_cast<long long>(l) * c;
+        if (static_cast<int>(l) >= minl) {
+            vertical_sum_valid += static_cast<long long>(l) * c;
+            count_valid += c;
+            Vmax = static_cast<int>(l);
+        }
+    }
+    double laminarity = (vertical_total > 0) ? static_cast<double>(vertical_sum_valid) / vertical_total : 0.0;
+    double trapping_time = (count_valid > 0) ? static_cast<double>(vertical_sum_valid) / count_valid : 0.0;
+
+    // Trends of %REC along the diagonals below and above the main diagonal
+    int mid = n - 1;
+    std::vector<float> ratio(diagCount);
+    for (int k = 0; k < diagCount; k++)
+        ratio[k] = static_cast<float>(ls.diag_count[k]) / static_cast<float>(n - std::abs(k - mid));
+    std::vector<double> x_lower, y_lower, x_upper, y_upper;
+    for (int k = 0; k < n - diag_ignore; k++) {
+        x_lower.push_back(diag_ignore + k);
+        y_lower.push_back(100.0 * ratio[mid - diag_ignore - k]);
+        x_upper.push_back(diag_ignore + k);
+        y_upper.push_back(100.0 * ratio[mid + diag_ignore + k]);
+    }
+    double trend1 = diag_trend(x_lower, y_lower);
+    double trend2 = diag_trend(x_upper, y_upper);
+
+    long long npts = static_cast<long long>(n) * n;
+    if (diag_ignore != 0)
+        npts = npts - n - 2LL * n * (diag_ignore - 1) + static_cast<long long>(diag_ignore) * (diag_ignore - 1);
+
+    py::dict rs;
+    rs["rescale"]       = rescale;
+    rs["rad"]           = rad;
+    rs["diag_ignore"]   = diag_ignore;
+    rs["minl"]          = minl;
+    rs["perc_recur"]    = 100.0 * recur_sum / npts;
+    rs["perc_determ"]   = 100.0 * sum_det / recur_sum;
+    rs["npts"]          = npts;
+    rs["entropy"]       = entropy;
+    rs["complexity"]    = complexity;
+    rs["maxl_poss"]     = maxl_poss;
+    rs["maxl_found"]    = static_cast<double>(maxl_found);
+    rs["trend_lower_diag"]     = trend1;
+    rs["trend_upper_diag"]     = trend2;
+    rs["mean_line_length"]     = m.mean;
+    rs["std_line_length"]      = m.std;
+    rs["count_line"]    = count;
+    rs["laminarity"]    = laminarity;
+    rs["trapping_time"] = trapping_time;
+    rs["vmax"]          = Vmax;
+    rs["divergence"]    = (maxl_found > 0 ? 1.0 / maxl_found : 0.0);
+    return rs;
+}
+
+// (td, rs, mats, err_code) result tuple. Without return_matrices, td and
+// mats are None and only rs is built.
+static py::tuple linescan_result(const LineScan& ls, py::object td, int rescale, float rad,
+                                 int diag_ignore, int minl, bool return_matrices = true) {
+    int err_code = 0;
+    py::dict rs = linescan_stats(ls, rescale, rad, diag_ignore, minl);
+    if (!return_matrices)
+        return py::make_tuple(py::none(), rs, py::none(), err_code);
+
+    py::dict mats;
+    mats["rescale"]     = rescale;
+    mats["rad"]         = rad;
+    mats["diag_ignore"] = diag_ignore;
+    mats["minl"]        = minl;
+    mats["td"]          = td;
+    mats["lh"]          = hist_table(ls.diag_hist, minl);
+    mats["vh"]          = hist_table(ls.vert_hist, minl);
+
+    return py::make_tuple(td, rs, mats, err_code);
+}
+
+/************************************
+ * rqa_radius_bits / rqa_stream_bits / rqa_pack_bits
+ *
+ * Bit-packed counterparts of rqa_radius, rqa_stream and an int8 td.
+ ************************************/
+BitMatrix rqa_radius_bits(py::array_t<float> dist, int rescale, float rad, int diag_ignore, int n_threads) {
+    auto buf = dist.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Distance matrix must be square");
+    int n = buf.shape[0];
+    check_radius_args(n, rad, diag_ignore);
+
+    const float* dist_ptr = static_cast<const float*>(buf.ptr);
+    py::gil_scoped_release release;
+    double scale = matrix_rescale_factor(dist_ptr, n, rescale, n_threads);
+
+    BitMatrix bm(n, n);
+    parallel_for(n, num_chunks(n, n_threads), [&](int, int begin, int end) {
+        for (int i = begin; i < end; i++)
+            threshold_row_bits(dist_ptr + static_cast<size_t>(i) * n, n, i, rescale, scale, rad, diag_ignore, bm.row(i));
+    });
+    return bm;
+}
+
+BitMatrix rqa_stream_bits(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                          int rescale, float rad, int diag_ignore, int n_threads, std::string norm) {
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    int n = e.n2;
+    check_radius_args(n, rad, diag_ignore);
+
+    py::gil_scoped_release release;
+    double scale = rescale_factor(e, rescale, n_threads);
+    BitMatrix bm(n, n);
+    parallel_for(n, num_chunks(n, n_threads), [&](int, int begin, int end) {
+        std::vector<float> row(n);
+        for (int i = begin; i < end; i++) {
+            distance_row(e, i, row.data());
+            threshold_row_bits(row.data(), n, i, rescale, scale, rad, diag_ignore, bm.row(i));
+        }
+    });
+    return bm;
+}
+
+BitMatrix rqa_pack_bits(py::array_t<int8_t> thrd) {
+    auto buf = thrd.request();
+    if (buf.ndim != 2)
+        throw std::runtime_error("Thresholded matrix must be two-dimensional");
+    int rows = buf.shape[0];
+    int cols = buf.shape[1];
+    const int8_t* data = static_cast<const int8_t*>(buf.ptr);
+    py::gil_scoped_release release;
+    BitMatrix bm(rows, cols);
+    for (int i = 0; i < rows; i++) {
+        uint64_t* r = bm.row(i);
+        for (int j = 0; j < cols; j++)
+            if (data[static_cast<size_t>(i) * cols + j] == 1)
+                r[j >> 6] |= 1ULL << (j & 63);
+    }
+    return bm;
+}
+
+/************************************
+ * rqa_stats_bits
+ *
+ * Full RQA on a bit-packed recurrence matrix. %REC is the popcount of
+ * the matrix; diagonal and vertical lines come from LineScan.
+ * Returns (td, rs, mats, err_code) like rqa_stats; mats holds the
+ * diagonal (lh) and vertical (vh) line histograms instead of the
+ * per-line arrays.
+ ************************************/
+py::tuple rqa_stats_bits(py::object td, int rescale, float rad, int diag_ignore, int minl,
+                         std::string rqa_mode, int n_threads) {
+    const BitMatrix& bm = td.cast<const BitMatrix&>();
+    if (bm.rows != bm.cols)
+        throw std::runtime_error("Recurrence matrix must be square");
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+
+    std::unique_ptr<LineScan> ls;
+    {
+        py::gil_scoped_release release;
+        if (bm.count() == 0)
+            throw std::runtime_error("Error in line counting.");
+        ls.reset(new LineScan(scan_rows(bm.rows, n_threads, [&bm](int i, RowScratch&) {
+            return bm.row(i);
+        })));
+    }
+    return linescan_result(*ls, td, rescale, rad, diag_ignore, minl);
+}
+
+/************************************
+ * rqa_stats_scan
+ *
+ * Stats-only rqa_stats: each distance row is thresholded into a
+ * per-thread packed row and fed straight to the line scan, so neither
+ * the n x n int8 td nor the per-line ll / vertical arrays are built.
+ * rs equals that of rqa_stats.
+ ************************************/
+static py::tuple rqa_stats_scan(py::array_t<float> d, int rescale, float rad, int diag_ignore, int minl,
+                                int n_threads) {
+    auto buf = d.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Error in thresholding: Distance matrix must be square");
+    int n = buf.shape[0];
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+
+    const float* dist_ptr = static_cast<const float*>(buf.ptr);
+    std::unique_ptr<LineScan> ls;
+    {
+        py::gil_scoped_release release;
+        double scale = matrix_rescale_factor(dist_ptr, n, rescale, n_threads);
+        ls.reset(new LineScan(scan_rows(n, n_threads, [&](int i, RowScratch& s) {
+            threshold_row_bits(dist_ptr + static_cast<size_t>(i) * n, n, i, rescale, scale, rad, diag_ignore,
+                               s.bits.data());
+            return static_cast<const uint64_t*>(s.bits.data());
+        })));
+    }
+    return linescan_result(*ls, py::none(), rescale, rad, diag_ignore, minl, false);
+}
+
+/************************************
+ * rqa_stats
+ *
+ * Perform full Recurrence Quantification Analysis (RQA) on a distance matrix.
+ *
+ * Parameters:
+ *   - rqa_mode: "auto" or "cross". For "auto", diag_ignore is used;
+ *               for "cross", no diagonals are ignored.
+ *
+ * Additional vertical metrics (LAM, TT, Vmax) and divergence (1/Lmax) are added.
+ * Lines are counted into 64-bit length histograms (LineScan) and every
+ * measure is computed from them; mats holds the diagonal (lh) and
+ * vertical (vh) histograms. The per-line arrays ll (diagonal, in
+ * diagonal order) and vertical (in column order) are only built with
+ * return_lines.
+ ************************************/
+// Statistics on an already thresholded matrix. Everything up to building
+// the result dicts runs with the GIL released.
+static py::tuple rqa_stats_thresholded(py::array_t<int8_t> td, int rescale, float rad, int diag_ignore, int minl,
+                                       int n_threads, bool return_lines) {
+    auto buf = td.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Thresholded distance matrix must be square");
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    int n = buf.shape[0];
+    const int8_t* data = static_cast<const int8_t*>(buf.ptr);
+
+    std::unique_ptr<LineScan> ls;
+    DiagLines dl;
+    VerticalLines vl;
+    {
+        py::gil_scoped_release release;
+        ls.reset(new LineScan(scan_rows(n, n_threads, [&](int i, RowScratch& s) {
+            const int8_t* row = data + static_cast<size_t>(i) * n;
+            uint64_t* out = s.bits.data();
+            std::fill(out, out + s.bits.size(), 0ULL);
+            for (int j = 0; j < n; j++)
+                if (row[j] == 1)
+                    out[j >> 6] |= 1ULL << (j & 63);
+            return static_cast<const uint64_t*>(out);
+        })));
+        if (return_lines) {
+            dl = diag_lines(data, n, diag_ignore, n_threads);
+            vl = vertical_lines(data, n, minl, n_threads);
+        }
+    }
+
+    py::tuple result = linescan_result(*ls, td, rescale, rad, diag_ignore, minl);
+    if (return_lines) {
+        py::dict mats = result[2];
+        mats["ll"]       = int_array(dl.ll);
+        mats["vertical"] = int_array(vl.lengths);
+    }
+    return result;
+}
+
+// With return_matrices false, only rs is computed (see rqa_stats_scan) and
+// (None, rs, None, err_code) is returned.
+py::tuple rqa_stats(py::array_t<float> d, int rescale, float rad, int diag_ignore, int minl,
+                    std::string rqa_mode, int n_threads, bool return_matrices, bool return_lines) {
+    // For cross recurrence, ignore no diagonals.
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (!return_matrices)
+        return rqa_stats_scan(d, rescale, rad, diag_ignore, minl, n_threads);
+
+    py::array_t<int8_t> td;
+    try {
+        td = rqa_radius(d, rescale, rad, diag_ignore, n_threads);
+    } catch (std::runtime_error &e) {
+        throw std::runtime_error("Error in thresholding: " + std::string(e.what()));
+    }
+    return rqa_stats_thresholded(td, rescale, rad, diag_ignore, minl, n_threads, return_lines);
+}
+
+/************************************
+ * rqa_stats_stream
+ *
+ * Same as rqa_stats, but takes the two (normalised) series and the
+ * embedding parameters instead of a precomputed distance matrix.
+ * Distances are computed and thresholded row by row into a BitMatrix,
+ * and each packed row is fed to the line scan as soon as it is made,
+ * so the n2 x n2 float matrix is never materialised.
+ ************************************/
+py::tuple rqa_stats_stream(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                           int rescale, float rad, int diag_ignore, int minl,
+                           std::string rqa_mode, int n_threads, std::string norm, bool return_matrices,
+                           bool zscore) {
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm, zscore);
+    int n = e.n2;
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+
+    BitMatrix bm(return_matrices ? n : 0, n);
+    std::unique_ptr<LineScan> ls;
+    {
+        py::gil_scoped_release release;
+        double scale = rescale_factor(e, rescale, n_threads);
+        ls.reset(new LineScan(scan_rows(n, n_threads, [&](int i, RowScratch& s) {
+            uint64_t* out = return_matrices ? bm.row(i) : s.bits.data();
+            distance_row(e, i, s.dist.data());
+            threshold_row_bits(s.dist.data(), n, i, rescale, scale, rad, diag_ignore, out);
+            return static_cast<const uint64_t*>(out);
+        })));
+    }
+
+    py::object td = return_matrices ? py::cast(std::move(bm)) : py::none();
+    return linescan_result(*ls, td, rescale, rad, diag_ignore, minl, return_matrices);
+}
+
+/************************************
+ * rqa_stats_tiled
+ *
+ * Out-of-core RQA for long recordings. The recurrence matrix is made in
+ * square tiles of tile x tile cells: for each band of tile rows, the
+ * threads compute and threshold the tiles of the band (column range by
+ * column range, so each tile of b stays in cache for all rows of the
+ * band) into tile packed rows, which are then fed in order to a single
+ * LineScan. Diagonal and vertical runs crossing tile borders stay open
+ * in the LineScan, so rs equals that of rqa_stats_stream exactly.
+ *
+ * RAM is bounded by the band (tile * n / 8 bytes) plus the O(n) run
+ * state, whatever the length of the recording. If out is given (a
+ * writable (n, (n + 63) / 64) uint64 array, typically a np.memmap),
+ * every band is also stored there: bit j & 63 of word j >> 6 of row i
+ * is cell (i, j), the layout of BitMatrix.words.
+ *
+ * Returns (out or None, rs, None, err_code).
+ ************************************/
+// Threshold the distances from point i to points j0 .. j1-1 into the packed
+// row (j0 a multiple of 64, so threads filling other column ranges of the
+// same row touch other words).
+static void threshold_span_bits(const float* dist, int i, int j0, int j1, int rescale, double scale,
+                                float rad, int diag_ignore, uint64_t* row) {
+    std::fill(row + (j0 >> 6), row + ((j1 + 63) >> 6), 0ULL);
+    for (int j = j0; j < j1; j++)
+        if (rescaled(dist[j - j0], rescale, scale) <= rad)
+            row[j >> 6] |= 1ULL << (j & 63);
+    for (int j = std::max(j0, i - diag_ignore + 1); j < std::min(j1, i + diag_ignore); j++)
+        row[j >> 6] &= ~(1ULL << (j & 63));
+}
+
+py::tuple rqa_stats_tiled(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                          int rescale, float rad, int diag_ignore, int minl, std::string rqa_mode,
+                          int tile, int n_threads, std::string norm, py::object out) {
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    if (tile < 1)
+        throw std::runtime_error("Please use a tile size of at least one cell");
+
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    int n = e.n2;
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+    int words = (n + 63) / 64;
+    tile = std::min(((tile + 63) / 64) * 64, words * 64);
+
+    uint64_t* out_ptr = nullptr;
+    if (!out.is_none()) {
+        if (!py::isinstance<py::array_t<uint64_t>>(out))
+            throw std::runtime_error("out must be a uint64 array");
+        auto buf = py::reinterpret_borrow<py::array_t<uint64_t>>(out).request(true);
+        if (buf.ndim != 2 || buf.shape[0] != n || buf.shape[1] != words
+                || buf.strides[1] != static_cast<py::ssize_t>(sizeof(uint64_t))
+                || buf.strides[0] != static_cast<py::ssize_t>(words * sizeof(uint64_t)))
+            throw std::runtime_error("out must be a C-contiguous (n, (n + 63) / 64) uint64 array");
+        out_ptr = static_cast<uint64_t*>(buf.ptr);
+    }
+
+    LineScan ls(n);
+    {
+        py::gil_scoped_release release;
+        double scale = rescale_factor(e, rescale, n_threads);
+        int col_tiles = (n + tile - 1) / tile;
+        int chunks = num_chunks(col_tiles, n_threads);
+        std::vector<uint64_t> band(static_cast<size_t>(tile) * words);
+        for (int i0 = 0; i0 < n; i0 += tile) {
+            int i1 = std::min(n, i0 + tile);
+            parallel_for(col_tiles, chunks, [&](int, int begin, int end) {
+                std::vector<float> dist(tile);
+                for (int t = begin; t < end; t++) {
+                    int j0 = t * tile, j1 = std::min(n, j0 + tile);
+                    for (int i = i0; i < i1; i++) {
+                        distance_span(e, i, j0, j1, dist.data());
+                        threshold_span_bits(dist.data(), i, j0, j1, rescale, scale, rad, diag_ignore,
+                                            band.data() + static_cast<size_t>(i - i0) * words);
+                    }
+                }
+            });
+            for (int i = i0; i < i1; i++)
+                ls.push(band.data() + static_cast<size_t>(i - i0) * words);
+            if (out_ptr)
+                std::copy(band.begin(), band.begin() + static_cast<size_t>(i1 - i0) * words,
+                          out_ptr + static_cast<size_t>(i0) * words);
+        }
+        ls.finish();
+    }
+
+    py::dict rs = linescan_stats(ls, rescale, rad, diag_ignore, minl);
+    return py::make_tuple(out, rs, py::none(), 0);
+}
+
+/************************************
+ * TriBitMatrix
+ *
+ * Packed upper triangle of a symmetric (auto-RQA) recurrence matrix.
+ * Row i holds bits k = 0 .. n-1-i for cell (i, i + k), so bit k of
+ * every row lies on diagonal k; each row is padded to a whole word.
+ * The lower triangle is implied by symmetry, so this takes about half
+ * the memory of a BitMatrix.
+ ************************************/
+struct TriBitMatrix {
+    int n;
+    std::vector<size_t> offsets;         // first word of row i; offsets[n] = total words
+    std::vector<uint64_t> bits;
+
+    explicit TriBitMatrix(int n_) : n(n_), offsets(n_ + 1, 0) {
+        for (int i = 0; i < n; i++)
+            offsets[i + 1] = offsets[i] + (n - i + 63) / 64;
+        bits.assign(offsets[n], 0);
+    }
+
+    uint64_t* row(int i) { return bits.data() + offsets[i]; }
+    const uint64_t* row(int i) const { return bits.data() + offsets[i]; }
+
+    bool get(int i, int j) const {
+        if (j < i)
+            std::swap(i, j);
+        int k = j - i;
+        return (row(i)[k >> 6] >> (k & 63)) & 1ULL;
+    }
+
+    // Recurrent points of the full matrix: off-diagonal cells count twice.
+    long long count() const {
+        long long upper = 0, main = 0;
+        for (uint64_t w : bits)
+            upper += popcount64(w);
+        for (int i = 0; i < n; i++)
+            main += row(i)[0] & 1ULL;
+        return 2 * upper - main;
+    }
+
+    py::array_t<bool> to_numpy() const {
+        auto out = py::array_t<bool>({n, n});
+        bool* out_ptr = static_cast<bool*>(out.request().ptr);
+        {
+            py::gil_scoped_release release;
+            std::fill(out_ptr, out_ptr + static_cast<size_t>(n) * n, false);
+            for (int i = 0; i < n; i++) {
+                const uint64_t* r = row(i);
+                for (size_t w = 0; w < offsets[i + 1] - offsets[i]; w++) {
+                    uint64_t x = r[w];
+                    while (x) {
+                        int j = i + static_cast<int>(w) * 64 + ctz64(x);
+                        out_ptr[static_cast<size_t>(i) * n + j] = true;
+                        out_ptr[static_cast<size_t>(j) * n + i] = true;
+                        x &= x - 1;
+                    }
+                }
+            }
+        }
+        return out;
+    }
+};
+
+// Threshold the distances from point i to points i .. n-1 into packed
+// triangle row i (same rules as rqa_radius). span[k] is the distance to
+// point i + k; cells with k < diag_ignore are left clear.
+static void threshold_tri_row(const float* span, int n, int i, int rescale, double scale,
+                              float rad, int diag_ignore, uint64_t* out) {
+    int len = n - i;
+    std::fill(out, out + (len + 63) / 64, 0ULL);
+    for (int k = std::max(diag_ignore, 0); k < len; k++)
+        if (rescaled(span[k], rescale, scale) <= rad)
+            out[k >> 6] |= 1ULL << (k & 63);
+}
+
+// Row blocks [bounds[c], bounds[c+1]) of the upper triangle holding about
+// the same number of cells each.
+static std::vector<int> tri_row_bounds(int n, int chunks) {
+    std::vector<int> bounds(chunks + 1, n);
+    bounds[0] = 0;
+    for (int c = 1; c < chunks; c++) {
+        int b = n - static_cast<int>(std::lround(n * std::sqrt(1.0 - static_cast<double>(c) / chunks)));
+        bounds[c] = std::min(n, std::max(bounds[c - 1], b));
+    }
+    return bounds;
+}
+
+// rescale_factor for auto-RQA from the upper triangle only. The max does
+// not depend on order. For the mean, row j is summed in column order as
+// rescale_factor does: its lower part d(i, j), i < j, arrives while rows
+// i < j are visited in turn, before row j adds its own upper part. This
+// ordering is sequential, so with several threads the mean is taken over
+// full rows instead, keeping the result bit-identical either way.
+static double rescale_factor_sym(const EmbeddedPair& e, int rescale, int n_threads) {
+    int n = e.n2;
+    int chunks = num_chunks(n, n_threads, 64);
+    if (rescale == 2) {
+        std::vector<float> row_max(n, 0.0f);
+        std::vector<int> bounds = tri_row_bounds(n, chunks);
+        parallel_for(chunks, chunks, [&](int c, int, int) {
+            std::vector<float> span(n);
+            for (int i = bounds[c]; i < bounds[c + 1]; i++) {
+                distance_span(e, i, i, n, span.data());
+                float max_val = 0.0f;
+                for (int k = 0; k < n - i; k++)
+                    if (span[k] > max_val)
+                        max_val = span[k];
+                row_max[i] = max_val;
+            }
+        });
+        return *std::max_element(row_max.begin(), row_max.end());
+    }
+    if (rescale != 1)
+        return 1.0;
+    if (chunks > 1)
+        return rescale_factor(e, rescale, n_threads);
+    std::vector<double> row_sum(n, 0.0);
+    std::vector<float> span(n);
+    for (int i = 0; i < n; i++) {
+        distance_span(e, i, i, n, span.data());
+        double& own = row_sum[i];
+        own += span[0];
+        for (int k = 1; k < n - i; k++) {
+            own += span[k];
+            row_sum[i + k] += span[k];
+        }
+    }
+    return std::accumulate(row_sum.begin(), row_sum.end(), 0.0) / (static_cast<double>(n) * n);
+}
+
+/************************************
+ * TriLineScan
+ *
+ * LineScan for the rows of a TriBitMatrix. As bit k of each packed row
+ * lies on diagonal k, diagonal runs are tracked like vertical runs,
+ * without shifts. Only the upper diagonals k >= 1 are counted here; the
+ * lower ones mirror them and the main diagonal is added separately.
+ *
+ * By symmetry the vertical lines of the full matrix in column j are the
+ * horizontal runs of its row j: the upper cells (i, j), i < j, followed
+ * by row j of the triangle. The first part is tracked as a run per
+ * column and joined at row j to the run starting on the main diagonal;
+ * the other horizontal runs of row j lie within one packed row.
+ *
+ * Split mode (heads, tails, full) works as in LineScan, with the runs of
+ * the columns above the diagonal in vert_*.
+ ************************************/
+struct TriLineScan {
+    int n;
+    int row0;
+    int row;
+    bool split;
+    int words;
+    std::vector<uint64_t> prev;          // previous packed row (plus two zero words)
+    std::vector<int> diag_run;           // open run length per diagonal k
+    std::vector<int> vert_run;           // open run length per column, above the diagonal
+    std::vector<long long> diag_count;   // recurrent points per diagonal k >= 0
+    std::vector<long long> diag_hist;    // upper diagonal lines (k >= 1) only
+    std::vector<long long> vert_hist;    // vertical lines of the full matrix
+    std::vector<LineRun> diag_heads, diag_tails, diag_full;
+    std::vector<LineRun> vert_heads, vert_tails, vert_full;
+
+    explicit TriLineScan(int n_, int row0_ = 0, bool split_ = false)
+        : n(n_), row0(row0_), row(row0_), split(split_), words((n_ + 63) / 64),
+          prev(words + 2, 0), diag_run(n_, 0), vert_run(n_, 0), diag_count(n_, 0),
+          diag_hist(n_ + 1, 0), vert_hist(n_ + 1, 0) {}
+
+    void close(std::vector<long long>& hist, std::vector<LineRun>& heads, int idx, int len, int end_row) {
+        if (split && end_row - len + 1 == row0)
+            heads.push_back({idx, len});
+        else
+            hist[len]++;
+    }
+
+    // Horizontal run of row i over bits [start, start + len).
+    void close_row_run(int i, int start, int len, int above) {
+        if (start > 0) {
+            vert_hist[len]++;
+            return;
+        }
+        // Joined with the run of column i above the diagonal (length above).
+        bool from_top = split && (above > 0 ? i - above == row0 : i == row0);
+        if (from_top)
+            vert_heads.push_back({i, above + len});
+        else
+            vert_hist[above + len]++;
+    }
+
+    void push(const uint64_t* cur) {
+        int i = row;
+        int len = n - i;
+        int cur_words = (len + 63) / 64;
+        int prev_words = (len + 64) / 64;
+        for (int w = 0; w < prev_words; w++) {
+            uint64_t c = w < cur_words ? cur[w] : 0ULL;
+            uint64_t p = prev[w];
+            // p_next bit k = (i-1, i+k): column i + k in the previous row.
+            uint64_t p_next = (p >> 1) | (prev[w + 1] << 63);
+            uint64_t upper = (w == 0) ? ~1ULL : ~0ULL;
+            uint64_t diag_end = p & ~c & upper;
+            while (diag_end) {
+                int k = w * 64 + ctz64(diag_end);
+                close(diag_hist, diag_heads, k, diag_run[k], i - 1);
+                diag_end &= diag_end - 1;
+            }
+            uint64_t vert_end = p_next & ~c & upper;
+            while (vert_end) {
+                int j = i + w * 64 + ctz64(vert_end);
+                close(vert_hist, vert_heads, j, vert_run[j], i - 1);
+                vert_end &= vert_end - 1;
+            }
+            uint64_t x = c;
+            while (x) {
+                int b = ctz64(x);
+                int k = w * 64 + b;
+                diag_count[k]++;
+                if (k > 0) {
+                    diag_run[k] = ((p >> b) & 1ULL) ? diag_run[k] + 1 : 1;
+                    vert_run[i + k] = ((p_next >> b) & 1ULL) ? vert_run[i + k] + 1 : 1;
+                }
+                x &= x - 1;
+            }
+        }
+
+        // Column i ends above the diagonal here; join it to row i.
+        int above = ((prev[0] >> 1) & 1ULL) ? vert_run[i] : 0;
+        if (!(cur[0] & 1ULL) && above > 0)
+            close(vert_hist, vert_heads, i, above, i - 1);
+        int start = 0;
+        for (int w = 0; w < cur_words; w++) {
+            uint64_t c = cur[w];
+            uint64_t before = (c << 1) | (w > 0 ? cur[w - 1] >> 63 : 0ULL);
+            uint64_t after = (c >> 1) | (w + 1 < cur_words ? cur[w + 1] << 63 : 0ULL);
+            uint64_t starts = c & ~before;
+            uint64_t ends = c & ~after;
+            uint64_t x = starts | ends;
+            while (x) {
+                int b = ctz64(x);
+                int k = w * 64 + b;
+                if ((starts >> b) & 1ULL)
+                    start = k;
+                if ((ends >> b) & 1ULL)
+                    close_row_run(i, start, k - start + 1, above);
+                x &= x - 1;
+            }
+        }
+
+        std::copy(cur, cur + cur_words, prev.begin());
+        std::fill(prev.begin() + cur_words, prev.end(), 0ULL);
+        row++;
+    }
+
+    // Runs still open after the last row (only in split mode before row n-1).
+    void finish() {
+        int i = row - 1;
+        if (i < row0)
+            return;
+        for (int w = 0; w < words; w++) {
+            uint64_t x = prev[w] & ((w == 0) ? ~1ULL : ~0ULL);
+            while (x) {
+                int k = w * 64 + ctz64(x);
+                int j = i + k;
+                if (split) {
+                    bool from_top = (i - diag_run[k] + 1 == row0);
+                    (from_top ? diag_full : diag_tails).push_back({k, diag_run[k]});
+                    from_top = (i - vert_run[j] + 1 == row0);
+                    (from_top ? vert_full : vert_tails).push_back({j, vert_run[j]});
+                } else {
+                    diag_hist[diag_run[k]]++;
+                    vert_hist[vert_run[j]]++;
+                }
+                x &= x - 1;
+            }
+        }
+    }
+};
+
+// Scan the rows of an n x n triangle in row blocks of equal area.
+// get_row(i, scratch) returns packed triangle row i.
+template <typename RowFn>
+static TriLineScan scan_tri_rows(int n, int n_threads, RowFn get_row) {
+    int chunks = num_chunks(n, n_threads, 64);
+    std::vector<int> bounds = tri_row_bounds(n, chunks);
+    std::vector<std::unique_ptr<TriLineScan>> parts(chunks);
+    parallel_for(chunks, chunks, [&](int c, int, int) {
+        parts[c].reset(new TriLineScan(n, bounds[c], chunks > 1));
+        RowScratch scratch(n);
+        for (int i = bounds[c]; i < bounds[c + 1]; i++)
+            parts[c]->push(get_row(i, scratch));
+        parts[c]->finish();
+    });
+    if (chunks == 1)
+        return std::move(*parts[0]);
+    return merge_linescans(parts);
+}
+
+// Full-matrix LineScan counts from a triangle scan: each upper diagonal
+// line has a mirror image below, and the main diagonal is counted once.
+static LineScan mirror_tri_scan(const TriLineScan& t, const std::vector<char>& main_diag) {
+    int n = t.n;
+    LineScan ls(n);
+    for (int l = 0; l <= n; l++) {
+        ls.diag_hist[l] = 2 * t.diag_hist[l];
+        ls.vert_hist[l] = t.vert_hist[l];
+    }
+    int run = 0;
+    for (int i = 0; i <= n; i++) {
+        if (i < n && main_diag[i]) {
+            run++;
+        } else if (run > 0) {
+            ls.diag_hist[run]++;
+            run = 0;
+        }
+    }
+    ls.diag_count[n - 1] = t.diag_count[0];
+    for (int k = 1; k < n; k++) {
+        ls.diag_count[n - 1 + k] = t.diag_count[k];
+        ls.diag_count[n - 1 - k] = t.diag_count[k];
+    }
+    return ls;
+}
+
+/************************************
+ * rqa_stream_tri / rqa_stats_stream_sym
+ *
+ * Symmetric path for auto-RQA on one series: only the distances
+ * d(i, j), j >= i, are computed and only the upper triangle is stored,
+ * in a TriBitMatrix. Lower-diagonal statistics (including
+ * trend_lower_diag) follow by symmetry, so the results equal
+ * rqa_stats_stream(a, a, ...) at about half the time and memory.
+ ************************************/
+TriBitMatrix rqa_stream_tri(py::array_t<float> a, int dim, int lag, int rescale, float rad,
+                            int diag_ignore, int n_threads, std::string norm) {
+    EmbeddedPair e = embed_pair(a, a, dim, lag, norm);
+    int n = e.n2;
+    check_radius_args(n, rad, diag_ignore);
+
+    py::gil_scoped_release release;
+    double scale = rescale_factor_sym(e, rescale, n_threads);
+    TriBitMatrix tm(n);
+    int chunks = num_chunks(n, n_threads, 64);
+    std::vector<int> bounds = tri_row_bounds(n, chunks);
+    parallel_for(chunks, chunks, [&](int c, int, int) {
+        std::vector<float> span(n);
+        for (int i = bounds[c]; i < bounds[c + 1]; i++) {
+            distance_span(e, i, i, n, span.data());
+            threshold_tri_row(span.data(), n, i, rescale, scale, rad, diag_ignore, tm.row(i));
+        }
+    });
+    return tm;
+}
+
+py::tuple rqa_stats_stream_sym(py::array_t<float> a, int dim, int lag, int rescale, float rad,
+                               int diag_ignore, int minl, int n_threads, std::string norm,
+                               bool return_matrices, bool zscore) {
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+
+    EmbeddedPair e = embed_pair(a, a, dim, lag, norm, zscore);
+    int n = e.n2;
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+
+    TriBitMatrix tm(return_matrices ? n : 0);
+    std::unique_ptr<LineScan> ls;
+    {
+        py::gil_scoped_release release;
+        double scale = rescale_factor_sym(e, rescale, n_threads);
+        int skip = std::max(diag_ignore, 0);
+        // Main-diagonal bits, for mirror_tri_scan when tm is not kept
+        std::vector<char> main_diag(n, 0);
+        TriLineScan t = scan_tri_rows(n, n_threads, [&](int i, RowScratch& s) {
+            uint64_t* out = return_matrices ? tm.row(i) : s.bits.data();
+            int j0 = std::min(n, i + skip);
+            distance_span(e, i, j0, n, s.dist.data() + (j0 - i));
+            threshold_tri_row(s.dist.data(), n, i, rescale, scale, rad, diag_ignore, out);
+            main_diag[i] = static_cast<char>(out[0] & 1ULL);
+            return static_cast<const uint64_t*>(out);
+        });
+        ls.reset(new LineScan(mirror_tri_scan(t, main_diag)));
+    }
+
+    py::object td = return_matrices ? py::cast(std::move(tm)) : py::none();
+    return linescan_result(*ls, td, rescale, rad, diag_ignore, minl, return_matrices);
+}
+
+/************************************
+ * rqa_rescale_factor
+ *
+ * The rescale factor used by the streaming kernels (mean or max of the
+ * full distance matrix, 1.0 for rescale == 0), for backends that only
+ * look at the recurrent pairs. Streams over all pairs in O(n) memory.
+ ************************************/
+double rqa_rescale_factor(py::array_t<float> a, py::array_t<float> b, int dim, int lag, int rescale,
+                          std::string rqa_mode, int n_threads, std::string norm) {
+    EmbeddedPair e = embed_pair(a, rqa_mode == "cross" ? b : a, dim, lag, norm);
+    py::gil_scoped_release release;
+    if (rqa_mode == "cross")
+        return rescale_factor(e, rescale, n_threads);
+    return rescale_factor_sym(e, rescale, n_threads);
+}
+
+/************************************
+ * SparseRuns
+ *
+ * Diagonal and vertical line runs of a recurrence matrix given as its
+ * recurrent points, fed row by row with increasing columns. Each
+ * diagonal and column remembers the last row in which it had a point,
+ * so the work is O(points + n) rather than O(n^2).
+ ************************************/
+struct SparseRuns {
+    LineScan& ls;
+    int n;
+    std::vector<int> diag_last, vert_last;
+
+    explicit SparseRuns(LineScan& ls_) : ls(ls_), n(ls_.n), diag_last(2 * ls_.n - 1, -2), vert_last(ls_.n, -2) {}
+
+    void add(int i, int j) {
+        int d = j - i + n - 1;
+        ls.diag_count[d]++;
+        if (diag_last[d] == i - 1) {
+            ls.diag_run[d]++;
+        } else {
+            if (diag_last[d] >= 0)
+                ls.diag_hist[ls.diag_run[d]]++;
+            ls.diag_run[d] = 1;
+        }
+        diag_last[d] = i;
+        if (vert_last[j] == i - 1) {
+            ls.vert_run[j]++;
+        } else {
+            if (vert_last[j] >= 0)
+                ls.vert_hist[ls.vert_run[j]]++;
+            ls.vert_run[j] = 1;
+        }
+        vert_last[j] = i;
+    }
+
+    void finish() {
+        for (int d = 0; d < 2 * n - 1; d++)
+            if (diag_last[d] >= 0)
+                ls.diag_hist[ls.diag_run[d]]++;
+        for (int j = 0; j < n; j++)
+            if (vert_last[j] >= 0)
+                ls.vert_hist[ls.vert_run[j]]++;
+    }
+};
+
+/************************************
+ * rqa_stats_sparse
+ *
+ * Full RQA on a square scipy.sparse CSR recurrence matrix (nonzero =
+ * recurrent, column indices sorted within each row), with the line
+ * runs from SparseRuns. The ignored diagonals must already be absent
+ * from td. Returns (td, rs, mats, err_code) like rqa_stats_bits.
+ ************************************/
+py::tuple rqa_stats_sparse(py::object td, int rescale, float rad, int diag_ignore, int minl,
+                           std::string rqa_mode) {
+    using IndexArray = py::array_t<int64_t, py::array::c_style | py::array::forcecast>;
+    py::tuple shape = td.attr("shape");
+    int n = shape[0].cast<int>();
+    if (shape[1].cast<int>() != n)
+        throw std::runtime_error("Recurrence matrix must be square");
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+    IndexArray indptr = IndexArray::ensure(td.attr("indptr"));
+    IndexArray indices = IndexArray::ensure(td.attr("indices"));
+    if (!indptr || !indices || indptr.size() != n + 1)
+        throw std::runtime_error("Recurrence matrix must be in CSR format");
+    const int64_t* ptr = indptr.data();
+    const int64_t* idx = indices.data();
+
+    LineScan ls(n);
+    {
+        py::gil_scoped_release release;
+        SparseRuns runs(ls);
+        for (int i = 0; i < n; i++) {
+            for (int64_t p = ptr[i]; p < ptr[i + 1]; p++) {
+                int j = static_cast<int>(idx[p]);
+                if (j < 0 || j >= n || (p > ptr[i] && idx[p - 1] >= j))
+                    throw std::runtime_error("CSR column indices must be in range, sorted and unique");
+                runs.add(i, j);
+            }
+        }
+        runs.finish();
+    }
+    return linescan_result(ls, td, rescale, rad, diag_ignore, minl);
+}
+
+/************************************
+ * rqa_stats_categorical
+ *
+ * RQA / CRQA of categorical series given as integer category indices
+ * (one index per embedded point, >= 0). Points recur when their
+ * categories are equal, so row i of the recurrence matrix is the sorted
+ * list of positions of category a[i] in b, minus the ignored band.
+ * Those lists come from one counting sort of b; the matrix is emitted
+ * as a scipy.sparse CSR td and its lines are followed with SparseRuns,
+ * so the cost scales with the number of matches rather than n^2.
+ *
+ * rescale and rad are only reported in rs, as with the float path
+ * (which, with a small radius, gives the same matrix).
+ ************************************/
+// Positions of category c in b, with the band |i - j| < diag_ignore left out.
+typedef std::vector<int>::const_iterator PosIter;
+
+static PosIter categorical_row(const int* a, int i, const std::vector<int64_t>& cat_ptr,
+                               const std::vector<int>& cat_pos, int diag_ignore,
+                               PosIter& lo, PosIter& hi, PosIter& end) {
+    auto begin = cat_pos.begin() + cat_ptr[a[i]];
+    end = cat_pos.begin() + cat_ptr[a[i] + 1];
+    lo = end;
+    hi = end;
+    if (diag_ignore > 0) {
+        lo = std::lower_bound(begin, end, i - diag_ignore + 1);
+        hi = std::lower_bound(lo, end, i + diag_ignore);
+    }
+    return begin;
+}
+
+// Stats-only counterpart of categorical_csr: follows the lines without
+// building the CSR arrays.
+static void categorical_scan(const int* a, int n, const std::vector<int64_t>& cat_ptr,
+                             const std::vector<int>& cat_pos, int diag_ignore, LineScan& ls) {
+    py::gil_scoped_release release;
+    SparseRuns runs(ls);
+    for (int i = 0; i < n; i++) {
+        PosIter lo, hi, end;
+        auto it = categorical_row(a, i, cat_ptr, cat_pos, diag_ignore, lo, hi, end);
+        for (; it != end; ++it) {
+            if (it == lo)
+                it = hi;
+            if (it == end)
+                break;
+            runs.add(i, *it);
+        }
+    }
+    runs.finish();
+}
+
+template <typename Index>
+static py::object categorical_csr(const int* a, int n, const std::vector<int64_t>& cat_ptr,
+                                  const std::vector<int>& cat_pos, int diag_ignore, LineScan& ls) {
+    auto row_span = [&](int i, PosIter& lo, PosIter& hi, PosIter& end) {
+        return categorical_row(a, i, cat_ptr, cat_pos, diag_ignore, lo, hi, end);
+    };
+
+    auto indptr = py::array_t<Index>(n + 1);
+    Index* ptr = indptr.mutable_data();
+    py::array_t<Index> indices;
+    {
+        py::gil_scoped_release release;
+        ptr[0] = 0;
+        for (int i = 0; i < n; i++) {
+            PosIter lo, hi, end;
+            auto begin = row_span(i, lo, hi, end);
+            ptr[i + 1] = ptr[i] + static_cast<Index>((end - begin) - (hi - lo));
+        }
+    }
+    indices = py::array_t<Index>(static_cast<py::ssize_t>(ptr[n]));
+    Index* idx = indices.mutable_data();
+    {
+        py::gil_scoped_release release;
+        SparseRuns runs(ls);
+        for (int i = 0; i < n; i++) {
+            PosIter lo, hi, end;
+            auto it = row_span(i, lo, hi, end);
+            Index p = ptr[i];
+            for (; it != end; ++it) {
+                if (it == lo)
+                    it = hi;
+                if (it == end)
+                    break;
+                idx[p++] = *it;
+                runs.add(i, *it);
+            }
+        }
+        runs.finish();
+    }
+    auto data = py::array_t<int8_t>(static_cast<py::ssize_t>(ptr[n]));
+    std::fill(data.mutable_data(), data.mutable_data() + ptr[n], static_cast<int8_t>(1));
+    py::object csr_matrix = py::module_::import("scipy.sparse").attr("csr_matrix");
+    return csr_matrix(py::make_tuple(data, indices, indptr), py::arg("shape") = py::make_tuple(n, n));
+}
+
+py::tuple rqa_stats_categorical(py::array_t<int, py::array::c_style | py::array::forcecast> a,
+                                py::array_t<int, py::array::c_style | py::array::forcecast> b,
+                                int rescale, float rad, int diag_ignore, int minl, std::string rqa_mode,
+                                bool return_matrices) {
+    int n = static_cast<int>(a.size());
+    if (b.size() != a.size())
+        throw std::runtime_error("Both category series must have the same length.");
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    try {
+        check_radius_args(n, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+    const int* pa = a.data();
+    const int* pb = b.data();
+
+    // Counting sort of b: cat_pos[cat_ptr[c] .. cat_ptr[c+1]) are the positions of category c.
+    std::vector<int64_t> cat_ptr;
+    std::vector<int> cat_pos(n);
+    {
+        py::gil_scoped_release release;
+        int n_cat = 0;
+        for (int i = 0; i < n; i++) {
+            if (pa[i] < 0 || pb[i] < 0)
+                throw std::runtime_error("Category indices must be non-negative.");
+            n_cat = std::max(n_cat, std::max(pa[i], pb[i]) + 1);
+        }
+        cat_ptr.assign(n_cat + 1, 0);
+        for (int j = 0; j < n; j++)
+            cat_ptr[pb[j] + 1]++;
+        for (int c = 0; c < n_cat; c++)
+            cat_ptr[c + 1] += cat_ptr[c];
+        std::vector<int64_t> fill(cat_ptr.begin(), cat_ptr.end() - 1);
+        for (int j = 0; j < n; j++)
+            cat_pos[fill[pb[j]]++] = j;
+    }
+
+    LineScan ls(n);
+    if (!return_matrices) {
+        categorical_scan(pa, n, cat_ptr, cat_pos, diag_ignore, ls);
+        return linescan_result(ls, py::none(), rescale, rad, diag_ignore, minl, false);
+    }
+    int64_t nnz = 0;
+    for (int i = 0; i < n; i++)
+        nnz += cat_ptr[pa[i] + 1] - cat_ptr[pa[i]];
+    py::object td = (nnz <= std::numeric_limits<int32_t>::max())
+        ? categorical_csr<int32_t>(pa, n, cat_ptr, cat_pos, diag_ignore, ls)
+        : categorical_csr<int64_t>(pa, n, cat_ptr, cat_pos, diag_ignore, ls);
+    return linescan_result(ls, td, rescale, rad, diag_ignore, minl);
+}
+
+/************************************
+ * rqa_stats_multi / rqa_stats_stream_multi
+ *
+ * Full RQA for several radii in one pass. The rescale factor is
+ * computed once, and each rescaled distance is read once and
+ * compared against every radius; each radius fills its own
+ * BitMatrix and LineScan. Returns a list with one
+ * (td, rs, mats, err_code) tuple per radius, in the order given.
+ * A radius with no recurrent points gives (td, None, None, 2)
+ * instead of stopping the whole sweep.
+ ************************************/
+static void check_radii(int n, const std::vector<float>& radii, int diag_ignore) {
+    if (radii.empty())
+        throw std::runtime_error("Please give at least one radius");
+    for (float rad : radii)
+        check_radius_args(n, rad, diag_ignore);
+}
+
+struct MultiScan {
+    std::vector<BitMatrix> tds;
+    std::vector<std::unique_ptr<LineScan>> scans;
+};
+
+// get_dist(i, scratch) returns distance row i (see scan_rows).
+template <typename DistFn>
+static MultiScan scan_rows_multi(int n, const std::vector<float>& radii, int rescale, double scale,
+                                 int diag_ignore, int n_threads, DistFn get_dist) {
+    size_t n_rad = radii.size();
+    MultiScan ms;
+    for (size_t k = 0; k < n_rad; k++)
+        ms.tds.emplace_back(n, n);
+
+    int chunks = num_chunks(n, n_threads, 64);
+    std::vector<std::vector<std::unique_ptr<LineScan>>> parts(n_rad);
+    for (auto& p : parts)
+        p.resize(chunks);
+    parallel_for(n, chunks, [&](int c, int begin, int end) {
+        for (size_t k = 0; k < n_rad; k++)
+            parts[k][c].reset(new LineScan(n, begin, chunks > 1));
+        std::vector<float> scratch(n);
+        std::vector<uint64_t*> out(n_rad);
+        for (int i = begin; i < end; i++) {
+            const float* dist = get_dist(i, scratch);
+            for (size_t k = 0; k < n_rad; k++)
+                out[k] = ms.tds[k].row(i);
+            for (int j = 0; j < n; j++) {
+                float v = rescaled(dist[j], rescale, scale);
+                uint64_t bit = 1ULL << (j & 63);
+                for (size_t k = 0; k < n_rad; k++)
+                    if (v <= radii[k])
+                        out[k][j >> 6] |= bit;
+            }
+            for (size_t k = 0; k < n_rad; k++) {
+                clear_diag_band(n, i, diag_ignore, out[k]);
+                parts[k][c]->push(out[k]);
+            }
+        }
+        for (size_t k = 0; k < n_rad; k++)
+            parts[k][c]->finish();
+    });
+
+    for (size_t k = 0; k < n_rad; k++) {
+        if (chunks == 1)
+            ms.scans.push_back(std::move(parts[k][0]));
+        else
+            ms.scans.emplace_back(new LineScan(merge_linescans(parts[k])));
+    }
+    return ms;
+}
+
+static py::list multi_result(MultiScan& ms, const std::vector<float>& radii, int rescale,
+                             int diag_ignore, int minl) {
+    py::list results;
+    for (size_t k = 0; k < radii.size(); k++) {
+        const LineScan& ls = *ms.scans[k];
+        py::object td = py::cast(std::move(ms.tds[k]));
+        long long recur_sum = std::accumulate(ls.diag_count.begin(), ls.diag_count.end(), 0LL);
+        if (recur_sum == 0)
+            results.append(py::make_tuple(td, py::none(), py::none(), 2));
+        else
+            results.append(linescan_result(ls, td, rescale, radii[k], diag_ignore, minl));
+    }
+    return results;
+}
+
+py::list rqa_stats_multi(py::array_t<float> d, int rescale, std::vector<float> radii, int diag_ignore,
+                         int minl, std::string rqa_mode, int n_threads) {
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+
+    auto buf = d.request();
+    if (buf.ndim != 2 || buf.shape[0] != buf.shape[1])
+        throw std::runtime_error("Error in thresholding: Distance matrix must be square");
+    int n = buf.shape[0];
+    try {
+        check_radii(n, radii, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+
+    const float* dist_ptr = static_cast<const float*>(buf.ptr);
+    MultiScan ms;
+    {
+        py::gil_scoped_release release;
+        double scale = matrix_rescale_factor(dist_ptr, n, rescale, n_threads);
+        ms = scan_rows_multi(n, radii, rescale, scale, diag_ignore, n_threads,
+                             [dist_ptr, n](int i, std::vector<float>&) {
+                                 return dist_ptr + static_cast<size_t>(i) * n;
+                             });
+    }
+    return multi_result(ms, radii, rescale, diag_ignore, minl);
+}
+
+py::list rqa_stats_stream_multi(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                                int rescale, std::vector<float> radii, int diag_ignore, int minl,
+                                std::string rqa_mode, int n_threads, std::string norm) {
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    int n = e.n2;
+    try {
+        check_radii(n, radii, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+
+    MultiScan ms;
+    {
+        py::gil_scoped_release release;
+        double scale = rescale_factor(e, rescale, n_threads);
+        ms = scan_rows_multi(n, radii, rescale, scale, diag_ignore, n_threads,
+                             [&e](int i, std::vector<float>& scratch) {
+                                 distance_row(e, i, scratch.data());
+                                 return static_cast<const float*>(scratch.data());
+                             });
+    }
+    return multi_result(ms, radii, rescale, diag_ignore, minl);
+}
+
+/************************************
+ * rqa_stats_windowed
+ *
+ * RQA/CRQA over sliding windows of `window` samples, moved by `step`
+ * samples. Consecutive windows share their overlapping block of
+ * embedded points, so only the matrix cells that enter with a new
+ * window are computed; the others stay in a ring buffer where cell
+ * (i, j) of the full matrix lives at (i mod M, j mod M), M >= m, m
+ * being the number of embedded points per window.
+ *
+ * With rescale == 0 the radius is fixed, so the recurrences of the
+ * overlap do not change. For small steps the diagonal and vertical
+ * line histograms are then updated incrementally: only the runs at
+ * the ends of each diagonal and column, and in the columns leaving or
+ * entering the window, are recounted (see remove_runs / add_runs).
+ * For larger steps a word-level rescan of the window is cheaper. With
+ * rescale 1 or 2 the threshold depends on the whole window, so the
+ * kept distances are re-thresholded and scanned for every window.
+ *
+ * Returns one (start, rs, err_code) tuple per window, start being its
+ * first sample; rs is None with err_code 2 when a window has no
+ * recurrences. Each rs equals rqa_stats_stream on that slice.
+ ************************************/
+
+// Steps below m / INCREMENTAL_STEP_DIV use the incremental line update.
+static const int INCREMENTAL_STEP_DIV = 64;
+
+struct WindowRing {
+    int m;
+    int size;                     // M: ring side, a power of two (bits) or m (distances)
+    int words;                    // words per packed ring row
+    std::vector<uint64_t> bits;   // recurrences (rescale == 0)
+    std::vector<float> dist;      // distances (rescale 1 or 2)
+
+    WindowRing(int m_, bool keep_dist) : m(m_), size(m_), words(0) {
+        if (keep_dist) {
+            dist.resize(static_cast<size_t>(m) * m);
+        } else {
+            size = 64;
+            while (size < m)
+                size *= 2;
+            words = size / 64;
+            bits.assign(static_cast<size_t>(size) * words, 0);
+        }
+    }
+
+    uint64_t* bit_row(int i) { return bits.data() + static_cast<size_t>(i & (size - 1)) * words; }
+    const uint64_t* bit_row(int i) const { return bits.data() + static_cast<size_t>(i & (size - 1)) * words; }
+    bool get(int i, int j) const {
+        int c = j & (size - 1);
+        return (bit_row(i)[c >> 6] >> (c & 63)) & 1ULL;
+    }
+    float* dist_row(int i) { return dist.data() + static_cast<size_t>(i % m) * m; }
+
+    // Clear columns j0 .. j1-1 of row i (j1 - j0 <= size).
+    void clear_cols(int i, int j0, int j1) {
+        uint64_t* row = bit_row(i);
+        for (int j = j0; j < j1;) {
+            int c = j & (size - 1);
+            int off = c & 63;
+            int len = std::min(64 - off, j1 - j);
+            uint64_t mask = (len == 64) ? ~0ULL : ((1ULL << len) - 1) << off;
+            row[c >> 6] &= ~mask;
+            j += len;
+        }
+    }
+
+    // Packed columns s .. s+m-1 of row i, in window order.
+    void window_bits(int i, int s, uint64_t* out) const {
+        const uint64_t* row = bit_row(i);
+        int c0 = s & (size - 1);
+        int w0 = c0 >> 6, off = c0 & 63;
+        int n_words = (m + 63) / 64;
+        for (int w = 0; w < n_words; w++) {
+            uint64_t lo = row[(w0 + w) & (words - 1)];
+            uint64_t hi = row[(w0 + w + 1) & (words - 1)];
+            out[w] = off ? (lo >> off) | (hi << (64 - off)) : lo;
+        }
+        if (m & 63)
+            out[n_words - 1] &= (1ULL << (m & 63)) - 1;
+    }
+};
+
+// A line (diagonal or column) of the matrix moves its window interval from
+// [old_lo, old_hi) to [new_lo, new_hi). Only runs starting at or before
+// new_lo or ending at or after old_hi - 1 can differ between the two
+// intervals: remove_runs takes those out of hist (reading the old bits)
+// and add_runs puts them back (reading the new bits). Runs that meet the
+// condition but did not change are counted on both sides and cancel out.
+// An empty old interval has old_lo = old_hi = new_lo; an empty new one
+// has new_lo = new_hi = old_hi.
+template <typename BitFn>
+static void remove_runs(BitFn bit, int old_lo, int old_hi, int new_lo, std::vector<long long>& hist) {
+    int p = old_lo;
+    while (p < old_hi) {
+        while (p < old_hi && !bit(p))
+            p++;
+        if (p >= old_hi || p > new_lo)
+            break;
+        int q = p;
+        while (q < old_hi && bit(q))
+            q++;
+        hist[q - p]--;
+        p = q;
+    }
+    if (old_hi > old_lo && bit(old_hi - 1)) {
+        int a = old_hi - 1;
+        while (a > old_lo && bit(a - 1))
+            a--;
+        if (a > new_lo)
+            hist[old_hi - a]--;
+    }
+}
+
+template <typename BitFn>
+static void add_runs(BitFn bit, int new_lo, int new_hi, int old_hi, std::vector<long long>& hist) {
+    if (new_hi > new_lo && bit(new_lo)) {
+        int q = new_lo;
+        while (q < new_hi && bit(q))
+            q++;
+        hist[q - new_lo]++;
+    }
+    int p = new_hi - 1;
+    while (p >= new_lo) {
+        while (p >= new_lo && !bit(p))
+            p--;
+        if (p < new_lo || p < old_hi - 1)
+            break;
+        int a = p;
+        while (a > new_lo && bit(a - 1))
+            a--;
+        if (a > new_lo)
+            hist[p - a + 1]++;
+        p = a - 1;
+    }
+}
+
+// Compute the cells of window s that were not in window prev (all of
+// them when prev < 0 or the windows do not overlap). fill(i, j0, d)
+// stores row i, columns j0 .. s+m-1, from the distances in d.
+template <typename FillFn>
+static void fill_new_cells(const EmbeddedPair& e, int m, int prev, int s, int n_threads, FillFn fill) {
+    bool disjoint = prev < 0 || s - prev >= m;
+    parallel_for(m, num_chunks(m, n_threads), [&](int, int begin, int end) {
+        std::vector<float> d(m);
+        for (int r = begin; r < end; r++) {
+            int i = s + r;
+            int j0 = (disjoint || i >= prev + m) ? s : prev + m;
+            distance_span(e, i, j0, s + m, d.data());
+            fill(i, j0, d.data());
+        }
+    });
+}
+
+// Incremental line update (rescale == 0) from window prev to window s,
+// for overlapping windows. remove = true takes out the runs that may
+// change (call before the new cells are filled in), remove = false puts
+// back those of the new window (call after).
+static void update_runs(const WindowRing& ring, LineScan& ls, int prev, int s, int diag_ignore,
+                        bool remove, int n_threads) {
+    const int m = ring.m;
+    // Work items: the 2m - 1 diagonals, the m columns of the old window,
+    // then the columns that only belong to the new one.
+    int n_items = (2 * m - 1) + m + (s - prev);
+    int chunks = num_chunks(n_items, n_threads, 64);
+    std::vector<std::vector<long long>> dh(chunks, std::vector<long long>(m + 1, 0));
+    std::vector<std::vector<long long>> vh(chunks, std::vector<long long>(m + 1, 0));
+
+    parallel_for(n_items, chunks, [&](int c, int begin, int end) {
+        for (int item = begin; item < end; item++) {
+            if (item < 2 * m - 1) {
+                int k = item - (m - 1);
+                if (std::abs(k) < diag_ignore)
+                    continue;
+                int old_lo = prev + std::max(0, -k), old_hi = prev + m - std::max(0, k);
+                int new_lo = s + std::max(0, -k), new_hi = s + m - std::max(0, k);
+                auto bit = [&ring, k](int p) { return ring.get(p, p + k); };
+                long long changed = 0;
+                if (remove) {
+                    remove_runs(bit, old_lo, old_hi, new_lo, dh[c]);
+                    for (int p = old_lo; p < std::min(old_hi, new_lo); p++)
+                        changed -= bit(p);
+                } else {
+                    add_runs(bit, new_lo, new_hi, old_hi, dh[c]);
+                    for (int p = std::max(new_lo, old_hi); p < new_hi; p++)
+                        changed += bit(p);
+                }
+                ls.diag_count[item] += changed;
+            } else {
+                int j = prev + (item - (2 * m - 1));
+                bool in_old = j < prev + m, in_new = j >= s;
+                auto bit = [&ring, j](int p) { return ring.get(p, j); };
+                if (remove && in_old)
+                    remove_runs(bit, prev, prev + m, in_new ? s : prev + m, vh[c]);
+                else if (!remove && in_new)
+                    add_runs(bit, s, s + m, in_old ? prev + m : s, vh[c]);
+            }
+        }
+    });
+    for (int c = 0; c < chunks; c++) {
+        for (int l = 0; l <= m; l++) {
+            ls.diag_hist[l] += dh[c][l];
+            ls.vert_hist[l] += vh[c][l];
+        }
+    }
+}
+
+py::list rqa_stats_windowed(py::array_t<float> a, py::array_t<float> b, int dim, int lag,
+                            int window, int step, int rescale, float rad, int diag_ignore,
+                            int minl, std::string rqa_mode, int n_threads, std::string norm) {
+    if (rqa_mode == "cross")
+        diag_ignore = 0;
+    if (minl <= 0)
+        throw std::runtime_error("Please use an integer min line length >= 1");
+    if (step < 1)
+        throw std::runtime_error("Please use a step of at least one sample");
+
+    EmbeddedPair e = embed_pair(a, b, dim, lag, norm);
+    int n_samples = e.n2 + lag * (dim - 1);
+    int m = window - lag * (dim - 1);
+    if (window > n_samples)
+        throw std::runtime_error("Window is longer than the series");
+    if (m < 2)
+        throw std::runtime_error("Window is too short for these embedding parameters");
+    try {
+        check_radius_args(m, rad, diag_ignore);
+    } catch (std::runtime_error &err) {
+        throw std::runtime_error("Error in thresholding: " + std::string(err.what()));
+    }
+
+    bool fixed = (rescale != 1 && rescale != 2);
+    bool incremental = fixed && step < m / INCREMENTAL_STEP_DIV;
+    WindowRing ring(m, !fixed);
+    LineScan ls(m);
+    py::list results;
+    int prev = -1;
+    for (int s = 0; s + window <= n_samples; s += step) {
+        {
+            py::gil_scoped_release release;
+            if (fixed) {
+                bool slide = incremental && prev >= 0;
+                if (slide)
+                    update_runs(ring, ls, prev, s, diag_ignore, true, n_threads);
+                fill_new_cells(e, m, prev, s, n_threads, [&](int i, int j0, const float* d) {
+                    uint64_t* row = ring.bit_row(i);
+                    ring.clear_cols(i, j0, s + m);
+                    for (int j = j0; j < s + m; j++) {
+                        if (d[j - j0] <= rad) {
+                            int c = j & (ring.size - 1);
+                            row[c >> 6] |= 1ULL << (c & 63);
+                        }
+                    }
+                    ring.clear_cols(i, std::max(j0, i - diag_ignore + 1), std::min(s + m, i + diag_ignore));
+                });
+                if (slide) {
+                    update_runs(ring, ls, prev, s, diag_ignore, false, n_threads);
+                } else {
+                    ls = scan_rows(m, n_threads, [&](int r, RowScratch& sc) {
+                        ring.window_bits(s + r, s, sc.bits.data());
+                        return static_cast<const uint64_t*>(sc.bits.data());
+                    });
+                }
+            } else {
+                fill_new_cells(e, m, prev, s, n_threads, [&](int i, int j0, const float* d) {
+                    float* row = ring.dist_row(i);
+                    for (int j = j0; j < s + m; j++)
+                        row[j % m] = d[j - j0];
+                });
+                // Row r of the window, in window column order.
+                auto window_row = [&](int r, std::vector<float>& scratch) {
+                    const float* row = ring.dist_row(s + r);
+                    int c0 = s % m;
+                    std::copy(row + c0, row + m, scratch.begin());
+                    std::copy(row, row + c0, scratch.begin() + (m - c0));
+                    return static_cast<const float*>(scratch.data());
+                };
+                double scale = rescale_over_rows(m, rescale, n_threads, window_row);
+                ls = scan_rows(m, n_threads, [&](int r, RowScratch& sc) {
+                    threshold_row_bits(window_row(r, sc.dist), m, r, rescale, scale, rad, diag_ignore, sc.bits.data());
+                    return static_cast<const uint64_t*>(sc.bits.data());
+                });
+            }
+        }
+        prev = s;
+
+        long long recur_sum = std::accumulate(ls.diag_count.begin(), ls.diag_count.end(), 0LL);
+        if (recur_sum == 0)
+            results.append(py::make_tuple(s, py::none(), 2));
+        else
+            results.append(py::make_tuple(s, linescan_stats(ls, rescale, rad, diag_ignore, minl), 0));
+    }
+    return results;
+}
+
+/************************************
+ * Module definition
+ ************************************/
+PYBIND11_MODULE(rqa_utils_cpp, m) {
+    m.doc() = "High-performance RQA utilities implemented in C++ using pybind11";
+
+    m.def("rqa_dist", &rqa_dist,
+          "Compute distances between embedded vectors ((n,) series or (n, channels) arrays)",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"), py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean", py::arg("zscore") = false);
+
+    m.def("rqa_radius", &rqa_radius,
+          "Threshold the distance matrix",
+          py::arg("dist"), py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"),
+          py::arg("n_threads") = 1);
+
+    m.def("rqa_line", &rqa_line,
+          "Find diagonal lines and compute trends in a thresholded matrix",
+          py::arg("thrd"), py::arg("diag_ignore"), py::arg("n_threads") = 1);
+
+    m.def("rqa_histlines", &rqa_histlines,
+          "Compute the histogram of line lengths and stats",
+          py::arg("llengths"), py::arg("minl"));
+
+    m.def("rqa_entropy", &rqa_entropy,
+          "Compute Shannon entropy of a distribution",
           py::arg("distr"), py::arg("nstates"));
 
     m.def("rqa_vertical", &rqa_vertical,
           "Compute vertical line metrics (returns vertical line lengths, laminarity, trapping time, Vmax)",
-          py::arg("thrd"), py::arg("vmin"));
+          py::arg("thrd"), py::arg("vmin"), py::arg("n_threads") = 1);
 
     m.def("rqa_stats", &rqa_stats,
           "Perform full RQA analysis on a distance matrix, including vertical metrics and divergence",
           py::arg("d"), py::arg("rescale"), py::arg("rad"),
+          py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto",
+          py::arg("n_threads") = 1, py::arg("return_matrices") = true, py::arg("return_lines") = false);
+
+    py::class_<BitMatrix>(m, "BitMatrix", "Bit-packed recurrence matrix (64 cells per uint64 word)")
+        .def_property_readonly("shape", [](const BitMatrix& bm) { return py::make_tuple(bm.rows, bm.cols); })
+        .def_property_readonly("nbytes", [](const BitMatrix& bm) { return bm.bits.size() * sizeof(uint64_t); })
+        .def_property_readonly("words", [](py::object self) {
+                 BitMatrix& bm = self.cast<BitMatrix&>();
+                 return py::array_t<uint64_t>({bm.rows, bm.words_per_row},
+                                              {bm.words_per_row * sizeof(uint64_t), sizeof(uint64_t)},
+                                              bm.bits.data(), self);
+             }, "Zero-copy (rows, words) uint64 view of the packed bits")
+        .def("count", &BitMatrix::count, "Number of recurrent points (popcount)")
+        .def("to_numpy", &BitMatrix::to_numpy, "Unpack to a (rows, cols) boolean array")
+        .def("__array__", [](const BitMatrix& bm, py::object dtype, py::object copy) {
+                 py::object arr = bm.to_numpy();
+                 if (!dtype.is_none())
+                     arr = arr.attr("astype")(dtype);
+                 return arr;
+             }, py::arg("dtype") = py::none(), py::arg("copy") = py::none())
+        .def("__getitem__", [](const BitMatrix& bm, std::pair<int, int> ij) {
+                 if (ij.first < 0 || ij.first >= bm.rows || ij.second < 0 || ij.second >= bm.cols)
+                     throw py::index_error("BitMatrix index out of range");
+                 return bm.get(ij.first, ij.second);
+             });
+
+    m.def("rqa_stream", &rqa_stream,
+          "Embed, compute distances and threshold row by row without a float distance matrix",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_radius_bits", &rqa_radius_bits,
+          "Threshold the distance matrix into a bit-packed recurrence matrix",
+          py::arg("dist"), py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"),
+          py::arg("n_threads") = 1);
+
+    m.def("rqa_stream_bits", &rqa_stream_bits,
+          "Embed, compute distances and threshold row by row into a bit-packed recurrence matrix",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_pack_bits", &rqa_pack_bits,
+          "Pack an int8 thresholded matrix into a bit-packed recurrence matrix",
+          py::arg("thrd"));
+
+    m.def("rqa_stats_bits", &rqa_stats_bits,
+          "Perform full RQA analysis on a bit-packed recurrence matrix",
+          py::arg("td"), py::arg("rescale"), py::arg("rad"),
+          py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto",
+          py::arg("n_threads") = 1);
+
+    m.def("rqa_stats_stream", &rqa_stats_stream,
+          "Perform full RQA analysis directly on two series using the streaming distance kernel",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("minl"),
+          py::arg("rqa_mode") = "auto", py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean", py::arg("return_matrices") = true, py::arg("zscore") = false);
+
+    py::class_<TriBitMatrix>(m, "TriBitMatrix",
+                             "Packed upper triangle of a symmetric recurrence matrix (row i holds cells (i, i + k))")
+        .def_property_readonly("shape", [](const TriBitMatrix& tm) { return py::make_tuple(tm.n, tm.n); })
+        .def_property_readonly("nbytes", [](const TriBitMatrix& tm) { return tm.bits.size() * sizeof(uint64_t); })
+        .def_property_readonly("words", [](py::object self) {
+                 TriBitMatrix& tm = self.cast<TriBitMatrix&>();
+                 return py::array_t<uint64_t>({tm.bits.size()}, {sizeof(uint64_t)}, tm.bits.data(), self);
+             }, "Zero-copy flat uint64 view of the packed rows")
+        .def_property_readonly("row_offsets", [](const TriBitMatrix& tm) {
+                 std::vector<long long> off(tm.offsets.begin(), tm.offsets.end());
+                 return py::array_t<long long>(off.size(), off.data());
+             }, "First word of each packed row in words (n + 1 entries)")
+        .def("count", &TriBitMatrix::count, "Number of recurrent points of the full matrix")
+        .def("to_numpy", &TriBitMatrix::to_numpy, "Unpack to the full (n, n) boolean array")
+        .def("__array__", [](const TriBitMatrix& tm, py::object dtype, py::object copy) {
+                 py::object arr = tm.to_numpy();
+                 if (!dtype.is_none())
+                     arr = arr.attr("astype")(dtype);
+                 return arr;
+             }, py::arg("dtype") = py::none(), py::arg("copy") = py::none())
+        .def("__getitem__", [](const TriBitMatrix& tm, std::pair<int, int> ij) {
+                 if (ij.first < 0 || ij.first >= tm.n || ij.second < 0 || ij.second >= tm.n)
+                     throw py::index_error("TriBitMatrix index out of range");
+                 return tm.get(ij.first, ij.second);
+             });
+
+    m.def("rqa_stats_tiled", &rqa_stats_tiled,
+          "Perform full RQA tile by tile in bounded memory, optionally writing the packed matrix to out",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("minl"),
+          py::arg("rqa_mode") = "auto", py::arg("tile") = 1024, py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean", py::arg("out") = py::none());
+
+    m.def("rqa_stream_tri", &rqa_stream_tri,
+          "Threshold the upper triangle of an auto-recurrence matrix into a packed triangle",
+          py::arg("a"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_stats_stream_sym", &rqa_stats_stream_sym,
+          "Perform auto-RQA on one series from the upper triangle only",
+          py::arg("a"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("rad"), py::arg("diag_ignore"), py::arg("minl"),
+          py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean", py::arg("return_matrices") = true, py::arg("zscore") = false);
+
+    m.def("rqa_rescale_factor", &rqa_rescale_factor,
+          "Rescale factor (mean or max distance) of the recurrence matrix of two series",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"), py::arg("rescale"),
+          py::arg("rqa_mode") = "auto", py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_stats_sparse", &rqa_stats_sparse,
+          "Perform full RQA analysis on a sparse CSR recurrence matrix",
+          py::arg("td"), py::arg("rescale"), py::arg("rad"),
           py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto");
+
+    m.def("rqa_stats_categorical", &rqa_stats_categorical,
+          "Perform full RQA / CRQA on integer category indices (recurrent = same category)",
+          py::arg("a"), py::arg("b"), py::arg("rescale"), py::arg("rad"),
+          py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto",
+          py::arg("return_matrices") = true);
+
+    m.def("rqa_stats_multi", &rqa_stats_multi,
+          "Perform full RQA on a distance matrix for several radii in a single pass",
+          py::arg("d"), py::arg("rescale"), py::arg("radii"),
+          py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto",
+          py::arg("n_threads") = 1);
+
+    m.def("rqa_stats_stream_multi", &rqa_stats_stream_multi,
+          "Perform full RQA on two series for several radii in a single streaming pass",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("radii"), py::arg("diag_ignore"), py::arg("minl"),
+          py::arg("rqa_mode") = "auto", py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_radius_for_rec", &rqa_radius_for_rec,
+          "Radius giving a target %REC on a distance matrix",
+          py::arg("d"), py::arg("rescale"), py::arg("target_rec"), py::arg("diag_ignore"),
+          py::arg("rqa_mode") = "auto", py::arg("n_threads") = 1);
+
+    m.def("rqa_radius_for_rec_stream", &rqa_radius_for_rec_stream,
+          "Radius giving a target %REC, computed from the two series without a distance matrix",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("rescale"), py::arg("target_rec"), py::arg("diag_ignore"),
+          py::arg("rqa_mode") = "auto", py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
+
+    m.def("rqa_stats_windowed", &rqa_stats_windowed,
+          "Perform full RQA on sliding windows, reusing the overlap between consecutive windows",
+          py::arg("a"), py::arg("b"), py::arg("dim"), py::arg("lag"),
+          py::arg("window"), py::arg("step"), py::arg("rescale"), py::arg("rad"),
+          py::arg("diag_ignore"), py::arg("minl"), py::arg("rqa_mode") = "auto",
+          py::arg("n_threads") = 1,
+          py::arg("norm") = "euclidean");
 }
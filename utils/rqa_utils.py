@@ -1,43 +1,114 @@
-from utils import output_io_utils, cleaning_utils
+from utils import output_io_utils, cleaning_utils, plot_utils, rqa_sparse_utils, mdrqa_utils, embedding_utils
 from utils import rqa_utils_cpp
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import numpy as np
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
 import os
 
 
-def perform_rqa(data, params, filename):
+def perform_rqa(data, params, filename, n_threads=1, backend="dense", return_matrices=True, tile=None,
+                memmap_path=None):
     """
     Perform Auto Recurrence Quantification Analysis (RQA).
 
     Parameters:
         data (pd.DataFrame): Time series data with one or more columns.
-        params (dict): Dictionary of RQA parameters.
+        params (dict): Dictionary of RQA parameters. If params['targetREC'] is
+            set, the radius giving that %REC is used instead of params['radius']
+            (reported as rs['rad']). params['distNorm'] selects the distance:
+            'euclidean' (default), 'max' or 'manhattan'. With
+            params['categorical'] set, points recur when their (embedded)
+            categories are equal and td is a scipy.sparse.csr_matrix.
+            params['eDim'] and params['tLag'] can be 'auto' (see
+            embedding_utils.resolve_embedding); the estimates are cached.
+        filename (str): Name of the source file (used for figures and stats output).
+        n_threads (int): Number of worker threads for the C++ engine
+            (0 or less uses all available cores).
+        backend (str): "dense" (bit-packed recurrence matrix) or "sparse"
+            (KD-tree neighbour search into a CSR matrix; memory scales with
+            the number of recurrences, for long recordings at low %REC).
+        return_matrices (bool): If False, only the statistics are computed:
+            the recurrence matrix is not stored (unless it is plotted) and
+            None is returned in its place.
+        tile (int): If set, the recurrence matrix is computed out of core in
+            tiles of tile x tile cells (rounded up to a multiple of 64), for
+            recordings too long for an in-memory matrix. RAM is then about
+            tile * n / 8 bytes; the measures are unchanged. No plot is made.
+        memmap_path (str): With tile set, the packed recurrence matrix is also
+            written to this .npy file (see open_recurrence_memmap) and returned
+            as a np.memmap instead of td.
 
     Returns:
         dict: RQA results for each column in the data.
-        dict: Recurrence plot results.
+        rqa_utils_cpp.TriBitMatrix: Packed upper triangle of the (symmetric)
+            recurrence plot matrix (use np.asarray(td) or td.to_numpy() for
+            the full boolean array), or a scipy.sparse.csr_matrix with the
+            sparse backend.
     """
     # Ensure data is a DataFrame with at least one column
     if not isinstance(data, pd.DataFrame) or data.shape[1] < 1:
         raise ValueError("Expected a DataFrame with at least one column for RQA.")
 
+    # Estimate eDim / tLag set to 'auto'
+    params = embedding_utils.resolve_embedding(data, params)
+
     # Normalize data
     dataX = cleaning_utils.normalize_data(data, params['norm'])
 
-    # Compute distance matrix for RQA
-    ds = rqa_utils_cpp.rqa_dist(dataX, dataX, dim=params['eDim'], lag=params['tLag'])
+    # Fixed recurrence rate: solve for the radius giving params['targetREC'] %REC
+    radius = params.get('radius')
+    if params.get('targetREC') is not None:
+        if params.get('categorical'):
+            raise ValueError("targetREC is not supported for categorical RQA.")
+        radius = rqa_utils_cpp.rqa_radius_for_rec_stream(
+            dataX, dataX, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], target_rec=params['targetREC'],
+            diag_ignore=params['tw'], rqa_mode="auto", n_threads=n_threads,
+            norm=params.get('distNorm', 'euclidean')
+        )
 
-    # Perform RQA calculations
-    td, rs, mats, err_code = rqa_utils_cpp.rqa_stats(
-        ds["d"], rescale=params['rescaleNorm'], rad=params['radius'], 
-        diag_ignore=params['tw'], minl=params['minl'], rqa_mode="auto"
-    )
+    # The recurrence matrix is only kept if it is returned or plotted
+    plot_mode = params.get('plotMode', 'rp') if tile is None else 'none'
+    keep_td = return_matrices or plot_mode in ('rp', 'rp-timeseries')
+
+    # Perform RQA calculations (the auto-recurrence matrix is symmetric, so
+    # only its upper triangle is computed, thresholded and stored)
+    if tile is not None:
+        td, rs, mats, err_code = tiled_rqa_stats(dataX, dataX, params, radius, "auto", tile, memmap_path,
+                                                 n_threads, backend)
+    elif params.get('categorical'):
+        codes = category_indices(data.iloc[:, 0].values, data.iloc[:, 0].values, params['eDim'], params['tLag'])[0]
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_categorical(
+            codes, codes, rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'], rqa_mode="auto",
+            return_matrices=keep_td
+        )
+    elif backend == "sparse":
+        td, rs, mats, err_code = rqa_sparse_utils.rqa_stats_sparse(
+            dataX, dataX, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'], rqa_mode="auto",
+            n_threads=n_threads, norm=params.get('distNorm', 'euclidean')
+        )
+    else:
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_stream_sym(
+            dataX, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'],
+            n_threads=n_threads, norm=params.get('distNorm', 'euclidean'),
+            return_matrices=keep_td
+        )
 
     # Print stats
     if err_code == 0:
         if params['showMetrics']:
+            if params.get('targetREC') is not None:
+                print(f"Radius: {radius:.5f} (targetREC: {params['targetREC']})")
             print(f"%REC: {float(rs['perc_recur']):.3f} | %DET: {float(rs['perc_determ']):.3f} | MaxLine: {float(rs['maxl_found']):.2f}")
             print(f"Mean Line Length: {float(rs['mean_line_length']):.2f} | SD Line Length: {float(rs['std_line_length']):.2f} | Line Count: {float(rs['count_line']):.2f}")
             print(f"ENTR: {float(rs['entropy']):.3f} | LAM: {float(rs['laminarity']):.3f} | TT: {float(rs['trapping_time']):.3f}")
@@ -48,7 +119,6 @@ def perform_rqa(data, params, filename):
 
     # Plot results
     # plotMode: 'none', 'rp', 'rp_timeseries',
-    plot_mode = params.get('plotMode', 'rp')
     if plot_mode in ('rp', 'rp-timeseries'):
         save_path = None
         if params.get('saveFig', False):
@@ -65,17 +135,198 @@ def perform_rqa(data, params, filename):
 
     # Save statistics if required
     if params['doStatsFile']:
-        output_io_utils.write_rqa_stats(filename, params, rs, err_code)
+        output_io_utils.write_rqa_stats(filename, {**params, 'radius': radius}, rs, err_code)
 
-    return rs, td  # Return RQA statistics and recurrence plot matrix
+    return rs, td if return_matrices or memmap_path else None  # Return RQA statistics and recurrence plot matrix
 
-def perform_crqa(data, params, filename):
+def perform_rqa_sweep(data, params, filename, radii, n_threads=1):
     """
-    Perform Cross Recurrence Quantification Analysis (CRQA).
+    Perform Auto RQA for several radii, computing the distances only once.
+
+    Each distance is compared against every radius in a single pass, so a
+    radius scan costs about the same as one perform_rqa call.
+
+    Parameters:
+        data (pd.DataFrame): Time series data with one or more columns.
+        params (dict): Dictionary of RQA parameters (params['radius'] is ignored).
+        filename (str): Name of the source file (used for figures and stats output).
+        radii (list of float): Radii to evaluate.
+        n_threads (int): Number of worker threads for the C++ engine
+            (0 or less uses all available cores).
+
+    Returns:
+        list of dict: RQA results for each radius (None where no recurrences were found).
+        list of rqa_utils_cpp.BitMatrix: Bit-packed recurrence plot matrix for each radius.
+    """
+    # Ensure data is a DataFrame with at least one column
+    if not isinstance(data, pd.DataFrame) or data.shape[1] < 1:
+        raise ValueError("Expected a DataFrame with at least one column for RQA.")
+
+    # Estimate eDim / tLag set to 'auto'
+    params = embedding_utils.resolve_embedding(data, params)
+
+    # Normalize data
+    dataX = cleaning_utils.normalize_data(data, params['norm'])
+
+    # Perform RQA calculations for all radii at once
+    results = rqa_utils_cpp.rqa_stats_stream_multi(
+        dataX, dataX, dim=params['eDim'], lag=params['tLag'],
+        rescale=params['rescaleNorm'], radii=list(radii),
+        diag_ignore=params['tw'], minl=params['minl'], rqa_mode="auto",
+        n_threads=n_threads, norm=params.get('distNorm', 'euclidean')
+    )
+
+    rs_list, td_list = [], []
+    for radius, (td, rs, mats, err_code) in zip(radii, results):
+        rs_list.append(rs)
+        td_list.append(td)
+
+        # Print stats
+        if err_code == 0:
+            if params['showMetrics']:
+                print(f"Radius: {radius}")
+                print(f"%REC: {float(rs['perc_recur']):.3f} | %DET: {float(rs['perc_determ']):.3f} | MaxLine: {float(rs['maxl_found']):.2f}")
+                print(f"Mean Line Length: {float(rs['mean_line_length']):.2f} | SD Line Length: {float(rs['std_line_length']):.2f} | Line Count: {float(rs['count_line']):.2f}")
+                print(f"ENTR: {float(rs['entropy']):.3f} | LAM: {float(rs['laminarity']):.3f} | TT: {float(rs['trapping_time']):.3f}")
+                print(f"Vmax: {float(rs['vmax']):.2f} | Divergence: {float(rs['divergence']):.3f}")
+                print(f"Trend_Lower: {float(rs['trend_lower_diag']):.3f} | Trend_Upper {float(rs['trend_upper_diag']):.3f}")
+        else:
+            print(f"Error in RQA computation (radius {radius}). Check parameters and data.")
+
+        # Save statistics if required (one row per radius)
+        if params['doStatsFile']:
+            output_io_utils.write_rqa_stats(filename, {**params, 'radius': radius}, rs, err_code)
+
+    # Plot results
+    if params.get('plotMode', 'rp') != 'none':
+        save_path = None
+        if params.get('saveFig', False):
+            base_path = os.path.join('images', 'rqa', f"{os.path.splitext(os.path.basename(filename))[0]}_rqa_sweep.png")
+            save_path = cleaning_utils.get_unique_filepath(base_path)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+        # Only the main measures fit under each plot
+        shown = ('perc_recur', 'perc_determ', 'maxl_found', 'entropy', 'laminarity', 'trapping_time')
+        plot_metrics = [{k: rs[k] for k in shown} if rs else {} for rs in rs_list]
+        plot_utils.plot_rqa_multi_radii(td_list, plot_metrics, list(radii), save_path is not None, save_path)
+
+    return rs_list, td_list
+
+def perform_rqa_windowed(data, params, filename, window, step, n_threads=1):
+    """
+    Perform Auto RQA on sliding windows of a time series.
+
+    The series is normalised once over its full length. Consecutive windows
+    reuse the distances of their overlap (and, with rescaleNorm 0, update the
+    line counts incrementally) instead of recomputing every window.
+
+    Parameters:
+        data (pd.DataFrame): Time series data (the first column is used).
+        params (dict): Dictionary of RQA parameters.
+        filename (str): Name of the source file (used for stats output).
+        window (int): Window length in samples.
+        step (int): Number of samples between the starts of consecutive windows.
+        n_threads (int): Number of worker threads for the C++ engine
+            (0 or less uses all available cores).
+
+    Returns:
+        pd.DataFrame: One row per window (window, start, end, err_code and the RQA measures).
+    """
+    # Ensure data is a DataFrame with at least one column
+    if not isinstance(data, pd.DataFrame) or data.shape[1] < 1:
+        raise ValueError("Expected a DataFrame with at least one column for RQA.")
+
+    # Estimate eDim / tLag set to 'auto' (on the series that is analysed)
+    params = embedding_utils.resolve_embedding(data.iloc[:, :1], params)
+
+    # Normalize data
+    dataX = cleaning_utils.normalize_data(data.iloc[:, 0].values, params['norm'])
+
+    return windowed_rqa_frame(dataX, dataX, params, filename, window, step, "auto", n_threads)
+
+def perform_crqa_windowed(data, params, filename, window, step, n_threads=1):
+    """
+    Perform Cross RQA on sliding windows of two time series.
+
+    See perform_rqa_windowed; both series are normalised once over their full length.
 
     Parameters:
         data (pd.DataFrame): A DataFrame with exactly two columns representing the two time series.
         params (dict): Dictionary of CRQA parameters.
+        filename (str): Name of the source file (used for stats output).
+        window (int): Window length in samples.
+        step (int): Number of samples between the starts of consecutive windows.
+        n_threads (int): Number of worker threads for the C++ engine
+            (0 or less uses all available cores).
+
+    Returns:
+        pd.DataFrame: One row per window (window, start, end, err_code and the CRQA measures).
+    """
+    # Ensure the DataFrame has exactly two columns
+    if data.shape[1] != 2:
+        raise ValueError("Expected a DataFrame with exactly two columns for CRQA.")
+
+    # Estimate eDim / tLag set to 'auto'
+    params = embedding_utils.resolve_embedding(data, params)
+
+    # Normalize data
+    dataX1 = cleaning_utils.normalize_data(data.iloc[:, 0].values, params['norm'])
+    dataX2 = cleaning_utils.normalize_data(data.iloc[:, 1].values, params['norm'])
+
+    return windowed_rqa_frame(dataX1, dataX2, params, filename, window, step, "cross", n_threads)
+
+def windowed_rqa_frame(dataX1, dataX2, params, filename, window, step, rqa_mode, n_threads=1):
+    """
+    Run the windowed RQA engine on normalised series and collect the results.
+
+    Returns:
+        pd.DataFrame: One row per window; windows without recurrences have err_code 2
+            and NaN measures.
+    """
+    if params.get('targetREC') is not None:
+        raise ValueError("targetREC is not supported for windowed RQA; use a fixed radius.")
+
+    results = rqa_utils_cpp.rqa_stats_windowed(
+        dataX1, dataX2, dim=params['eDim'], lag=params['tLag'],
+        window=window, step=step, rescale=params['rescaleNorm'], rad=params['radius'],
+        diag_ignore=params['tw'], minl=params['minl'], rqa_mode=rqa_mode,
+        n_threads=n_threads, norm=params.get('distNorm', 'euclidean')
+    )
+
+    rows = []
+    for k, (start, rs, err_code) in enumerate(results):
+        rows.append({'window': k, 'start': start, 'end': start + window, 'err_code': err_code, **(rs or {})})
+
+        # Save statistics if required (one row per window)
+        if params['doStatsFile']:
+            output_io_utils.write_rqa_stats(f"{filename} [{start}:{start + window}]", params, rs, err_code)
+    stats = pd.DataFrame(rows)
+
+    # Print stats
+    if params['showMetrics']:
+        shown = ['start', 'end', 'perc_recur', 'perc_determ', 'maxl_found', 'entropy', 'laminarity', 'trapping_time']
+        print(stats.reindex(columns=shown).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    return stats
+
+def perform_crqa(data, params, filename, n_threads=1, backend="dense", return_matrices=True, tile=None,
+                 memmap_path=None):
+    """
+    Perform Cross Recurrence Quantification Analysis (CRQA).
+
+    Parameters:
+        data (pd.DataFrame): A DataFrame with exactly two columns representing the two time series.
+        params (dict): Dictionary of CRQA parameters. If params['targetREC'] is
+            set, the radius giving that %REC is used instead of params['radius']
+            (reported as rs['rad']). See perform_rqa for params['distNorm']
+            and params['categorical'].
+        filename (str): Name of the source file (used for figures and stats output).
+        n_threads (int): Number of worker threads for the C++ engine
+            (0 or less uses all available cores).
+        backend (str): "dense" or "sparse" (see perform_rqa).
+        return_matrices (bool): If False, only the statistics are computed (see perform_rqa).
+        tile (int): Tile size for out-of-core computation (see perform_rqa).
+        memmap_path (str): .npy file for the packed recurrence matrix in tiled mode (see perform_rqa).
 
     Returns:
         dict: CRQA results.
@@ -85,6 +336,9 @@ def perform_crqa(data, params, filename):
     if data.shape[1] != 2:
         raise ValueError("Expected a DataFrame with exactly two columns for CRQA.")
 
+    # Estimate eDim / tLag set to 'auto'
+    params = embedding_utils.resolve_embedding(data, params)
+
     # Extract the two time series
     dataX1 = data.iloc[:, 0].values  # First column
     dataX2 = data.iloc[:, 1].values  # Second column
@@ -93,18 +347,55 @@ def perform_crqa(data, params, filename):
     dataX1 = cleaning_utils.normalize_data(dataX1, params['norm'])
     dataX2 = cleaning_utils.normalize_data(dataX2, params['norm'])
 
-    # Compute distance matrix for CRQA
-    ds = rqa_utils_cpp.rqa_dist(dataX1, dataX2, dim=params['eDim'], lag=params['tLag'])
+    # Fixed recurrence rate: solve for the radius giving params['targetREC'] %REC
+    radius = params.get('radius')
+    if params.get('targetREC') is not None:
+        if params.get('categorical'):
+            raise ValueError("targetREC is not supported for categorical CRQA.")
+        radius = rqa_utils_cpp.rqa_radius_for_rec_stream(
+            dataX1, dataX2, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], target_rec=params['targetREC'],
+            diag_ignore=params['tw'], rqa_mode="cross", n_threads=n_threads,
+            norm=params.get('distNorm', 'euclidean')
+        )
 
-    # Perform RQA calculations
-    td, rs, mats, err_code = rqa_utils_cpp.rqa_stats(
-        ds["d"], rescale=params['rescaleNorm'], rad=params['radius'], 
-        diag_ignore=params['tw'], minl=params['minl'], rqa_mode="cross"
-    )
+    # The recurrence matrix is only kept if it is returned or plotted
+    plot_mode = params['plotMode'] if tile is None else 'none'
+    keep_td = return_matrices or 'rp' in plot_mode
+
+    # Perform RQA calculations (distances are computed and thresholded
+    # row by row, so the full float distance matrix is never built)
+    if tile is not None:
+        td, rs, mats, err_code = tiled_rqa_stats(dataX1, dataX2, params, radius, "cross", tile, memmap_path,
+                                                 n_threads, backend)
+    elif params.get('categorical'):
+        codes1, codes2 = category_indices(data.iloc[:, 0].values, data.iloc[:, 1].values, params['eDim'], params['tLag'])
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_categorical(
+            codes1, codes2, rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'], rqa_mode="cross",
+            return_matrices=keep_td
+        )
+    elif backend == "sparse":
+        td, rs, mats, err_code = rqa_sparse_utils.rqa_stats_sparse(
+            dataX1, dataX2, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'], rqa_mode="cross",
+            n_threads=n_threads, norm=params.get('distNorm', 'euclidean')
+        )
+    else:
+        td, rs, mats, err_code = rqa_utils_cpp.rqa_stats_stream(
+            dataX1, dataX2, dim=params['eDim'], lag=params['tLag'],
+            rescale=params['rescaleNorm'], rad=radius,
+            diag_ignore=params['tw'], minl=params['minl'], rqa_mode="cross",
+            n_threads=n_threads, norm=params.get('distNorm', 'euclidean'),
+            return_matrices=keep_td
+        )
 
     # Print stats
     if err_code == 0:
         if params['showMetrics']:
+            if params.get('targetREC') is not None:
+                print(f"Radius: {radius:.5f} (targetREC: {params['targetREC']})")
             print(f"%REC: {float(rs['perc_recur']):.3f} | %DET: {float(rs['perc_determ']):.3f} | MaxLine: {float(rs['maxl_found']):.2f}")
             print(f"Mean Line Length: {float(rs['mean_line_length']):.2f} | SD Line Length: {float(rs['std_line_length']):.2f} | Line Count: {float(rs['count_line']):.2f}")
             print(f"ENTR: {float(rs['entropy']):.3f} | LAM: {float(rs['laminarity']):.3f} | TT: {float(rs['trapping_time']):.3f}")
@@ -115,7 +406,7 @@ def perform_crqa(data, params, filename):
 
     # Plot results
     # plotMode: 'none', 'rp', 'rp_timeseries',
-    if 'rp' in params['plotMode']:
+    if 'rp' in plot_mode:
         save_path = None
         if params.get('saveFig', False):
             base_path = os.path.join('images', 'rqa', f"{os.path.splitext(os.path.basename(filename))[0]}_crqa.png")
@@ -125,14 +416,455 @@ def perform_crqa(data, params, filename):
             dataX=dataX1,
             dataY=dataX2,
             td=td,
-            plot_mode=params['plotMode'],
+            plot_mode=plot_mode,
             point_size=params['pointSize'],
             save_path=save_path  
         )
 
     # Write stats
     if params['doStatsFile']:
-        output_io_utils.write_rqa_stats(filename, params, rs, err_code)
+        output_io_utils.write_rqa_stats(filename, {**params, 'radius': radius}, rs, err_code)
+
+    return rs, td if return_matrices or memmap_path else None  # Return CRQA statistics and recurrence plot matrix
+
+def tiled_rqa_stats(dataX1, dataX2, params, radius, rqa_mode, tile, memmap_path=None, n_threads=1,
+                    backend="dense"):
+    """
+    Run the tiled (out-of-core) engine, writing the packed recurrence matrix
+    to memmap_path if given.
+
+    Returns:
+        tuple: (td, rs, mats, err_code) with td the np.memmap (or None).
+    """
+    if params.get('categorical') or backend != "dense":
+        raise ValueError("Tiled mode is only available for the dense backend.")
+
+    out = None
+    if memmap_path is not None:
+        n = len(dataX1) - (params['eDim'] - 1) * params['tLag']
+        out = open_recurrence_memmap(memmap_path, n, mode='w+')
+    result = rqa_utils_cpp.rqa_stats_tiled(
+        dataX1, dataX2, dim=params['eDim'], lag=params['tLag'],
+        rescale=params['rescaleNorm'], rad=radius,
+        diag_ignore=params['tw'], minl=params['minl'], rqa_mode=rqa_mode,
+        tile=tile, n_threads=n_threads, norm=params.get('distNorm', 'euclidean'), out=out
+    )
+    if out is not None:
+        out.flush()
+    return result
+
+def open_recurrence_memmap(path, n=None, mode='r'):
+    """
+    Open (or, with mode 'w+', create) a packed recurrence matrix stored as a .npy file.
+
+    Row i holds n bits in (n + 63) // 64 uint64 words; bit j % 64 of word
+    j // 64 is cell (i, j). Use unpack_recurrence to get boolean blocks.
+
+    Parameters:
+        path (str): Path of the .npy file.
+        n (int): Number of embedded points (only needed with mode 'w+').
+        mode (str): 'r', 'r+' or 'w+'.
+
+    Returns:
+        np.memmap: (n, (n + 63) // 64) uint64 array.
+    """
+    if mode == 'w+':
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint64, shape=(n, (n + 63) // 64))
+    return np.load(path, mmap_mode=mode)
+
+def unpack_recurrence(words, rows=slice(None), cols=slice(None)):
+    """
+    Unpack a block of a packed recurrence matrix (e.g. from open_recurrence_memmap)
+    into a boolean array, reading only the requested rows.
+
+    Parameters:
+        words (np.ndarray): (n, (n + 63) // 64) uint64 packed matrix.
+        rows (slice): Rows to unpack.
+        cols (slice): Columns to keep.
+
+    Returns:
+        np.ndarray: Boolean recurrence matrix block.
+    """
+    n = words.shape[0]
+    block = np.ascontiguousarray(words[rows], dtype='<u8')
+    bits = np.unpackbits(block.view(np.uint8), axis=1, bitorder='little')[:, :n]
+    return bits[:, cols].astype(bool)
+
+def perform_rqa_batch(sources, params, window=None, step=None, n_workers=None, n_threads=1,
+                      backend="dense", read_kwargs=None):
+    """
+    Perform Auto RQA on many recordings in a pool of worker processes.
+
+    Every column of every source is analysed separately. Plots, printed
+    metrics and RQA_Stats.csv output are switched off in the workers; at most
+    n_workers recordings are processed at the same time.
+
+    Parameters:
+        sources (list): pd.DataFrame objects and/or paths of files readable by
+            pd.read_csv (header=None and whitespace or comma separated by default).
+        params (dict): Dictionary of RQA parameters (see perform_rqa).
+        window (int): Window length in samples; None analyses each series as a whole.
+        step (int): Number of samples between window starts (defaults to window).
+        n_workers (int): Maximum number of worker processes (None uses all
+            available cores, 1 runs in the calling process).
+        n_threads (int): Number of C++ engine threads per worker.
+        backend (str): "dense" or "sparse" (see perform_rqa; unused for windows).
+        read_kwargs (dict): Extra keyword arguments for pd.read_csv.
+
+    Returns:
+        pd.DataFrame: One row per file, column and window (file, column, window,
+            start, end, err_code, error and the RQA measures). Failed analyses
+            have err_code 1, an error message and NaN measures.
+    """
+    jobs = [(source, name, "auto", params, window, step, n_threads, backend, read_kwargs)
+            for source, name in zip(sources, batch_source_names(sources))]
+    return run_rqa_batch(jobs, n_workers)
+
+def perform_crqa_batch(sources, params, window=None, step=None, n_workers=None, n_threads=1,
+                       backend="dense", read_kwargs=None):
+    """
+    Perform Cross RQA on many pairs of recordings in a pool of worker processes.
+
+    Parameters:
+        sources (list): Two-column pd.DataFrame objects or paths of two-column
+            files, or (x, y) tuples of single-column sources (the first column
+            of each is used, as in crqbatchfilelistexample.txt, cut to the shorter length).
+        params (dict): Dictionary of CRQA parameters (see perform_crqa).
+        window, step, n_workers, n_threads, backend, read_kwargs: See perform_rqa_batch.
+
+    Returns:
+        pd.DataFrame: One row per pair and window (see perform_rqa_batch).
+    """
+    jobs = [(source, name, "cross", params, window, step, n_threads, backend, read_kwargs)
+            for source, name in zip(sources, batch_source_names(sources))]
+    return run_rqa_batch(jobs, n_workers)
+
+def batch_source_names(sources):
+    """
+    Labels of batch sources: file names for paths, frame_<k> for DataFrames
+    and "x | y" for (x, y) pairs.
+    """
+    def name(source, k):
+        if isinstance(source, (str, os.PathLike)):
+            return os.path.basename(os.fspath(source))
+        return f"frame_{k}"
+
+    return [" | ".join(name(s, k) for s in source) if isinstance(source, tuple) else name(source, k)
+            for k, source in enumerate(sources)]
+
+def run_rqa_batch(jobs, n_workers=None):
+    """
+    Run rqa_batch_job over the jobs (in a process pool unless n_workers is 1)
+    and concatenate the results in job order.
+    """
+    if n_workers == 1 or len(jobs) <= 1:
+        frames = [rqa_batch_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            frames = list(pool.map(rqa_batch_job, jobs))
+
+    columns = ['file', 'column', 'window', 'start', 'end', 'err_code', 'error']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    stats = pd.concat(frames, ignore_index=True)
+    return stats[columns + [c for c in stats.columns if c not in columns]]
+
+def read_batch_source(source, read_kwargs=None):
+    """
+    Load a batch source as a DataFrame (DataFrames are returned unchanged).
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    kwargs = {'header': None, 'sep': r'[,\s]+', 'engine': 'python', **(read_kwargs or {})}
+    return pd.read_csv(source, **kwargs)
+
+def rqa_batch_job(job):
+    """
+    Worker of perform_rqa_batch and perform_crqa_batch: analyses one source
+    with plotting, printing and stats output switched off.
+
+    Returns:
+        pd.DataFrame: Rows for every column (or pair) and window of the source.
+    """
+    source, name, rqa_mode, params, window, step, n_threads, backend, read_kwargs = job
+    quiet = {**params, 'showMetrics': False, 'plotMode': 'none', 'doStatsFile': False, 'saveFig': False}
+
+    # Series to analyse: (column label, DataFrame) with one column (auto) or two (cross)
+    try:
+        if isinstance(source, tuple):
+            pair = [read_batch_source(s, read_kwargs).iloc[:, 0].reset_index(drop=True) for s in source]
+            n = min(len(x) for x in pair)
+            data = pd.concat([x.iloc[:n] for x in pair], axis=1, ignore_index=True)
+        else:
+            data = read_batch_source(source, read_kwargs)
+        if rqa_mode == "cross":
+            series = [(f"{data.columns[0]} x {data.columns[1]}", data)]
+        else:
+            series = [(str(col), data[[col]]) for col in data.columns]
+    except (OSError, ValueError, IndexError, pd.errors.ParserError) as e:
+        return pd.DataFrame([{'file': name, 'column': None, 'err_code': 1, 'error': str(e)}])
+
+    frames = []
+    for label, frame in series:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                if window is not None:
+                    run = perform_rqa_windowed if rqa_mode == "auto" else perform_crqa_windowed
+                    stats = run(frame, quiet, name, window, step or window, n_threads)
+                    stats['error'] = None
+                else:
+                    run = perform_rqa if rqa_mode == "auto" else perform_crqa
+                    rs = run(frame, quiet, name, n_threads, backend, return_matrices=False)[0]
+                    stats = pd.DataFrame([{'window': 0, 'start': 0, 'end': len(frame), 'err_code': 0,
+                                           'error': None, **rs}])
+        except (RuntimeError, ValueError) as e:
+            stats = pd.DataFrame([{'window': 0, 'start': 0, 'end': len(frame), 'err_code': 1, 'error': str(e)}])
+        stats.insert(0, 'column', label)
+        stats.insert(0, 'file', name)
+        frames.append(stats)
+    return pd.concat(frames, ignore_index=True)
+
+# rs measures tested by rqa_surrogates (the remaining keys are settings)
+SURROGATE_METRICS = ['perc_recur', 'perc_determ', 'entropy', 'complexity', 'maxl_found', 'trend_lower_diag',
+                     'trend_upper_diag', 'mean_line_length', 'std_line_length', 'count_line', 'laminarity',
+                     'trapping_time', 'vmax', 'divergence']
+
+def rqa_surrogates(data, params, rqa_mode="auto", method="shuffle", n_surrogates=100, block=None,
+                   partners=None, alternative="two-sided", seed=None, n_workers=None, n_threads=1):
+    """
+    Test RQA / CRQA measures against surrogate data.
+
+    The series are normalised and embedded once. Surrogates that only
+    rearrange embedded points (block, circular, pairing) reuse these
+    embeddings; shuffled surrogates are re-embedded. The surrogates run in a
+    pool of worker processes with the recurrence matrix never stored.
+
+    Parameters:
+        data (pd.DataFrame): Data as passed to perform_rqa (auto) or perform_crqa (cross).
+        params (dict): Dictionary of RQA parameters (see perform_rqa). With
+            params['targetREC'], the radius is solved on the data and kept fixed
+            for the surrogates.
+        rqa_mode (str): "auto" or "cross".
+        method (str): Surrogate type:
+            "shuffle": random permutation of the samples (auto) or of the
+                second series (cross);
+            "block": random order of blocks of `block` embedded points
+                (of the second series for cross);
+            "circular": circular shift of the embedded points of the second
+                series by a random offset (cross only);
+            "pairing": cross-pairing with other recordings; each partner in
+                `partners` gives the pairs (x, partner y) and (partner x, y),
+                cut to the shorter length (cross only, n_surrogates is ignored).
+        n_surrogates (int): Number of surrogates.
+        block (int): Block length in embedded points (defaults to a tenth of them).
+        partners (list): Two-column pd.DataFrame objects of other recordings ("pairing").
+        alternative (str): "greater" (data above the surrogates), "less" or "two-sided".
+        seed (int): Seed of the random generator.
+        n_workers (int): Maximum number of worker processes (None uses all
+            available cores, 1 runs in the calling process).
+        n_threads (int): Number of C++ engine threads per worker.
+
+    Returns:
+        dict: RQA results of the data.
+        pd.DataFrame: Null distribution; one row per surrogate (surrogate,
+            err_code, error and the RQA measures). Surrogates without
+            recurrences have err_code 1 and NaN measures.
+        pd.Series: p-value of every measure in SURROGATE_METRICS, from the
+            surrogates without errors (rank-based, (1 + #extreme) / (1 + n)).
+    """
+    if rqa_mode not in ("auto", "cross"):
+        raise ValueError("rqa_mode must be 'auto' or 'cross'.")
+    if rqa_mode == "cross" and data.shape[1] != 2:
+        raise ValueError("Expected a DataFrame with exactly two columns for CRQA.")
+    if method in ("circular", "pairing") and rqa_mode != "cross":
+        raise ValueError(f"'{method}' surrogates need rqa_mode='cross'.")
+    if method == "pairing" and not partners:
+        raise ValueError("'pairing' surrogates need a list of partner recordings.")
+    if method not in ("shuffle", "block", "circular", "pairing"):
+        raise ValueError(f"Unknown surrogate method '{method}'; use 'shuffle', 'block', 'circular' or 'pairing'.")
+    if alternative not in ("greater", "less", "two-sided"):
+        raise ValueError("alternative must be 'greater', 'less' or 'two-sided'.")
+
+    # Estimate eDim / tLag set to 'auto'
+    params = embedding_utils.resolve_embedding(data, params)
+
+    # Categorical codes are compared as they are; continuous series are normalised
+    def normalized(values):
+        return values if params.get('categorical') else cleaning_utils.normalize_data(values, params['norm'])
+
+    rng = np.random.default_rng(seed)
+    if rqa_mode == "auto":
+        values = data.iloc[:, 0].values if params.get('categorical') else np.asarray(normalized(data), dtype=float)
+        a = b = surrogate_points(values, values, params)[0]
+    else:
+        x = normalized(data.iloc[:, 0].values)
+        y = normalized(data.iloc[:, 1].values)
+        a, b = surrogate_points(x, y, params)
+
+    # Fixed recurrence rate: solve for the radius on the data only
+    radius = params.get('radius')
+    if params.get('targetREC') is not None:
+        if params.get('categorical'):
+            raise ValueError("targetREC is not supported for categorical RQA.")
+        radius = rqa_utils_cpp.rqa_radius_for_rec_stream(
+            a, b, dim=1, lag=1, rescale=params['rescaleNorm'], target_rec=params['targetREC'],
+            diag_ignore=params['tw'], rqa_mode=rqa_mode, n_threads=n_threads,
+            norm=params.get('distNorm', 'euclidean')
+        )
+
+    observed = rqa_surrogate_job((None, a, b, rqa_mode, params, radius, n_threads))
+    if observed['err_code'] != 0:
+        raise RuntimeError(f"RQA of the data failed: {observed['error']}")
+    rs = {k: v for k, v in observed.items() if k not in ('surrogate', 'err_code', 'error')}
+
+    # Surrogate point sets
+    n2 = len(b)
+    pairs = []
+    if method == "shuffle":
+        for _ in range(n_surrogates):
+            if rqa_mode == "auto":
+                shuffled = values[rng.permutation(len(values))]
+                pts = surrogate_points(shuffled, shuffled, params)[0]
+                pairs.append((pts, pts))
+            else:
+                pairs.append(surrogate_points(x, y[rng.permutation(len(y))], params))
+    elif method == "block":
+        block = block or max(1, n2 // 10)
+        starts = np.arange(0, n2, block)
+        for _ in range(n_surrogates):
+            order = np.concatenate([np.arange(s, min(s + block, n2)) for s in rng.permutation(starts)])
+            pairs.append((b[order], b[order]) if rqa_mode == "auto" else (a, b[order]))
+    elif method == "circular":
+        for shift in rng.integers(1, max(n2, 2), size=n_surrogates):
+            pairs.append((a, np.roll(b, shift, axis=0)))
+    else:
+        for partner in partners:
+            px = normalized(partner.iloc[:, 0].values)
+            py = normalized(partner.iloc[:, 1].values)
+            if params.get('categorical'):
+                # Category indices are only comparable within one pair
+                for u, v in ((x, py), (px, y)):
+                    n = min(len(u), len(v))
+                    pairs.append(surrogate_points(u[:n], v[:n], params))
+                continue
+            pa, pb = surrogate_points(px, py, params)
+            for u, v in ((a, pb), (pa, b)):
+                n = min(len(u), len(v))
+                pairs.append((u[:n], v[:n]))
+
+    jobs = [(k, u, v, rqa_mode, params, radius, n_threads) for k, (u, v) in enumerate(pairs)]
+    if n_workers == 1 or len(jobs) <= 1:
+        rows = [rqa_surrogate_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            rows = list(pool.map(rqa_surrogate_job, jobs, chunksize=max(1, len(jobs) // 64)))
+    null = pd.DataFrame(rows, columns=['surrogate', 'err_code', 'error'] + list(rs))
+
+    return rs, null, surrogate_p_values(rs, null, alternative)
+
+def surrogate_points(dataX1, dataX2, params):
+    """
+    Embedded points (or categorical indices, with params['categorical']) of
+    two normalised series, in the form taken by rqa_surrogate_job.
+
+    Returns:
+        np.ndarray: Points of dataX1 ((n2, channels * eDim) float32, or int32 indices).
+        np.ndarray: Points of dataX2.
+    """
+    if params.get('categorical'):
+        return category_indices(dataX1, dataX2, params['eDim'], params['tLag'])
+    pts1 = mdrqa_utils.embed_channels(dataX1, params['eDim'], params['tLag'])
+    pts2 = pts1 if dataX2 is dataX1 else mdrqa_utils.embed_channels(dataX2, params['eDim'], params['tLag'])
+    return pts1, pts2
+
+def rqa_surrogate_job(job):
+    """
+    Worker of rqa_surrogates: RQA measures of one pair of embedded point sets.
+
+    Returns:
+        dict: surrogate, err_code, error and the rs measures.
+    """
+    k, a, b, rqa_mode, params, radius, n_threads = job
+    args = dict(rescale=params['rescaleNorm'], rad=radius, diag_ignore=params['tw'], minl=params['minl'],
+                return_matrices=False)
+    try:
+        if params.get('categorical'):
+            rs = rqa_utils_cpp.rqa_stats_categorical(a, b, rqa_mode=rqa_mode, **args)[1]
+        elif rqa_mode == "auto":
+            rs = rqa_utils_cpp.rqa_stats_stream_sym(a, dim=1, lag=1, n_threads=n_threads,
+                                                    norm=params.get('distNorm', 'euclidean'), **args)[1]
+        else:
+            rs = rqa_utils_cpp.rqa_stats_stream(a, b, dim=1, lag=1, rqa_mode="cross", n_threads=n_threads,
+                                                norm=params.get('distNorm', 'euclidean'), **args)[1]
+    except (RuntimeError, ValueError) as e:
+        return {'surrogate': k, 'err_code': 1, 'error': str(e)}
+    return {'surrogate': k, 'err_code': 0, 'error': None, **rs}
+
+def surrogate_p_values(rs, null, alternative="two-sided"):
+    """
+    Rank-based p-values of the measures in rs against a null distribution.
+
+    Parameters:
+        rs (dict): RQA results of the data.
+        null (pd.DataFrame): Surrogate results (rows with err_code != 0 are left out).
+        alternative (str): "greater", "less" or "two-sided".
+
+    Returns:
+        pd.Series: p-value per measure in SURROGATE_METRICS.
+    """
+    valid = null[null['err_code'] == 0]
+    n = len(valid)
+    p_values = {}
+    for key in SURROGATE_METRICS:
+        values = valid[key].to_numpy(dtype=float)
+        greater = (1 + np.sum(values >= float(rs[key]))) / (n + 1)
+        less = (1 + np.sum(values <= float(rs[key]))) / (n + 1)
+        if alternative == "greater":
+            p_values[key] = greater
+        elif alternative == "less":
+            p_values[key] = less
+        else:
+            p_values[key] = min(1.0, 2 * min(greater, less))
+    return pd.Series(p_values, name='p_value')
+
+def category_indices(dataX1, dataX2, dim, lag):
+    """
+    Map two categorical series to shared integer category indices, one per embedded point.
+
+    With dim > 1 each embedded point (a tuple of dim categories) becomes one
+    index, so two points recur exactly when all their categories match.
+
+    Parameters:
+        dataX1 (array-like): First series of category codes (numbers or labels).
+        dataX2 (array-like): Second series of category codes, same length as dataX1.
+        dim (int): Embedding dimension.
+        lag (int): Time lag.
+
+    Returns:
+        np.ndarray: int32 indices of the embedded points of dataX1.
+        np.ndarray: int32 indices of the embedded points of dataX2.
+    """
+    a = np.asarray(dataX1).ravel()
+    b = np.asarray(dataX2).ravel()
+    # Numeric codes are compared as the float32 values the C++ engine sees
+    if np.issubdtype(a.dtype, np.number) and np.issubdtype(b.dtype, np.number):
+        a = a.astype(np.float32)
+        b = b.astype(np.float32)
+    if len(a) != len(b):
+        raise ValueError("Both categorical series must have the same length.")
+    n2 = len(a) - (dim - 1) * lag
+    if n2 <= 0:
+        raise ValueError("Not enough data for these embedding parameters.")
+    if pd.isna(a).any() or pd.isna(b).any():
+        raise ValueError("Categorical series contain missing values.")
+
+    _, codes = np.unique(np.concatenate([a, b]), return_inverse=True)
+    codes = codes.reshape(2, -1)
+    if dim > 1:
+        words = np.stack([codes[:, k * lag:k * lag + n2] for k in range(dim)], axis=-1).reshape(2 * n2, dim)
+        _, codes = np.unique(words, axis=0, return_inverse=True)
+        codes = codes.reshape(2, n2)
+    return codes[0].astype(np.int32), codes[1].astype(np.int32)
 
 def plot_rqa_results(
     dataX=None, dataY=None, td=None,
@@ -153,7 +885,12 @@ def plot_rqa_results(
     ax_rp = fig.add_subplot(gs[1, 1])
     ax_rp.set_facecolor('#b0c4de')  # Light Steel Blue, a lighter navy shade
 
-    recur_y, recur_x = np.where(td == 1)
+    # td may be an int8 matrix, a bit-packed BitMatrix / TriBitMatrix or a sparse CSR matrix
+    if sparse.issparse(td):
+        coo = td.tocoo()
+        recur_y, recur_x = coo.row, coo.col
+    else:
+        recur_y, recur_x = np.nonzero(np.asarray(td))
     ax_rp.scatter(recur_x, recur_y, c='blue', s=point_size, edgecolors='none')
     ax_rp.set_xlim([0, N])
     ax_rp.set_ylim([0, N])
@@ -1,13 +1,18 @@
+import sys
 from setuptools import setup, Extension
 import pybind11
 
+# The RQA engine uses std::thread; MSVC links threads by default
+THREAD_ARGS = [] if sys.platform == "win32" else ["-pthread"]
+
 ext_modules = [
     Extension(
         "rqa_utils_cpp",
         ["rqa_utils.cpp"],
         include_dirs=[pybind11.get_include()],
         language="c++",
-        extra_compile_args=["-std=c++14"]  # or "-std=c++17"
+        extra_compile_args=["-std=c++14"] + THREAD_ARGS,  # or "-std=c++17"
+        extra_link_args=THREAD_ARGS
     )
 ]
 